@@ -3,14 +3,15 @@ SkillCode GPT - Educational AI Chatbot
 Main Flask Application
 """
 
-from flask import Flask, render_template, request, session, redirect, jsonify
+from flask import Flask, render_template, request, session, redirect, jsonify, Response, stream_with_context
 from flask_session import Session
 from functools import wraps
 import os
+import json
 from datetime import datetime, timedelta
 import secrets
 from src.database import Database
-from src.grok_service import GrokService
+from src.grok_service import GrokService, ERROR_RESPONSE_MARKERS
 from src.book_scheduler import start_book_scheduler
 from src import config
 import logging
@@ -56,16 +57,48 @@ def get_db():
             return None
     return db
 
+def get_grok():
+    global grok
+    if grok is None:
+        # Query embeddings power the optional near-duplicate tier of the response cache
+        _db = get_db()
+        grok = GrokService(embeddings=_db.vector_db.embedding_function if _db else None)
+        logger.info("Grok service initialized successfully")
+    return grok
+
+def warm_up():
+    """
+    Load the database, embedding model, vector index and Grok client now. Under gunicorn
+    --preload this runs once in the master so forked workers share them copy-on-write.
+    Only weights are loaded; no inference runs before the fork.
+    """
+    _db = get_db()
+    if _db:
+        _db.vector_db.ensure_loaded()
+        _db.vector_db.embeddings
+    get_grok()
+
+def start_background_services():
+    """Start the book auto-upload scheduler in this process"""
+    _db = get_db()
+    if _db:
+        start_book_scheduler(_db)
+
+def after_fork():
+    """Per-worker reset of what must not be shared with the master (LLM gateway loop and sockets)"""
+    if grok is not None:
+        grok.reset_session()
+
 # Start book auto-upload scheduler (once)
-with app.app_context():
-    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-        try:
-            _db = get_db()
-            if _db:
-                start_book_scheduler(_db)
-            grok = get_grok()
-        except Exception as e:
-            logger.warning(f"Startup task failed: {e}")
+# gunicorn.conf.py manages startup itself: warm-up in the master, scheduler in one worker
+if os.environ.get('SKILLCODE_MANAGED_STARTUP') != '1':
+    with app.app_context():
+        if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            try:
+                start_background_services()
+                grok = get_grok()
+            except Exception as e:
+                logger.warning(f"Startup task failed: {e}")
 
 @app.context_processor
 def inject_user():
@@ -230,6 +263,33 @@ def mind_mapper():
 
 # === API ENDPOINTS ===
 
+def _prepare_chat(message, assistant_type, custom_params):
+    """Gather history, retrieved book chunks and library titles for a chat message"""
+    # Get recent chat history for this user (fetch early for context)
+    chat_history = get_db().get_conversations(user_id=session['user_id'], assistant_type=assistant_type, limit=config.CONVERSATION_LIMIT)
+    # Reverse to get chronological order (oldest first)
+    chat_history.reverse()
+
+    # Contextual Search: If the message is short or a follow-up, use previous context for search
+    search_query = message
+    follow_up_phrases = ['ابحث اكتر', 'زيدني', 'اكمل', 'توسع', 'تفاصيل اكثر', 'more', 'continue', 'tell me more', 'expand', 'details']
+    if any(p in message.lower() for p in follow_up_phrases) or len(message.split()) <= 2:
+        if chat_history:
+            last_msg = chat_history[-1]['user_message']
+            # Prepend previous message to current search to keep context in DB search
+            search_query = f"{last_msg} {message}"
+            logger.info(f"Contextual follow-up search: '{search_query}'")
+
+    # Get relevant books from database
+    subject_filter = custom_params.get('subject')
+    books_context = get_db().search_relevant_books(search_query, limit=config.MAX_BOOKS_PER_SEARCH, subject_filter=subject_filter)
+    logger.info(f"Found {len(books_context)} relevant books")
+    
+    # Library titles for context, pre-rendered once by the book catalog cache
+    library_preamble = get_db().get_library_preamble()
+
+    return chat_history, books_context, library_preamble
+
 @app.route('/api/chat', methods=['POST'])
 @login_required
 def chat():
@@ -245,29 +305,7 @@ def chat():
         
         logger.info(f"Chat request - User: {session['user_id']}, Type: {assistant_type}, Message: {message[:50]}")
         
-        # Get recent chat history for this user (fetch early for context)
-        chat_history = get_db().get_conversations(user_id=session['user_id'], assistant_type=assistant_type, limit=config.CONVERSATION_LIMIT)
-        # Reverse to get chronological order (oldest first)
-        chat_history.reverse()
-
-        # Contextual Search: If the message is short or a follow-up, use previous context for search
-        search_query = message
-        follow_up_phrases = ['ابحث اكتر', 'زيدني', 'اكمل', 'توسع', 'تفاصيل اكثر', 'more', 'continue', 'tell me more', 'expand', 'details']
-        if any(p in message.lower() for p in follow_up_phrases) or len(message.split()) <= 2:
-            if chat_history:
-                last_msg = chat_history[-1]['user_message']
-                # Prepend previous message to current search to keep context in DB search
-                search_query = f"{last_msg} {message}"
-                logger.info(f"Contextual follow-up search: '{search_query}'")
-
-        # Get relevant books from database
-        subject_filter = custom_params.get('subject')
-        books_context = get_db().search_relevant_books(search_query, limit=config.MAX_BOOKS_PER_SEARCH, subject_filter=subject_filter)
-        logger.info(f"Found {len(books_context)} relevant books")
-        
-        # Get list of all available books (titles only) for context
-        all_books = get_db().get_all_books()
-        available_books_titles = [b['title'] for b in all_books]
+        chat_history, books_context, library_preamble = _prepare_chat(message, assistant_type, custom_params)
         
         # Get response from Grok API
         response = get_grok().get_response(
@@ -275,8 +313,9 @@ def chat():
             assistant_type=assistant_type,
             books_context=books_context,
             custom_params=custom_params,
-            available_books_titles=available_books_titles,
-            chat_history=chat_history
+            library_preamble=library_preamble,
+            chat_history=chat_history,
+            user_id=session['user_id']
         )
         
         logger.info(f"Got response from Grok: {response[:100]}")
@@ -299,6 +338,77 @@ def chat():
         logger.error(f"Chat error: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def _sse(payload, event=None):
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/chat/stream', methods=['POST'])
+@login_required
+def chat_stream():
+    """Same as /api/chat but relays the answer as Server-Sent Events while it is generated"""
+    try:
+        data = request.get_json()
+        message = data.get('message', '').strip()
+        assistant_type = data.get('assistant_type', 'general')
+        custom_params = data.get('params', {})
+        
+        if not message:
+            return jsonify({'error': 'Empty message'}), 400
+        
+        user_id = session['user_id']
+        logger.info(f"Chat stream request - User: {user_id}, Type: {assistant_type}, Message: {message[:50]}")
+        
+        chat_history, books_context, library_preamble = _prepare_chat(message, assistant_type, custom_params)
+        sources = [b['title'] for b in books_context]
+        
+        deltas = get_grok().get_response(
+            message=message,
+            assistant_type=assistant_type,
+            books_context=books_context,
+            custom_params=custom_params,
+            library_preamble=library_preamble,
+            chat_history=chat_history,
+            stream=True,
+            user_id=user_id
+        )
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+    def generate():
+        parts = []
+        completed = False
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield _sse({'delta': delta})
+            completed = True
+            yield _sse({'success': True, 'sources': sources}, event='done')
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}", exc_info=True)
+            yield _sse({'error': str(e)}, event='error')
+        finally:
+            # Also runs when the client disconnects mid-stream; a truncated or failed answer
+            # is not saved, so it never feeds later history or the stats
+            response = "".join(parts)
+            if not completed or any(marker in response for marker in ERROR_RESPONSE_MARKERS):
+                if response:
+                    logger.info(f"Not saving {'failed' if completed else 'interrupted'} streamed answer for User {user_id}")
+            elif response:
+                get_db().save_conversation(
+                    user_id=user_id,
+                    assistant_type=assistant_type,
+                    user_message=message,
+                    ai_response=response
+                )
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/generate-exam', methods=['POST'])
 @login_required
 def generate_exam():
@@ -368,28 +478,85 @@ def get_books():
         logger.error(f"Get books error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ingest-status', methods=['GET'])
+@login_required
+def ingest_status():
+    """Which process is ingesting books, its progress and the last runs"""
+    try:
+        return jsonify({
+            'success': True,
+            'status': get_db().get_ingest_status()
+        })
+    except Exception as e:
+        logger.error(f"Ingest status error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/llm-status', methods=['GET'])
+@login_required
+def llm_status():
+    """This worker's LLM gateway queue depth and in-flight calls, plus response cache stats"""
+    try:
+        return jsonify({
+            'success': True,
+            'gateway': get_grok().gateway_stats(),
+            'cache': get_grok().cache_stats()
+        })
+    except Exception as e:
+        logger.error(f"LLM status error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/conversation-history', methods=['GET'])
 @login_required
 def conversation_history():
-    """Get user's conversation history"""
+    """
+    Get user's conversation history, newest first.
+    ?cursor=<next_cursor> continues from the previous page; ?fields=summary returns short previews.
+    """
     try:
         assistant_type = request.args.get('type', 'all')
-        limit = request.args.get('limit', 100, type=int)
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        cursor = request.args.get('cursor') or None
+        fields = 'summary' if request.args.get('fields') == 'summary' else 'full'
         
-        conversations = get_db().get_conversations(
-            user_id=session['user_id'],
-            assistant_type=assistant_type,
-            limit=limit
-        )
+        try:
+            conversations = get_db().get_conversations(
+                user_id=session['user_id'],
+                assistant_type=assistant_type,
+                limit=limit,
+                cursor=cursor,
+                fields=fields
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # A full page means there may be more; the client passes this back as ?cursor=
+        next_cursor = get_db().encode_history_cursor(conversations[-1]) if len(conversations) == limit else None
         
         return jsonify({
             'success': True,
-            'conversations': conversations
+            'conversations': conversations,
+            'next_cursor': next_cursor
         })
     except Exception as e:
         logger.error(f"History error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/conversation/<int:conversation_id>', methods=['GET'])
+@login_required
+def get_conversation(conversation_id):
+    """Get one full conversation (used when opening a sidebar history item)"""
+    try:
+        conversation = get_db().get_conversation(session['user_id'], conversation_id)
+        if not conversation:
+            return jsonify({'error': 'Conversation not found'}), 404
+        return jsonify({
+            'success': True,
+            'conversation': conversation
+        })
+    except Exception as e:
+        logger.error(f"Conversation fetch error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 # === ERROR HANDLERS ===
 
 @app.errorhandler(404)
@@ -0,0 +1,126 @@
+"""
+Measure end-to-end chat throughput and tail latency.
+
+Simulated students send questions through GrokService (prompt assembly, LLM gateway,
+HTTP client) concurrently, optionally with vector store retrieval in front, exactly as
+/api/chat does minus the session and saving the conversation. With LLM_BACKEND=fake
+(the default here) no network or API key is needed; the fake server's latency is shaped
+by the FAKE_LLM_* settings.
+
+Usage:
+    python benchmark_chat.py                              # 200 requests, 32 concurrent, fake backend
+    python benchmark_chat.py --requests 1000 --concurrency 64 --stream
+    python benchmark_chat.py --retrieval                  # search the vector store first
+    python benchmark_chat.py --backend groq --requests 20 # against the real API (uses quota)
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger("ChatBenchmark")
+logger.setLevel(logging.INFO)
+
+# Questions cycled through when no --queries-file is given
+SAMPLE_QUESTIONS = [
+    "ما هو المبتدأ والخبر؟ اشرح مع أمثلة",
+    "اشرح كان وأخواتها",
+    "What is photosynthesis and why is it important?",
+    "Explain Newton's second law with an example",
+    "ما الفرق بين الفعل الماضي والفعل المضارع؟",
+    "How do I solve a quadratic equation?",
+]
+
+def load_questions(queries_file):
+    if not queries_file:
+        return SAMPLE_QUESTIONS
+    with open(queries_file, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat throughput and latency")
+    parser.add_argument('--backend', default=os.environ.get("LLM_BACKEND", "fake"),
+                        help="groq, openai, local or fake (default: fake, or LLM_BACKEND)")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32, help="simulated students sending at once")
+    parser.add_argument('--stream', action='store_true', help="stream answers and report time to first token")
+    parser.add_argument('--retrieval', action='store_true', help="search the vector store before each call")
+    parser.add_argument('--queries-file', help="text file with one question per line")
+    args = parser.parse_args()
+
+    # Set before the app modules read config
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    from src.grok_service import GrokService, ERROR_RESPONSE_MARKERS
+
+    db = None
+    if args.retrieval:
+        from src.database import Database
+        db = Database()
+        db.vector_db.ensure_loaded()
+    grok = GrokService()
+    library_preamble = db.get_library_preamble() if db else None
+    questions = load_questions(args.queries_file)
+
+    latencies, first_tokens, failures = [], [], [0]
+    lock = threading.Lock()
+
+    def one_chat(i):
+        question = questions[i % len(questions)]
+        started = time.perf_counter()
+        books_context = db.search_relevant_books(question, limit=3) if db else []
+        result = grok.get_response(
+            message=question,
+            books_context=books_context,
+            library_preamble=library_preamble,
+            stream=args.stream,
+            user_id=i % max(args.concurrency, 1)
+        )
+        first = None
+        if args.stream:
+            parts = []
+            for delta in result:
+                if first is None:
+                    first = time.perf_counter() - started
+                parts.append(delta)
+            result = "".join(parts)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if first is not None:
+                first_tokens.append(first)
+            if any(marker in result for marker in ERROR_RESPONSE_MARKERS):
+                failures[0] += 1
+
+    logger.info(f"Backend: {grok.backend.describe()}, {args.requests} requests, {args.concurrency} concurrent"
+                f"{', streaming' if args.stream else ''}{', with retrieval' if args.retrieval else ''}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(one_chat, range(args.requests)))
+    wall = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000
+    logger.info(f"Throughput: {len(latencies) / wall:.1f} chats/sec over {wall:.1f}s, {failures[0]} failed")
+    logger.info(f"Latency: p50={np.percentile(ms, 50):.0f}ms  p95={np.percentile(ms, 95):.0f}ms  "
+                f"p99={np.percentile(ms, 99):.0f}ms  max={ms.max():.0f}ms")
+    if first_tokens:
+        ttft = np.asarray(first_tokens) * 1000
+        logger.info(f"First token: p50={np.percentile(ttft, 50):.0f}ms  p95={np.percentile(ttft, 95):.0f}ms  "
+                    f"p99={np.percentile(ttft, 99):.0f}ms")
+    stats = grok.gateway_stats()
+    logger.info(f"Gateway: peak {stats['peak_in_flight']} in flight, peak {stats['peak_waiting']} waiting, "
+                f"avg wait {stats['avg_wait_ms']}ms, {stats['retries']} retries, {stats['rejected']} rejected, "
+                f"{stats['connections_opened']} connections for {stats['upstream_requests']} upstream requests")
+    logger.info(f"Resilience: {stats['rate_limited_calls']} calls rate limited "
+                f"({stats['rate_limit_wait_seconds']}s waiting), breaker {stats['breaker_state']}, "
+                f"opened {stats['breaker_opened']} times")
+    grok.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Train / rebuild the vector index as flat, hnsw or ivfpq and report recall@k vs latency.
+
+Every candidate is measured against exact (flat) search over the same vectors before it
+replaces the live index. A rebuild holds the vector store lease, so it refuses to start
+while an ingestion run is writing (and the nightly run skips while a rebuild is going).
+
+Usage:
+    python build_vector_index.py                        # rebuild as VECTOR_INDEX_TYPE
+    python build_vector_index.py --type hnsw            # rebuild as HNSW
+    python build_vector_index.py --type ivfpq --dry-run # benchmark only, keep the current index
+    python build_vector_index.py --queries-file q.txt   # real questions, one per line
+    python build_vector_index.py --reembed              # re-embed chunk text instead of reading vectors back
+"""
+
+import argparse
+import logging
+import time
+
+import faiss
+import numpy as np
+
+from src import config
+from src.database_sqlite import Database as SQLiteDB
+from src.leader import LeaderLease
+from src.vector_db import INDEX_TYPES, VectorDB
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("VectorIndex")
+
+# Search-time settings swept in the report
+HNSW_EF_SWEEP = (16, 32, 64, 128, 256)
+IVF_NPROBE_SWEEP = (1, 4, 8, 16, 32, 64)
+
+def load_queries(vdb, vectors, queries_file, samples):
+    if queries_file:
+        with open(queries_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+        logger.info(f"Embedding {len(texts)} queries from {queries_file}")
+        return np.asarray([vdb.embeddings.embed_query(t) for t in texts], dtype='float32')
+    # Stored chunks stand in for questions when no query log is given
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(vectors), size=min(samples, len(vectors)), replace=False)
+    return vectors[picks]
+
+def run_queries(index, queries, k, params):
+    """Top-k IDs per query and per-query latencies in ms (one query at a time, like the app)"""
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(ids[0])
+    return np.asarray(found), np.asarray(latencies)
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(f[:k].tolist()) & set(t[:k].tolist())) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+def report_row(label, found, truth, latencies, ks):
+    recalls = "  ".join(f"R@{k}={recall_at_k(found, truth, k):.3f}" for k in ks)
+    logger.info(f"{label:<22} {recalls}  avg={latencies.mean():.2f}ms  p95={np.percentile(latencies, 95):.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector index and report recall vs latency")
+    parser.add_argument('--type', choices=INDEX_TYPES, default=config.VECTOR_INDEX_TYPE)
+    parser.add_argument('--k', type=int, default=10, help="largest k for recall@k")
+    parser.add_argument('--samples', type=int, default=200, help="stored chunks used as queries without --queries-file")
+    parser.add_argument('--queries-file', help="text file with one query per line")
+    parser.add_argument('--reembed', action='store_true', help="re-embed chunk text (use when leaving ivfpq)")
+    parser.add_argument('--dry-run', action='store_true', help="benchmark only; do not replace the live index")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        rebuild(args)
+        return
+    lease = LeaderLease(SQLiteDB())
+    if not lease.acquire():
+        holder = lease.holder() or {}
+        logger.error(f"The vector store is being written by {holder.get('owner', 'another process')}; try again later")
+        return
+    with lease:
+        rebuild(args, lease)
+
+def rebuild(args, lease=None):
+    # Loaded after the lease is taken, so this is the latest committed generation
+    vdb = VectorDB()
+    vdb.ensure_loaded()
+    if vdb.vector_store is None:
+        logger.error("No vector store to rebuild")
+        return
+
+    labels, vectors = vdb.export_vectors(reembed=args.reembed)
+    logger.info(f"Current index: {vdb.index_type()}, {len(labels)} live chunks, dim {vectors.shape[1]}")
+
+    started = time.time()
+    index = vdb.build_index(args.type, labels, vectors)
+    logger.info(f"Built {args.type} index in {time.time() - started:.1f}s")
+
+    # Exact ground truth over the same vectors
+    flat = vdb.build_index('flat', labels, vectors)
+    queries = load_queries(vdb, vectors, args.queries_file, args.samples)
+    ks = sorted({1, min(5, args.k), args.k})
+    truth, flat_latencies = run_queries(flat, queries, args.k, None)
+
+    logger.info(f"Recall vs exact search over {len(queries)} queries:")
+    report_row("flat (exact)", truth, truth, flat_latencies, ks)
+    inner = faiss.downcast_index(index.index)
+    if args.type == 'hnsw':
+        for ef in HNSW_EF_SWEEP:
+            found, latencies = run_queries(index, queries, args.k, faiss.SearchParametersHNSW(efSearch=ef))
+            marker = " *" if ef == config.HNSW_EF_SEARCH else ""
+            report_row(f"hnsw efSearch={ef}{marker}", found, truth, latencies, ks)
+    elif args.type == 'ivfpq':
+        for nprobe in IVF_NPROBE_SWEEP:
+            if nprobe > inner.nlist:
+                break
+            found, latencies = run_queries(index, queries, args.k, faiss.SearchParametersIVF(nprobe=nprobe))
+            marker = " *" if nprobe == config.IVF_NPROBE else ""
+            report_row(f"ivfpq nprobe={nprobe}{marker}", found, truth, latencies, ks)
+    logger.info("* = current config (HNSW_EF_SEARCH / IVF_NPROBE)")
+
+    if args.dry_run:
+        logger.info("Dry run: live index left unchanged")
+        return
+    lease.check()
+    vdb.swap_index(index)
+    logger.info(f"✅ Vector store rebuilt as {args.type}")
+
+if __name__ == "__main__":
+    main()
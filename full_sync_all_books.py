@@ -1,57 +1,29 @@
-
-import os
 import sys
 import logging
 from src.database import Database
-from src.OCRProcessor import OCRProcessor # Wait, it's OCRProcessor in src.ocr_utils
-from src.ocr_utils import OCRProcessor as ActualOCRProcessor
+from src.ingestion import run_ingestion
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("FullSync")
 
 BOOKS_DIR = r"D:\Work\books"
 
-def full_sync():
+def full_sync(books_dir=BOOKS_DIR, workers=None):
     db = Database()
-    ocr = ActualOCRProcessor()
-    
-    logger.info(f"Starting FULL SYNC from {BOOKS_DIR}...")
     
-    indexed_count = 0
-    skipped_count = 0
+    logger.info(f"Starting FULL SYNC from {books_dir}...")
     
-    for root, dirs, files in os.walk(BOOKS_DIR):
-        for f in files:
-            if f.endswith('.pdf'):
-                file_path = os.path.join(root, f)
-                
-                # Check if already in SQLite library
-                # (Assuming we want to skip if title exists in SQLite)
-                # But here we want to make sure it's in Vector Store too.
-                # A better way is to check the Vector Store specifically, 
-                # but adding to FAISS is idempotent-ish if we don't mind duplicates 
-                # or we check metadata.
-                
-                logger.info(f"Processing: {f}")
-                
-                try:
-                    text = ocr.process_pdf(file_path)
-                    if text and text.strip():
-                        # add_book in database.py handles both SQLite and Vector
-                        # It uses "INSERT OR IGNORE" in SQLite
-                        success = db.add_book(f, file_path, text)
-                        if success:
-                            indexed_count += 1
-                            logger.info(f"✅ Indexed: {f}")
-                        else:
-                            skipped_count += 1
-                            logger.info(f"⏭️ Skipped (Already indexed?): {f}")
-                    else:
-                        logger.warning(f"No text extracted from {f}")
-                except Exception as e:
-                    logger.error(f"Error indexing {f}: {e}")
+    # Pages are OCR'd in parallel worker processes and checkpointed in SQLite,
+    # so re-running after a crash resumes where the last run stopped.
+    stats = run_ingestion(db, books_dir, trigger='full_sync', workers=workers)
+    if stats is None:
+        logger.error("Another process is writing the vector store; try again when it finishes.")
+        return
     
-    logger.info(f"Full Sync Completed! Indexed {indexed_count}, Skipped {skipped_count}.")
+    logger.info(f"Full Sync Completed! Indexed {stats['indexed']}, Skipped {stats['skipped']}, Failed {stats['failed']}.")
 
 if __name__ == "__main__":
-    full_sync()
+    # Usage: python full_sync_all_books.py [books_dir] [workers]
+    books_dir = sys.argv[1] if len(sys.argv) > 1 else BOOKS_DIR
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    full_sync(books_dir, workers)
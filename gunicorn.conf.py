@@ -0,0 +1,65 @@
+"""
+Gunicorn settings for SkillCode GPT (picked up automatically by `gunicorn app:app`)
+
+Preload-and-fork: the app is imported and warmed up once in the master (database, embedding
+model, vector index, Grok client), then workers are forked and share that memory copy-on-write.
+The book scheduler runs in exactly one worker; if that worker exits, the next one spawned takes over.
+
+Workers are threaded (gthread) and the Flask views stay synchronous: a chat thread blocks
+while its completion runs on the worker's LLM gateway event loop, so one worker serves
+GUNICORN_THREADS students at once instead of one. The gateway's LLM_MAX_CONCURRENCY and
+LLM_MAX_QUEUE default to fractions of GUNICORN_THREADS, so busy replies start before every
+thread is tied up waiting on the upstream.
+
+Set GUNICORN_PRELOAD=false to load the app separately in every worker instead.
+"""
+
+import gc
+import os
+
+# Tell app.py that startup is managed here rather than at import
+os.environ["SKILLCODE_MANAGED_STARTUP"] = "1"
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+# Set through WEB_CONCURRENCY rather than -w: the LLM rate limits are split by the same count
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# The LLM gateway limits in src/config.py are derived from the same variable
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+# SSE answers stay open while the model generates
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+def when_ready(server):
+    """Master, after the preloaded import and before the first fork"""
+    if not preload_app:
+        return
+    import app
+    try:
+        app.warm_up()
+    except Exception as e:
+        server.log.warning(f"Warm-up failed, workers will load lazily: {e}")
+    # Keep the warmed-up objects out of the collector so it doesn't dirty shared pages
+    gc.freeze()
+    server.log.info("App preloaded; workers will share it copy-on-write")
+
+def pre_fork(server, worker):
+    """Master: designate one live worker to run the book scheduler"""
+    if getattr(server, "scheduler_worker", None) is None:
+        server.scheduler_worker = worker
+        worker.run_scheduler = True
+    else:
+        worker.run_scheduler = False
+
+def child_exit(server, worker):
+    """Master: hand the scheduler to the next worker if its owner exited"""
+    if getattr(server, "scheduler_worker", None) is worker:
+        server.scheduler_worker = None
+        server.log.info("Scheduler worker exited; the next worker spawned will take over")
+
+def post_fork(server, worker):
+    """Worker, right after the fork"""
+    import app
+    app.after_fork()
+    if worker.run_scheduler:
+        app.start_background_services()
+        server.log.info(f"Worker {worker.pid} runs the book scheduler")
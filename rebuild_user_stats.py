@@ -0,0 +1,54 @@
+"""
+Backfill or verify the materialized dashboard counters (user_stats).
+
+Usage:
+    python rebuild_user_stats.py                 # check only, report mismatches
+    python rebuild_user_stats.py --repair        # check, then rebuild if anything drifted
+    python rebuild_user_stats.py --backfill      # rebuild unconditionally
+    python rebuild_user_stats.py --backend mongo # sqlite (default), mongo or oracle
+"""
+
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("UserStats")
+
+def get_backend(name):
+    if name == 'mongo':
+        from src.database_mongo import Database
+    elif name == 'oracle':
+        from src.database_oracle import Database
+    else:
+        from src.database_sqlite import Database
+    return Database()
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill or verify per-user stats counters")
+    parser.add_argument('--backend', choices=['sqlite', 'mongo', 'oracle'], default='sqlite')
+    parser.add_argument('--backfill', action='store_true', help="rebuild counters from conversation history")
+    parser.add_argument('--repair', action='store_true', help="rebuild only if the check finds mismatches")
+    args = parser.parse_args()
+
+    db = get_backend(args.backend)
+
+    if args.backfill:
+        count = db.backfill_user_stats()
+        logger.info(f"Backfill complete: {count} users")
+        return
+
+    mismatches = db.check_user_stats()
+    if not mismatches:
+        logger.info("✅ user_stats is consistent with conversation history")
+        return
+
+    for m in mismatches[:50]:
+        logger.warning(f"User {m['user_id']}: expected {m['expected']}, stored {m['actual']}")
+    logger.warning(f"{len(mismatches)} users have drifted counters")
+
+    if args.repair:
+        count = db.backfill_user_stats()
+        logger.info(f"Repaired: rebuilt counters for {count} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+BM25 keyword index over the vector store's chunks
+
+Complements MiniLM (an English model) on Arabic queries like "المبتدأ والخبر": text is
+normalized with normalize_arabic and lightly stemmed, so "والخبر" and "الخبر" both match "خبر".
+
+Layout mirrors VectorDB: a base of postings arrays saved as .npy and memory-mapped on load,
+plus an in-memory delta for chunks added since (rebuilt from the vector store's segments),
+and a set of removed chunk IDs. compact() merges everything into a new base.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+from src.ocr_utils import normalize_arabic
+
+logger = logging.getLogger(__name__)
+
+# Longest first; stripped only when enough of the word is left
+ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+ARABIC_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+ENGLISH_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+STOPWORDS = {normalize_arabic(w) for w in (
+    'في', 'من', 'على', 'إلى', 'عن', 'ما', 'ماذا', 'هل', 'هو', 'هي', 'أن', 'إن', 'أو', 'ثم',
+    'هذا', 'هذه', 'ذلك', 'التي', 'الذي', 'كيف', 'لماذا', 'مع', 'كل', 'لا', 'و',
+    'the', 'a', 'an', 'of', 'to', 'in', 'is', 'are', 'was', 'what', 'how', 'why', 'and',
+    'or', 'for', 'on', 'with', 'be', 'this', 'that', 'it', 'as', 'at', 'by', 'do', 'does'
+)}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+TATWEEL = '\u0640'  # decorative stretching, common in OCR'd headings
+ARABIC_RE = re.compile(r'[؀-ۿ]')
+
+def stem(token):
+    """Light stemming: strip one common prefix and one common suffix"""
+    if ARABIC_RE.search(token):
+        if len(token) > 3 and token.startswith('و') and not token.startswith('وال'):
+            token = token[1:]
+        for prefix in ARABIC_PREFIXES:
+            if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+                token = token[len(prefix):]
+                break
+        for suffix in ARABIC_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+                token = token[:-len(suffix)]
+                break
+        return token
+    for suffix in ENGLISH_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text):
+    tokens = TOKEN_RE.findall(normalize_arabic(text or '').replace(TATWEEL, '').lower())
+    # Single letters are mostly OCR fragments
+    return [stem(t) for t in tokens if len(t) > 1 and t not in STOPWORDS and not t.isdigit()]
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        # Base: term -> (start, count) into the postings arrays (chunk ID, term frequency, chunk length)
+        self.vocab = {}
+        self.post_ids = np.zeros(0, dtype='int64')
+        self.post_tf = np.zeros(0, dtype='float32')
+        self.post_dl = np.zeros(0, dtype='float32')
+        # Base chunk IDs (sorted) and lengths, to keep totals right on removal
+        self.doc_ids = np.zeros(0, dtype='int64')
+        self.doc_lens = np.zeros(0, dtype='float32')
+        # Delta: term -> [(chunk ID, tf, length)], chunk ID -> length
+        self.delta_postings = {}
+        self.delta_docs = {}
+        # Removed chunk IDs, masked at query time until the next compact()
+        self.deleted = set()
+        self.n_docs = 0
+        self.total_len = 0.0
+
+    # --- UPDATES ---
+
+    def add(self, labels, texts):
+        for label, text in zip(labels, texts):
+            tokens = tokenize(text)
+            dl = len(tokens)
+            label = int(label)
+            self.delta_docs[label] = dl
+            for term, tf in Counter(tokens).items():
+                self.delta_postings.setdefault(term, []).append((label, tf, dl))
+            self.n_docs += 1
+            self.total_len += dl
+
+    def remove(self, labels):
+        for label in labels:
+            label = int(label)
+            if label in self.deleted:
+                continue
+            if label in self.delta_docs:
+                dl = self.delta_docs.pop(label)
+            else:
+                pos = np.searchsorted(self.doc_ids, label)
+                if pos >= len(self.doc_ids) or self.doc_ids[pos] != label:
+                    continue
+                dl = float(self.doc_lens[pos])
+            self.deleted.add(label)
+            self.n_docs -= 1
+            self.total_len -= dl
+
+    # --- SEARCH ---
+
+    def search(self, query, k=10, allowed=None):
+        """Top-k (chunk ID, BM25 score), restricted to the allowed chunk IDs if given"""
+        terms = set(tokenize(query))
+        if not terms or self.n_docs <= 0:
+            return []
+        avgdl = self.total_len / self.n_docs or 1.0
+
+        id_parts, score_parts = [], []
+        for term in terms:
+            ids, tf, dl = self._postings(term)
+            if not len(ids):
+                continue
+            df = len(ids)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            id_parts.append(ids)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl)))
+        if not id_parts:
+            return []
+
+        ids = np.concatenate(id_parts)
+        scores = np.concatenate(score_parts)
+        mask = np.ones(len(ids), dtype=bool)
+        if self.deleted:
+            mask &= ~np.isin(ids, np.fromiter(self.deleted, dtype='int64'))
+        if allowed is not None:
+            mask &= np.isin(ids, np.asarray(allowed, dtype='int64'))
+        ids, scores = ids[mask], scores[mask]
+        if not len(ids):
+            return []
+
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        if len(totals) > k:
+            top = np.argpartition(-totals, k)[:k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top])]
+        return [(int(unique_ids[i]), float(totals[i])) for i in top]
+
+    def _postings(self, term):
+        base = self.vocab.get(term)
+        delta = self.delta_postings.get(term)
+        if base is None and not delta:
+            return np.zeros(0, dtype='int64'), np.zeros(0, dtype='float32'), np.zeros(0, dtype='float32')
+        ids, tf, dl = [], [], []
+        if base is not None:
+            start, count = base
+            ids.append(self.post_ids[start:start + count])
+            tf.append(self.post_tf[start:start + count])
+            dl.append(self.post_dl[start:start + count])
+        if delta:
+            rows = np.asarray(delta, dtype='float64')
+            ids.append(rows[:, 0].astype('int64'))
+            tf.append(rows[:, 1].astype('float32'))
+            dl.append(rows[:, 2].astype('float32'))
+        return np.concatenate(ids), np.concatenate(tf), np.concatenate(dl)
+
+    # --- PERSISTENCE ---
+
+    def compact(self):
+        """Merge base, delta and removals into a new in-memory base"""
+        deleted = np.fromiter(self.deleted, dtype='int64') if self.deleted else None
+        vocab, ids, tfs, dls = {}, [], [], []
+        position = 0
+        for term in sorted(set(self.vocab) | set(self.delta_postings)):
+            term_ids, term_tf, term_dl = self._postings(term)
+            if deleted is not None:
+                keep = ~np.isin(term_ids, deleted)
+                term_ids, term_tf, term_dl = term_ids[keep], term_tf[keep], term_dl[keep]
+            if not len(term_ids):
+                continue
+            vocab[term] = (position, len(term_ids))
+            position += len(term_ids)
+            ids.append(term_ids)
+            tfs.append(term_tf)
+            dls.append(term_dl)
+
+        doc_ids = np.concatenate([np.asarray(self.doc_ids), np.fromiter(self.delta_docs, dtype='int64')])
+        doc_lens = np.concatenate([np.asarray(self.doc_lens), np.fromiter(self.delta_docs.values(), dtype='float32')])
+        if deleted is not None:
+            keep = ~np.isin(doc_ids, deleted)
+            doc_ids, doc_lens = doc_ids[keep], doc_lens[keep]
+        order = np.argsort(doc_ids)
+
+        self.vocab = vocab
+        self.post_ids = np.concatenate(ids) if ids else np.zeros(0, dtype='int64')
+        self.post_tf = np.concatenate(tfs).astype('float32') if tfs else np.zeros(0, dtype='float32')
+        self.post_dl = np.concatenate(dls).astype('float32') if dls else np.zeros(0, dtype='float32')
+        self.doc_ids = doc_ids[order]
+        self.doc_lens = doc_lens[order].astype('float32')
+        self.delta_postings = {}
+        self.delta_docs = {}
+        self.deleted = set()
+        self.n_docs = len(self.doc_ids)
+        self.total_len = float(self.doc_lens.sum())
+
+    def save(self, path):
+        """Write the base (call compact() first) into directory path, replacing it atomically"""
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name in ('post_ids', 'post_tf', 'post_dl', 'doc_ids', 'doc_lens'):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(getattr(self, name)))
+        with open(os.path.join(tmp_path, "vocab.json"), 'w', encoding='utf-8') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'vocab': self.vocab}, f, ensure_ascii=False)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved base with the postings arrays memory-mapped"""
+        with open(os.path.join(path, "vocab.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(k1=meta['k1'], b=meta['b'])
+        index.vocab = {term: tuple(span) for term, span in meta['vocab'].items()}
+        for name in ('post_ids', 'post_tf', 'post_dl', 'doc_ids', 'doc_lens'):
+            setattr(index, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        index.n_docs = len(index.doc_ids)
+        index.total_len = float(np.sum(index.doc_lens))
+        return index
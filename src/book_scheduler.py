@@ -4,7 +4,6 @@ Daily Book Upload Scheduler
 
 from apscheduler.schedulers.background import BackgroundScheduler
 import os
-from PyPDF2 import PdfReader
 import logging
 from datetime import datetime
 
@@ -24,46 +23,14 @@ def upload_books(db):
             return
     
     try:
-        pdf_files = []
-        for root, dirs, files in os.walk(BOOKS_DIR):
-            for f in files:
-                if f.endswith('.pdf'):
-                    # Store relative path or just filename based on how you want to track it
-                    # The current logic uses filename as title
-                    pdf_files.append(os.path.join(root, f))
-        
-        if not pdf_files:
-            logger.info("No PDF files found to upload")
+        from src.ingestion import run_ingestion
+        # Every worker's scheduler fires; only the lease holder ingests
+        if run_ingestion(db, BOOKS_DIR, trigger='scheduled') is None:
             return
         
-        logger.info(f"Found {len(pdf_files)} PDF files to process (recursive)")
-        
-        from src.ocr_utils import OCRProcessor
-        ocr = OCRProcessor()
-        
-        for file_path in pdf_files:
-            filename = os.path.basename(file_path)
-            logger.info(f"Processing: {filename}...")
-            
-            try:
-                # Use OCR Processor (handles text and images)
-                full_text = ocr.process_pdf(file_path)
-                
-                if not full_text.strip():
-                    logger.warning(f"No text extracted from {filename}")
-                    continue
-                
-                # Add to database
-                success = db.add_book(filename, file_path, full_text)
-                
-                if success:
-                    logger.info(f"✅ Successfully uploaded: {filename}")
-                else:
-                    logger.info(f"⚠️ Book already exists: {filename}")
-            
-            except Exception as e:
-                logger.error(f"❌ Error processing {filename}: {e}")
-        
+        # Make sure chat picks up the new titles
+        if hasattr(db, 'invalidate_book_catalog'):
+            db.invalidate_book_catalog()
         logger.info("Book upload completed")
     
     except Exception as e:
@@ -20,6 +20,15 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD", "password")
 DB_DSN = os.environ.get("DB_DSN", "localhost:1521/xe")
 DB_CLIENT_DIR = os.environ.get("DB_CLIENT_DIR", r"C:\oraclexe\app\oracle\instantclient_23_0")
 
+# SQLite Configuration (users, conversations, library metadata)
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", 8))  # max open connections per process
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", 5000))  # ms to wait on a locked database
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")  # WAL lets readers run during writes
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", -16000))  # negative = KiB per connection
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024))  # bytes
+SQLITE_CACHED_STATEMENTS = int(os.environ.get("SQLITE_CACHED_STATEMENTS", 256))  # prepared statements kept per connection
+
 # MongoDB Configuration
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
 MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "skillcode_db")
@@ -27,12 +36,102 @@ MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "skillcode_db")
 # Book Upload Configuration
 BOOKS_FOLDER = os.environ.get("BOOKS_FOLDER", os.path.join(os.getcwd(), "books"))
 UPLOAD_SCHEDULE_HOUR = 2  # 2:00 AM daily
+# OCR worker processes; the scheduler runs inside a web worker, so leave most cores to requests
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", max(1, min(2, (os.cpu_count() or 1) // 4))))
+INGEST_EMBED_BATCH_BOOKS = int(os.environ.get("INGEST_EMBED_BATCH_BOOKS", 8))  # books embedded per batch
+BOOK_CATALOG_TTL = int(os.environ.get("BOOK_CATALOG_TTL", 300))  # seconds; catches ingests from other processes
+LEADER_LEASE_TTL = int(os.environ.get("LEADER_LEASE_TTL", 120))  # seconds before a dead writer's lease can be taken over
+LEADER_LEASE_HEARTBEAT = int(os.environ.get("LEADER_LEASE_HEARTBEAT", 30))  # seconds between lease renewals
+
+# Vector Store Configuration
+VECTOR_LAZY_LOAD = os.environ.get("VECTOR_LAZY_LOAD", "true").lower() == "true"  # load model/index on first use
+VECTOR_MMAP = os.environ.get("VECTOR_MMAP", "true").lower() == "true"  # open a compacted base read-only via mmap
+VECTOR_DOCSTORE_MMAP_SIZE = int(os.environ.get("VECTOR_DOCSTORE_MMAP_SIZE", 512 * 1024 * 1024))  # bytes of docstore.db mapped
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 64))  # chunks per encoder forward pass
+EMBED_WORKERS = int(os.environ.get("EMBED_WORKERS", 1))  # >1 = sentence-transformers multi-process pool on CPU
+QUERY_EMBED_CACHE_SIZE = int(os.environ.get("QUERY_EMBED_CACHE_SIZE", 1024))  # query vectors kept per process; 0 = off
+VECTOR_INDEX_TYPE = os.environ.get("VECTOR_INDEX_TYPE", "flat").lower()  # flat, hnsw or ivfpq (see build_vector_index.py)
+HNSW_M = int(os.environ.get("HNSW_M", 32))  # graph neighbours per node
+HNSW_EF_CONSTRUCTION = int(os.environ.get("HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_SEARCH = int(os.environ.get("HNSW_EF_SEARCH", 64))  # higher = better recall, slower queries
+IVF_NLIST = int(os.environ.get("IVF_NLIST", 0))  # inverted lists; 0 = 4 * sqrt(chunks)
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 16))  # lists scanned per query
+IVFPQ_M = int(os.environ.get("IVFPQ_M", 48))  # PQ sub-quantizers; must divide the embedding size (384)
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() == "true"  # fuse BM25 keyword hits with vector hits
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 20))  # hits taken from each retriever before fusion
+RRF_K = int(os.environ.get("RRF_K", 60))  # reciprocal rank fusion constant
+VECTOR_COMPACT_SEGMENTS = int(os.environ.get("VECTOR_COMPACT_SEGMENTS", 16))  # appended segments before rewriting the base
+VECTOR_REFRESH_SECONDS = float(os.environ.get("VECTOR_REFRESH_SECONDS", 30))  # how often search checks for commits by other processes; 0 = never
 
 # Grok API Configuration
 GROK_API_KEY = os.environ.get("GROK_API_KEY", "your-key-here")
 GROK_BASE_URL = "https://api.groq.com/openai/v1"
 GROK_MODEL = "llama-3.1-8b-instant"
 
+# LLM Backend (see src/llm_backends.py): 'groq' (above), 'openai' (any OpenAI-compatible URL),
+# 'local' (self-hosted llama.cpp `llama-server`, or vLLM started with --enable-prefix-caching)
+# or 'fake' (in-process stub server for offline load tests)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "groq")
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://api.openai.com/v1")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+LLM_API_KEY = os.environ.get("LLM_API_KEY", "")
+LOCAL_LLM_BASE_URL = os.environ.get("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL", "local-model")
+LOCAL_LLM_API_KEY = os.environ.get("LOCAL_LLM_API_KEY", "")  # only if the server was started with one
+LOCAL_LLM_CACHE_PROMPT = os.environ.get("LOCAL_LLM_CACHE_PROMPT", "true").lower() == "true"  # llama.cpp cache_prompt
+
+# Fake LLM backend (src/fake_llm.py)
+FAKE_LLM_RESPONSES = os.environ.get("FAKE_LLM_RESPONSES", "")  # JSON file of {"match", "response"} entries
+FAKE_LLM_REPLY_WORDS = int(os.environ.get("FAKE_LLM_REPLY_WORDS", 120))  # length of the default reply
+FAKE_LLM_TTFT_MS = float(os.environ.get("FAKE_LLM_TTFT_MS", 300))  # median time to first token
+FAKE_LLM_LATENCY_SIGMA = float(os.environ.get("FAKE_LLM_LATENCY_SIGMA", 0.5))  # log-normal spread; 0 = constant
+FAKE_LLM_TOKENS_PER_SEC = float(os.environ.get("FAKE_LLM_TOKENS_PER_SEC", 400))
+FAKE_LLM_ERROR_RATE = float(os.environ.get("FAKE_LLM_ERROR_RATE", 0))  # fraction answered with 429
+FAKE_LLM_SEED = int(os.environ.get("FAKE_LLM_SEED", 0))
+
+# Prompt layout: 'prefix' sends the system prompt + book list as a byte-identical first message
+# and all per-request content last (for servers with prefix caching); 'classic' is the original order
+PROMPT_LAYOUT = os.environ.get("PROMPT_LAYOUT", "")  # empty = the backend's default (prefix for local)
+
+# Grok HTTP connection pool (one long-lived async client per worker, see src/llm_gateway.py)
+GROK_POOL_MAXSIZE = int(os.environ.get("GROK_POOL_MAXSIZE", 16))  # idle keep-alive connections kept
+GROK_TCP_KEEPALIVE = os.environ.get("GROK_TCP_KEEPALIVE", "true").lower() == "true"
+
+# LLM gateway admission control (per worker process)
+# Each chat holds a gunicorn thread while it waits, so the defaults are derived from the thread
+# count: half the threads in flight plus a quarter queued, leaving the rest for other requests
+GUNICORN_THREADS = max(1, int(os.environ.get("GUNICORN_THREADS", 16)))  # threads per worker (gunicorn.conf.py reads it)
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", max(1, GUNICORN_THREADS // 2)))  # in-flight upstream calls
+LLM_MAX_PER_USER = int(os.environ.get("LLM_MAX_PER_USER", 2))  # in-flight calls per student
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", max(1, GUNICORN_THREADS // 4)))  # calls waiting for a slot before new ones are turned away
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 30))  # seconds a call may wait for a slot
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))  # attempts per completion
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", 0.5))  # seconds; doubles per attempt, fully jittered
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", 10))  # back-off cap; a longer Retry-After is not waited out
+# Set to the Groq tier's limits; each gunicorn worker enforces its 1/WEB_CONCURRENCY share
+LLM_RATE_RPM = int(os.environ.get("LLM_RATE_RPM", 0))  # requests per minute; 0 = no limit
+LLM_RATE_TPM = int(os.environ.get("LLM_RATE_TPM", 0))  # tokens per minute; 0 = no limit
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))  # gunicorn workers (gunicorn reads the same variable)
+LLM_COMPLETION_TOKENS = int(os.environ.get("LLM_COMPLETION_TOKENS", 500))  # answer tokens reserved until usage is known
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))  # consecutive 5xx/network failures that open the circuit
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))  # seconds calls fail fast before a probe
+
+# Prompt Token Budgets (see src/prompt_budget.py)
+PROMPT_TOKENIZER = os.environ.get("PROMPT_TOKENIZER", "cl100k_base")  # tiktoken encoding used for counting
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 5000))  # whole request; oldest history, then the prompt tail, give way
+PROMPT_TITLES_TOKENS = int(os.environ.get("PROMPT_TITLES_TOKENS", 400))  # AVAILABLE LIBRARY BOOKS list
+PROMPT_CONTEXT_TOKENS = int(os.environ.get("PROMPT_CONTEXT_TOKENS", 1500))  # retrieved chunks
+PROMPT_HISTORY_TOKENS = int(os.environ.get("PROMPT_HISTORY_TOKENS", 1200))  # previous turns
+PROMPT_HISTORY_ANSWER_TOKENS = int(os.environ.get("PROMPT_HISTORY_ANSWER_TOKENS", 250))  # cap on each older answer
+
+# Response Cache Configuration (answers to repeated questions)
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_DB = os.environ.get("RESPONSE_CACHE_DB", os.path.join(os.getcwd(), "response_cache.db"))  # empty = memory only
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 2000))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", 86400))  # seconds
+RESPONSE_CACHE_SEMANTIC = os.environ.get("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.95))
+
 # App Settings
 APP_NAME = "SkillCode GPT"
 APP_VERSION = "1.0.0"
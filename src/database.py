@@ -1,13 +1,66 @@
 
 import os
 import logging
+import time
+from threading import Lock
+from src import config
 from src.database_sqlite import Database as SQLiteDB
+from src.leader import VECTOR_STORE_LEASE
 from src.vector_db import VectorDB
+from src.prompt_budget import render_library_preamble
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class BookCatalog:
+    """
+    In-process cache of the library listing and its rendered prompt preamble.
+    Built on first use and rebuilt only after invalidate() (on ingest) or when the
+    TTL expires, which picks up books ingested by another process.
+    """
+    def __init__(self, loader, ttl=300):
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = Lock()
+        self.version = 0
+        self._built_version = -1
+        self._built_at = 0.0
+        self._books = []
+        self._titles = []
+        self._preamble = render_library_preamble([])
+
+    def invalidate(self):
+        """Bump the version so the next read rebuilds the catalog"""
+        with self._lock:
+            self.version += 1
+
+    def _ensure_fresh(self):
+        with self._lock:
+            expired = self.ttl and time.time() - self._built_at > self.ttl
+            if self._built_version == self.version and not expired:
+                return
+            version = self.version
+            books = self._loader()
+            self._books = books
+            self._titles = [b['title'] for b in books]
+            self._preamble = render_library_preamble(self._titles)
+            self._built_version = version
+            self._built_at = time.time()
+            logger.info(f"Book catalog rebuilt (version {version}, {len(books)} books)")
+
+    def books(self):
+        self._ensure_fresh()
+        return list(self._books)
+
+    def titles(self):
+        self._ensure_fresh()
+        return list(self._titles)
+
+    def preamble(self):
+        self._ensure_fresh()
+        return self._preamble
+
 class Database:
     """
     Unified Database Interface
@@ -16,6 +69,7 @@ class Database:
     def __init__(self):
         self.sql_db = SQLiteDB()
         self.vector_db = VectorDB()
+        self.book_catalog = BookCatalog(self.sql_db.get_all_books, ttl=config.BOOK_CATALOG_TTL)
         
     # --- PROXY METHODS TO SQLITE ---
     
@@ -37,24 +91,90 @@ class Database:
     def save_conversation(self, user_id, assistant_type, user_message, ai_response):
         return self.sql_db.save_conversation(user_id, assistant_type, user_message, ai_response)
 
-    def get_conversations(self, user_id, assistant_type='all', limit=20):
-        return self.sql_db.get_conversations(user_id, assistant_type, limit)
+    def get_conversations(self, user_id, assistant_type='all', limit=20, cursor=None, fields='full'):
+        return self.sql_db.get_conversations(user_id, assistant_type, limit, cursor, fields)
+
+    def get_conversation(self, user_id, conversation_id):
+        return self.sql_db.get_conversation(user_id, conversation_id)
+
+    def encode_history_cursor(self, conversation):
+        return self.sql_db.encode_cursor(conversation)
 
     def get_user_stats(self, user_id):
         return self.sql_db.get_user_stats(user_id)
+
+    def backfill_user_stats(self):
+        return self.sql_db.backfill_user_stats()
+
+    def check_user_stats(self):
+        return self.sql_db.check_user_stats()
         
     def get_all_books(self):
-        return self.sql_db.get_all_books()
+        return self.book_catalog.books()
+
+    def get_book_titles(self):
+        return self.book_catalog.titles()
+
+    def get_library_preamble(self):
+        """Rendered AVAILABLE LIBRARY BOOKS block for GrokService._build_context"""
+        return self.book_catalog.preamble()
+
+    def invalidate_book_catalog(self):
+        self.book_catalog.invalidate()
+
+    def get_ingest_status(self):
+        """Vector store lease holder, the current run's per-status book counts and recent runs"""
+        now = time.time()
+        lease = self.sql_db.get_lease(VECTOR_STORE_LEASE)
+        if lease:
+            lease['alive'] = lease['expires_at'] > now
+            lease['heartbeat_age'] = round(now - lease['heartbeat_at'], 1)
+        runs = self.sql_db.get_ingest_runs(limit=5)
+        current = runs[0] if runs and runs[0]['status'] == 'running' else None
+        if current and not (lease and lease['alive'] and lease['owner'] == current['owner']):
+            # The process recording it died; the next leader marks it abandoned
+            current['status'] = 'stale'
+        return {
+            'running': bool(current) and current['status'] == 'running',
+            'lease': lease,
+            'current_run': current,
+            'progress': self.sql_db.get_ingest_progress(),
+            'recent_runs': runs
+        }
 
     # --- BOOK MANAGEMENT (HYBRID) ---
 
-    def add_book(self, title, file_path, content):
+    def add_book(self, title, file_path, content, md5_hash=None):
         """Add to SQLite (Metadata) AND Vector DB (Chunks)"""
+        return self.add_books([{'title': title, 'file_path': file_path, 'content': content, 'md5_hash': md5_hash}])
+
+    def add_books(self, books):
+        """
+        Batch version of add_book for ingestion: books is a list of {'title', 'file_path', 'content'}
+        plus an optional 'md5_hash'. Re-adding a title replaces its old chunks; the hash is only
+        recorded once the vectors are stored, so a failed book is retried next run.
+        """
         # 1. Add Metadata to SQLite
-        self.sql_db.add_book_metadata(title, file_path)
+        for book in books:
+            self.sql_db.add_book_metadata(book['title'], book['file_path'])
+        self.invalidate_book_catalog()
         
         # 2. Add Content to Vector Store
-        return self.vector_db.add_book(title, content)
+        success = self.vector_db.add_books([(book['title'], book['content']) for book in books], replace=True)
+        if success:
+            for book in books:
+                if book.get('md5_hash'):
+                    self.sql_db.add_book_metadata(book['title'], book['file_path'], book['md5_hash'])
+                # Drop the same file indexed under its bare file name, before titles were folder paths
+                for old_title in self.sql_db.get_other_titles(book['file_path'], book['title']):
+                    logger.info(f"Replacing '{old_title}' with '{book['title']}'")
+                    self.vector_db.remove_book(old_title)
+                    self.sql_db.delete_book_metadata(old_title)
+            self.invalidate_book_catalog()
+        return success
+
+    def get_book_hashes(self):
+        return self.sql_db.get_book_hashes()
 
     def search_relevant_books(self, query, limit=5, subject_filter=None):
         """Search using Vector Store"""
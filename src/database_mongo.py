@@ -3,7 +3,7 @@ import pymongo
 import logging
 import os
 from datetime import datetime
-from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT, ReturnDocument, ReplaceOne
 from src.config import MONGO_URI, MONGO_DB_NAME
 
 logger = logging.getLogger(__name__)
@@ -49,6 +49,12 @@ class Database:
                 if not self.db.counters.find_one({'_id': seq_name}):
                     self.db.counters.insert_one({'_id': seq_name, 'seq': 0})
 
+            # 5. User stats (materialized dashboard counters, keyed by user_id)
+            # Existing deployments get a one-time backfill from their history
+            if not self.db.counters.find_one({'_id': 'user_stats_backfilled'}):
+                self.backfill_user_stats()
+                self.db.counters.insert_one({'_id': 'user_stats_backfilled', 'seq': 1})
+
             logger.info("✅ MongoDB indexes initialized")
         except Exception as e:
             logger.error(f"Schema initialization failed: {e}")
@@ -385,6 +391,16 @@ class Database:
                 "ai_response": ai_response,
                 "created_at": datetime.utcnow()
             })
+            # Single-document atomic update of the dashboard counters
+            # (standalone MongoDB has no multi-document transactions; check_user_stats catches drift)
+            self.db.user_stats.update_one(
+                {"_id": user_id},
+                {
+                    "$inc": {"conversations": 1, "exams_completed": 1 if assistant_type == 'exam' else 0},
+                    "$addToSet": {"assistant_types": assistant_type}
+                },
+                upsert=True
+            )
             logger.info("Successfully saved conversation to DB")
         except Exception as e:
             logger.error(f"Failed to save conversation: {e}", exc_info=True)
@@ -423,24 +439,66 @@ class Database:
             'exams_completed': 0
         }
         try:
-            # 1. Total Conversations
-            stats['conversations'] = self.db.conversations.count_documents({"user_id": user_id})
+            # Counters are maintained by save_conversation; one _id lookup
+            doc = self.db.user_stats.find_one({"_id": user_id})
+            if doc:
+                stats['conversations'] = doc.get('conversations', 0)
+                stats['topics_mastered'] = len([t for t in doc.get('assistant_types', []) if t is not None])
+                stats['exams_completed'] = doc.get('exams_completed', 0)
             
-            # 2. Estimated Study Hours
+            # Estimated Study Hours
             hours = float(stats['conversations']) * 0.25
             stats['study_hours'] = round(hours, 1)
             
-            # 3. Topics Mastered (Count unique assistant types)
-            topics = self.db.conversations.distinct("assistant_type", {"user_id": user_id})
-            stats['topics_mastered'] = len(topics)
-            
-            # 4. Exams Completed
-            stats['exams_completed'] = self.db.conversations.count_documents({
-                "user_id": user_id, 
-                "assistant_type": "exam"
-            })
-            
             return stats
         except Exception as e:
             logger.error(f"Error fetching user stats: {e}")
             return stats
+
+    # --- STATS MAINTENANCE ---
+
+    def _compute_user_stats(self):
+        """Recount stats for every user from the conversations collection"""
+        pipeline = [
+            {"$group": {
+                "_id": "$user_id",
+                "conversations": {"$sum": 1},
+                "assistant_types": {"$addToSet": "$assistant_type"},
+                "exams_completed": {"$sum": {"$cond": [{"$eq": ["$assistant_type", "exam"]}, 1, 0]}}
+            }}
+        ]
+        return {row['_id']: row for row in self.db.conversations.aggregate(pipeline)}
+
+    def backfill_user_stats(self):
+        """Rebuild the user_stats collection from the full conversation history"""
+        rows = self._compute_user_stats()
+        # Replace each user's document in place rather than emptying the collection first, so
+        # the dashboard never reads missing stats and other users' concurrent $inc are kept
+        docs = list(rows.values())
+        for start in range(0, len(docs), 1000):
+            self.db.user_stats.bulk_write(
+                [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in docs[start:start + 1000]],
+                ordered=False
+            )
+        self.db.user_stats.delete_many({'_id': {'$nin': list(rows)}})
+        logger.info(f"✅ Rebuilt stats for {len(rows)} users")
+        return len(rows)
+
+    def check_user_stats(self):
+        """Compare materialized counters with a full recount; returns the mismatching users"""
+        def summary(doc):
+            return {
+                'conversations': doc.get('conversations', 0),
+                'topics_mastered': len([t for t in doc.get('assistant_types', []) if t is not None]),
+                'exams_completed': doc.get('exams_completed', 0)
+            }
+        expected = {uid: summary(doc) for uid, doc in self._compute_user_stats().items()}
+        actual = {doc['_id']: summary(doc) for doc in self.db.user_stats.find({})}
+        zero = summary({})
+        mismatches = []
+        for uid in set(expected) | set(actual):
+            exp = expected.get(uid, zero)
+            act = actual.get(uid, zero)
+            if exp != act:
+                mismatches.append({'user_id': uid, 'expected': exp, 'actual': act})
+        return mismatches
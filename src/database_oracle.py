@@ -116,8 +116,38 @@ class Database:
                     cursor.execute("CREATE SEQUENCE CONVERSATION_SEQ START WITH 1 INCREMENT BY 1")
                 except: pass
 
+            # 4. USER_STATS / USER_ASSISTANT_TYPES tables (materialized dashboard counters)
+            needs_backfill = False
+            try:
+                cursor.execute("SELECT 1 FROM USER_STATS WHERE ROWNUM = 1")
+                logger.info("✅ Table USER_STATS exists")
+            except oracledb.DatabaseError:
+                logger.info("Creating tables USER_STATS and USER_ASSISTANT_TYPES...")
+                cursor.execute("""
+                    CREATE TABLE USER_STATS (
+                        USER_ID NUMBER PRIMARY KEY,
+                        CONVERSATIONS NUMBER DEFAULT 0 NOT NULL,
+                        TOPICS_MASTERED NUMBER DEFAULT 0 NOT NULL,
+                        EXAMS_COMPLETED NUMBER DEFAULT 0 NOT NULL
+                    )
+                """)
+                try:
+                    cursor.execute("""
+                        CREATE TABLE USER_ASSISTANT_TYPES (
+                            USER_ID NUMBER,
+                            ASSISTANT_TYPE VARCHAR2(50),
+                            PRIMARY KEY (USER_ID, ASSISTANT_TYPE)
+                        )
+                    """)
+                except oracledb.DatabaseError: pass
+                needs_backfill = True
+
             conn.commit()
             logger.info("✅ Database schema initialized")
+            
+            # Existing deployments get a one-time backfill from their history
+            if needs_backfill:
+                self.backfill_user_stats()
         except Exception as e:
             logger.error(f"Schema initialization failed: {e}")
         finally:
@@ -462,6 +492,32 @@ class Database:
                    VALUES (CONVERSATION_SEQ.NEXTVAL, :u, :a, :m, :r)""",
                 u=user_id, a=assistant_type, m=user_message, r=ai_response
             )
+            
+            # Keep the dashboard counters in step (same transaction as the insert)
+            new_topic = 0
+            if assistant_type is not None:
+                self._merge(
+                    cursor,
+                    """MERGE INTO USER_ASSISTANT_TYPES t
+                       USING (SELECT :u AS USER_ID, :a AS ASSISTANT_TYPE FROM dual) src
+                       ON (t.USER_ID = src.USER_ID AND t.ASSISTANT_TYPE = src.ASSISTANT_TYPE)
+                       WHEN NOT MATCHED THEN INSERT (USER_ID, ASSISTANT_TYPE) VALUES (src.USER_ID, src.ASSISTANT_TYPE)""",
+                    u=user_id, a=assistant_type
+                )
+                new_topic = cursor.rowcount
+            self._merge(
+                cursor,
+                """MERGE INTO USER_STATS s
+                   USING (SELECT :u AS USER_ID FROM dual) src
+                   ON (s.USER_ID = src.USER_ID)
+                   WHEN MATCHED THEN UPDATE SET
+                       s.CONVERSATIONS = s.CONVERSATIONS + 1,
+                       s.TOPICS_MASTERED = s.TOPICS_MASTERED + :t,
+                       s.EXAMS_COMPLETED = s.EXAMS_COMPLETED + :e
+                   WHEN NOT MATCHED THEN INSERT (USER_ID, CONVERSATIONS, TOPICS_MASTERED, EXAMS_COMPLETED)
+                       VALUES (src.USER_ID, 1, :t, :e)""",
+                u=user_id, t=new_topic, e=1 if assistant_type == 'exam' else 0
+            )
             conn.commit()
             logger.info("Successfully saved conversation to DB")
         except Exception as e:
@@ -470,6 +526,18 @@ class Database:
             if conn:
                 conn.close()
 
+    def _merge(self, cursor, sql, **params):
+        """
+        Run an upsert MERGE. Two sessions inserting the same new key both take the NOT MATCHED
+        branch and one gets ORA-00001; run it again so it takes the MATCHED branch. Oracle
+        rolls back only the failed statement, so the rest of the transaction is kept.
+        """
+        try:
+            cursor.execute(sql, **params)
+        except oracledb.IntegrityError:
+            logger.info("Concurrent insert of the same stats row, retrying MERGE")
+            cursor.execute(sql, **params)
+
     def get_conversations(self, user_id, assistant_type='all', limit=20):
         """Fetch recent history for a user (Max compatibility)"""
         conn = None
@@ -521,29 +589,22 @@ class Database:
         try:
             cursor = conn.cursor()
             
-            # 1. Total Conversations
-            cursor.execute("SELECT COUNT(*) FROM CONVERSATIONS WHERE USER_ID = :1", (user_id,))
+            # Counters are maintained by save_conversation; one primary key lookup
+            cursor.execute(
+                "SELECT CONVERSATIONS, TOPICS_MASTERED, EXAMS_COMPLETED FROM USER_STATS WHERE USER_ID = :1",
+                (user_id,)
+            )
             res = cursor.fetchone()
             if res:
                 stats['conversations'] = res[0]
+                stats['topics_mastered'] = res[1]
+                stats['exams_completed'] = res[2]
             
-            # 2. Estimated Study Hours (Assume 15 mins per conversation)
+            # Estimated Study Hours (Assume 15 mins per conversation)
             # Use float arithmetic for precision
             hours = float(stats['conversations']) * 0.25
             stats['study_hours'] = round(hours, 1)
             
-            # 3. Topics Mastered (Count unique assistant types used)
-            cursor.execute("SELECT COUNT(DISTINCT ASSISTANT_TYPE) FROM CONVERSATIONS WHERE USER_ID = :1", (user_id,))
-            res = cursor.fetchone()
-            if res:
-                stats['topics_mastered'] = res[0]
-            
-            # 4. Exams Completed (Count 'exam' type conversations)
-            cursor.execute("SELECT COUNT(*) FROM CONVERSATIONS WHERE ASSISTANT_TYPE = 'exam' AND USER_ID = :1", (user_id,))
-            res = cursor.fetchone()
-            if res:
-                stats['exams_completed'] = res[0]
-            
             return stats
         except Exception as e:
             logger.error(f"Error fetching user stats: {e}")
@@ -551,3 +612,65 @@ class Database:
         finally:
             if conn:
                 conn.close()
+
+    # --- STATS MAINTENANCE ---
+
+    def _compute_user_stats(self, cursor):
+        """Recount stats for every user from the CONVERSATIONS table"""
+        cursor.execute("""
+            SELECT USER_ID, COUNT(*), COUNT(DISTINCT ASSISTANT_TYPE), SUM(CASE WHEN ASSISTANT_TYPE = 'exam' THEN 1 ELSE 0 END)
+            FROM CONVERSATIONS GROUP BY USER_ID
+        """)
+        return {
+            row[0]: {'conversations': row[1], 'topics_mastered': row[2], 'exams_completed': row[3] or 0}
+            for row in cursor.fetchall()
+        }
+
+    def backfill_user_stats(self):
+        """Rebuild USER_STATS and USER_ASSISTANT_TYPES from the full conversation history"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM USER_ASSISTANT_TYPES")
+            cursor.execute("""
+                INSERT INTO USER_ASSISTANT_TYPES (USER_ID, ASSISTANT_TYPE)
+                SELECT DISTINCT USER_ID, ASSISTANT_TYPE FROM CONVERSATIONS WHERE ASSISTANT_TYPE IS NOT NULL
+            """)
+            cursor.execute("DELETE FROM USER_STATS")
+            rows = self._compute_user_stats(cursor)
+            if rows:
+                cursor.executemany(
+                    "INSERT INTO USER_STATS (USER_ID, CONVERSATIONS, TOPICS_MASTERED, EXAMS_COMPLETED) VALUES (:1, :2, :3, :4)",
+                    [(uid, s['conversations'], s['topics_mastered'], s['exams_completed']) for uid, s in rows.items()]
+                )
+            conn.commit()
+            logger.info(f"✅ Rebuilt stats for {len(rows)} users")
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"User stats backfill failed: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def check_user_stats(self):
+        """Compare materialized counters with a full recount; returns the mismatching users"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            expected = self._compute_user_stats(cursor)
+            cursor.execute("SELECT USER_ID, CONVERSATIONS, TOPICS_MASTERED, EXAMS_COMPLETED FROM USER_STATS")
+            actual = {
+                row[0]: {'conversations': row[1], 'topics_mastered': row[2], 'exams_completed': row[3]}
+                for row in cursor.fetchall()
+            }
+            zero = {'conversations': 0, 'topics_mastered': 0, 'exams_completed': 0}
+            mismatches = []
+            for uid in set(expected) | set(actual):
+                exp = expected.get(uid, zero)
+                act = actual.get(uid, zero)
+                if exp != act:
+                    mismatches.append({'user_id': uid, 'expected': exp, 'actual': act})
+            return mismatches
+        finally:
+            conn.close()
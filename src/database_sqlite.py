@@ -1,12 +1,216 @@
 
+import json
 import logging
 import os
+import queue
 import sqlite3
+import time
 from datetime import datetime
 from threading import Lock
+from src import config
 
 logger = logging.getLogger(__name__)
 
+# Characters of each message returned by get_conversations(fields='summary')
+SUMMARY_PREVIEW_CHARS = 80
+
+# Ordered schema migrations: (version, description, statements).
+# Version 0 is the base schema created in init_db; never edit a shipped migration, append a new one.
+MIGRATIONS = [
+    (1, "Conversation history and stats indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_type_created ON conversations(user_id, assistant_type, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_created ON conversations(user_id, created_at DESC)",
+    ]),
+    (2, "Case-insensitive email lookup index", [
+        "CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users(LOWER(email))",
+    ]),
+    (3, "Materialized per-user stats counters", [
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            conversations INTEGER NOT NULL DEFAULT 0,
+            topics_mastered INTEGER NOT NULL DEFAULT 0,
+            exams_completed INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_assistant_types (
+            user_id INTEGER NOT NULL,
+            assistant_type TEXT NOT NULL,
+            PRIMARY KEY (user_id, assistant_type)
+        )
+        """,
+        # Backfill from existing history
+        "INSERT OR IGNORE INTO user_assistant_types (user_id, assistant_type) SELECT DISTINCT user_id, assistant_type FROM conversations WHERE assistant_type IS NOT NULL",
+        """
+        INSERT OR REPLACE INTO user_stats (user_id, conversations, topics_mastered, exams_completed)
+        SELECT user_id, COUNT(*), COUNT(DISTINCT assistant_type), SUM(CASE WHEN assistant_type = 'exam' THEN 1 ELSE 0 END)
+        FROM conversations GROUP BY user_id
+        """,
+    ]),
+    (4, "Book ingestion checkpoints", [
+        """
+        CREATE TABLE IF NOT EXISTS ingest_books (
+            file_path TEXT PRIMARY KEY,
+            book_title TEXT,
+            page_count INTEGER,
+            status TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ingest_pages (
+            file_path TEXT NOT NULL,
+            page_index INTEGER NOT NULL,
+            text TEXT,
+            PRIMARY KEY (file_path, page_index)
+        )
+        """,
+    ]),
+    (5, "Content hash on ingestion checkpoints", [
+        "ALTER TABLE ingest_books ADD COLUMN md5_hash TEXT",
+    ]),
+    (6, "Leader leases and ingestion run history", [
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ingest_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            owner TEXT NOT NULL,
+            trigger TEXT,
+            status TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            stats TEXT,
+            error TEXT
+        )
+        """,
+    ]),
+    (7, "Keyset pagination indexes ending in id", [
+        # History pages order by (created_at DESC, id DESC); with id in the index a page is a range scan
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_type_created_id ON conversations(user_id, assistant_type, created_at DESC, id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_created_id ON conversations(user_id, created_at DESC, id DESC)",
+        "DROP INDEX IF EXISTS idx_conversations_user_type_created",
+        "DROP INDEX IF EXISTS idx_conversations_user_created",
+    ]),
+]
+
+class _PooledConnection:
+    """sqlite3.Connection proxy whose close() hands the connection back to the pool"""
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # Dunder lookups bypass __getattr__, so `with conn:` needs these spelled out
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Commits or rolls back like sqlite3; the connection stays checked out until close()
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections configured with the pragmas from config.
+    Callers keep the get_connection() / conn.close() pattern; close() returns the connection.
+    """
+    def __init__(self, db_path, size=None):
+        self.db_path = db_path
+        self.size = size or config.SQLITE_POOL_SIZE
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=config.SQLITE_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            cached_statements=config.SQLITE_CACHED_STATEMENTS
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT)}")
+        conn.execute(f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = {int(config.SQLITE_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.SQLITE_MMAP_SIZE)}")
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            # Connections must not cross a fork (gunicorn workers); start a fresh pool in the child
+            if self._pid != os.getpid():
+                self._reset()
+            try:
+                return _PooledConnection(self, self._idle.get_nowait())
+            except queue.Empty:
+                pass
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return _PooledConnection(self, self._connect())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # Pool exhausted: wait for a connection to come back
+        try:
+            conn = self._idle.get(timeout=config.SQLITE_BUSY_TIMEOUT / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a pooled SQLite connection")
+        return _PooledConnection(self, conn)
+
+    def release(self, conn):
+        if self._pid != os.getpid():
+            return
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except Exception as e:
+            logger.warning(f"Dropping broken SQLite connection: {e}")
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
 class Database:
     _instance = None
     _lock = Lock()
@@ -24,15 +228,14 @@ class Database:
         
         """Initialize SQLite connection"""
         self.db_path = os.path.join(os.getcwd(), 'skillcode.db')
+        self.pool = ConnectionPool(self.db_path)
         
         # Initialize schema
         self.init_db()
 
     def get_connection(self):
-        """Get a fresh connection"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get a pooled connection (conn.close() returns it to the pool)"""
+        return self.pool.acquire()
 
     def init_db(self):
         """Ensure tables exist"""
@@ -40,6 +243,10 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
+            # Journal mode is stored in the database file, so set it once here
+            mode = cursor.execute(f"PRAGMA journal_mode = {config.SQLITE_JOURNAL_MODE}").fetchone()[0]
+            logger.info(f"SQLite journal mode: {mode}")
+
             # 1. Users
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -74,13 +281,51 @@ class Database:
                 )
             """)
             
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
             conn.commit()
             logger.info("✅ SQLite schema initialized")
+            
+            self.migrate(conn)
         except Exception as e:
             logger.error(f"Schema initialization failed: {e}")
         finally:
             conn.close()
 
+    def get_schema_version(self, conn):
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+        return row[0] or 0
+
+    def migrate(self, conn):
+        """Apply pending MIGRATIONS in order, each in its own transaction"""
+        for version, description, statements in MIGRATIONS:
+            if version <= self.get_schema_version(conn):
+                continue
+            try:
+                # IMMEDIATE takes the write lock up front so concurrent workers apply each migration once
+                conn.execute("BEGIN IMMEDIATE")
+                if version <= self.get_schema_version(conn):
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+                conn.commit()
+                logger.info(f"✅ Applied SQLite migration {version}: {description}")
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"SQLite migration {version} failed: {e}")
+                raise
+
     # --- USER MANAGEMENT ---
 
     def get_user_by_email(self, email):
@@ -141,12 +386,17 @@ class Database:
     # --- BOOK METADATA MANAGEMENT ---
     # Actual content will be in Vector Store, but we keep metadata here to list books
 
-    def add_book_metadata(self, title, file_path):
-        """Add book metadata only"""
+    def add_book_metadata(self, title, file_path, md5_hash=None):
+        """Add or update book metadata only (md5_hash is the content hash of the ingested file)"""
         conn = self.get_connection()
         try:
             cursor = conn.cursor()
-            cursor.execute("INSERT OR IGNORE INTO library (book_title, file_path) VALUES (?, ?)", (title, file_path))
+            cursor.execute("""
+                INSERT INTO library (book_title, file_path, md5_hash) VALUES (?, ?, ?)
+                ON CONFLICT(book_title) DO UPDATE SET
+                    file_path = excluded.file_path,
+                    md5_hash = COALESCE(excluded.md5_hash, library.md5_hash)
+            """, (title, file_path, md5_hash))
             conn.commit()
             return True
         except Exception as e:
@@ -155,6 +405,34 @@ class Database:
         finally:
             conn.close()
 
+    def get_other_titles(self, file_path, title):
+        """Titles other than title recorded for the same file (e.g. under an older naming scheme)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT book_title FROM library WHERE file_path = ? AND book_title != ?", (file_path, title))
+            return [row['book_title'] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    def delete_book_metadata(self, title):
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM library WHERE book_title = ?", (title,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_book_hashes(self):
+        """{book_title: md5_hash} for every book in the library (hash is None if never recorded)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT book_title, md5_hash FROM library")
+            return {row['book_title']: row['md5_hash'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
     def get_all_books(self):
         conn = self.get_connection()
         try:
@@ -164,6 +442,204 @@ class Database:
         finally:
             conn.close()
 
+    # --- INGESTION CHECKPOINTS ---
+    # Progress of the current (or last) ingestion run: status is 'ocr' -> 'ocr_done' -> 'indexed'
+    # ('empty' and 'failed' also end a book's run)
+
+    def begin_ingest_run(self):
+        """Start a run; returns True when resuming an unfinished one (its checkpoints are kept)"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM ingest_books WHERE status IN ('ocr', 'ocr_done')")
+            if cursor.fetchone()[0] > 0:
+                return True
+            cursor.execute("DELETE FROM ingest_pages")
+            cursor.execute("DELETE FROM ingest_books")
+            conn.commit()
+            return False
+        finally:
+            conn.close()
+
+    def get_ingest_state(self, file_path):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT book_title, page_count, status, md5_hash FROM ingest_books WHERE file_path = ?", (file_path,))
+            row = cursor.fetchone()
+            if row:
+                return {'title': row['book_title'], 'page_count': row['page_count'], 'status': row['status'], 'md5_hash': row['md5_hash']}
+            return None
+        finally:
+            conn.close()
+
+    def set_ingest_state(self, file_path, title, page_count, status, md5_hash=None):
+        conn = self.get_connection()
+        try:
+            conn.execute("""
+                INSERT INTO ingest_books (file_path, book_title, page_count, status, md5_hash, updated_at)
+                VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(file_path) DO UPDATE SET
+                    book_title = excluded.book_title,
+                    page_count = excluded.page_count,
+                    status = excluded.status,
+                    md5_hash = COALESCE(excluded.md5_hash, ingest_books.md5_hash),
+                    updated_at = CURRENT_TIMESTAMP
+            """, (file_path, title, page_count, status, md5_hash))
+            # Finished books don't need their page texts any more
+            if status == 'indexed':
+                conn.execute("DELETE FROM ingest_pages WHERE file_path = ?", (file_path,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_ingest_pages(self, file_path):
+        """{page_index: page text} already extracted for this file"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT page_index, text FROM ingest_pages WHERE file_path = ?", (file_path,))
+            return {row['page_index']: row['text'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def save_ingest_page(self, file_path, page_index, text):
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingest_pages (file_path, page_index, text) VALUES (?, ?, ?)",
+                (file_path, page_index, text)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reset_ingest(self, file_path):
+        """Forget a file's checkpoints (e.g. the PDF changed page count)"""
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM ingest_pages WHERE file_path = ?", (file_path,))
+            conn.execute("DELETE FROM ingest_books WHERE file_path = ?", (file_path,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_ingest_progress(self):
+        """Per-status book counts for the current/last run"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM ingest_books GROUP BY status")
+            return {row[0]: row[1] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    # --- LEADER LEASES ---
+    # A lease row names the one process allowed to run a job; the holder renews expires_at
+    # from a heartbeat, and an expired lease (crashed holder) can be taken over.
+
+    def acquire_lease(self, name, owner, ttl):
+        """Take or renew the lease; returns False while another owner holds an unexpired one"""
+        conn = self.get_connection()
+        try:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, acquired_at, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row['owner'] != owner and row['expires_at'] > now:
+                conn.rollback()
+                return False
+            acquired_at = row['acquired_at'] if row and row['owner'] == owner else now
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (name, owner, acquired_at, heartbeat_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (name, owner, acquired_at, now, now + ttl)
+            )
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def renew_lease(self, name, owner, ttl):
+        """Heartbeat; returns False if the lease was lost (expired and taken over)"""
+        conn = self.get_connection()
+        try:
+            now = time.time()
+            cursor = conn.execute(
+                "UPDATE leases SET heartbeat_at = ?, expires_at = ? WHERE name = ? AND owner = ?",
+                (now, now + ttl, name, owner)
+            )
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def release_lease(self, name, owner):
+        conn = self.get_connection()
+        try:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_lease(self, name):
+        conn = self.get_connection()
+        try:
+            row = conn.execute(
+                "SELECT owner, acquired_at, heartbeat_at, expires_at FROM leases WHERE name = ?", (name,)
+            ).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    # --- INGESTION RUN HISTORY ---
+
+    def start_ingest_run(self, owner, trigger=None):
+        """Record a new run; call while holding the ingestion lease, so any other 'running' row is dead"""
+        conn = self.get_connection()
+        try:
+            now = time.time()
+            conn.execute(
+                "UPDATE ingest_runs SET status = 'abandoned', finished_at = ? WHERE status = 'running'", (now,)
+            )
+            cursor = conn.execute(
+                "INSERT INTO ingest_runs (owner, trigger, status, started_at) VALUES (?, ?, 'running', ?)",
+                (owner, trigger, now)
+            )
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
+
+    def finish_ingest_run(self, run_id, status, stats=None, error=None):
+        conn = self.get_connection()
+        try:
+            conn.execute(
+                "UPDATE ingest_runs SET status = ?, finished_at = ?, stats = ?, error = ? WHERE id = ?",
+                (status, time.time(), json.dumps(stats) if stats is not None else None, error, run_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_ingest_runs(self, limit=5):
+        """Most recent runs first"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(
+                "SELECT id, owner, trigger, status, started_at, finished_at, stats, error "
+                "FROM ingest_runs ORDER BY id DESC LIMIT ?", (limit,)
+            )
+            runs = []
+            for row in cursor.fetchall():
+                run = dict(row)
+                run['stats'] = json.loads(run['stats']) if run['stats'] else None
+                runs.append(run)
+            return runs
+        finally:
+            conn.close()
+
     # --- CONVERSATION MANAGEMENT ---
 
     def save_conversation(self, user_id, assistant_type, user_message, ai_response):
@@ -174,31 +650,69 @@ class Database:
                 "INSERT INTO conversations (user_id, assistant_type, user_message, ai_response) VALUES (?, ?, ?, ?)",
                 (user_id, assistant_type, user_message, ai_response)
             )
+            
+            # Keep the dashboard counters in step (same transaction as the insert)
+            new_topic = 0
+            if assistant_type is not None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO user_assistant_types (user_id, assistant_type) VALUES (?, ?)",
+                    (user_id, assistant_type)
+                )
+                new_topic = cursor.rowcount
+            cursor.execute("""
+                INSERT INTO user_stats (user_id, conversations, topics_mastered, exams_completed)
+                VALUES (?, 1, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    conversations = conversations + 1,
+                    topics_mastered = topics_mastered + excluded.topics_mastered,
+                    exams_completed = exams_completed + excluded.exams_completed
+            """, (user_id, new_topic, 1 if assistant_type == 'exam' else 0))
             conn.commit()
         except Exception as e:
             logger.error(f"Failed to save conversation: {e}")
         finally:
             conn.close()
 
-    def get_conversations(self, user_id, assistant_type='all', limit=20):
+    def get_conversations(self, user_id, assistant_type='all', limit=20, cursor=None, fields='full'):
+        """
+        Newest-first conversation history.
+        cursor: next_cursor of the previous page (keyset on created_at, id) to continue after it.
+        fields: 'full' for whole messages, 'summary' for previews truncated in SQL.
+        Raises ValueError for a malformed cursor.
+        """
+        keyset = self.decode_cursor(cursor) if cursor else None
         conn = self.get_connection()
         try:
-            cursor = conn.cursor()
-            query = "SELECT user_message, ai_response, created_at FROM conversations WHERE user_id = ?"
+            cur = conn.cursor()
+            if fields == 'summary':
+                columns = (
+                    f"id, substr(user_message, 1, {SUMMARY_PREVIEW_CHARS}) AS user_message, "
+                    f"substr(ai_response, 1, {SUMMARY_PREVIEW_CHARS}) AS ai_response, created_at"
+                )
+            else:
+                columns = "id, user_message, ai_response, created_at"
+            query = f"SELECT {columns} FROM conversations WHERE user_id = ?"
             params = [user_id]
             
             if assistant_type != 'all' and assistant_type is not None:
                 query += " AND assistant_type = ?"
                 params.append(assistant_type)
             
-            query += " ORDER BY created_at DESC LIMIT ?"
+            if keyset:
+                created_at, last_id = keyset
+                # Row-value comparison, so SQLite seeks the index to the cursor instead of filtering
+                query += " AND (created_at, id) < (?, ?)"
+                params.extend([created_at, last_id])
+            
+            query += " ORDER BY created_at DESC, id DESC LIMIT ?"
             params.append(limit)
             
-            cursor.execute(query, params)
+            cur.execute(query, params)
             
             results = []
-            for row in cursor.fetchall():
+            for row in cur.fetchall():
                 results.append({
+                    'id': row['id'],
                     'user_message': row['user_message'],
                     'ai_response': row['ai_response'],
                     'created_at': row['created_at']
@@ -210,6 +724,40 @@ class Database:
         finally:
             conn.close()
 
+    @staticmethod
+    def encode_cursor(conversation):
+        """Keyset cursor pointing just after this conversation"""
+        return f"{conversation['created_at']}|{conversation['id']}"
+
+    @staticmethod
+    def decode_cursor(cursor):
+        created_at, sep, last_id = str(cursor).rpartition('|')
+        if not sep or not created_at:
+            raise ValueError(f"Invalid history cursor: {cursor}")
+        return created_at, int(last_id)
+
+    def get_conversation(self, user_id, conversation_id):
+        """One full conversation, only if it belongs to this user"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT id, assistant_type, user_message, ai_response, created_at FROM conversations WHERE id = ? AND user_id = ?",
+                (conversation_id, user_id)
+            )
+            row = cursor.fetchone()
+            if row:
+                return {
+                    'id': row['id'],
+                    'assistant_type': row['assistant_type'],
+                    'user_message': row['user_message'],
+                    'ai_response': row['ai_response'],
+                    'created_at': row['created_at']
+                }
+            return None
+        finally:
+            conn.close()
+
     def get_user_stats(self, user_id):
         conn = self.get_connection()
         stats = {
@@ -221,24 +769,89 @@ class Database:
         try:
             cursor = conn.cursor()
             
-            # 1. Total Conversations
-            cursor.execute("SELECT COUNT(*) FROM conversations WHERE user_id = ?", (user_id,))
-            stats['conversations'] = cursor.fetchone()[0]
+            # Counters are maintained by save_conversation; one primary key lookup
+            cursor.execute(
+                "SELECT conversations, topics_mastered, exams_completed FROM user_stats WHERE user_id = ?",
+                (user_id,)
+            )
+            row = cursor.fetchone()
+            if row:
+                stats['conversations'] = row['conversations']
+                stats['topics_mastered'] = row['topics_mastered']
+                stats['exams_completed'] = row['exams_completed']
             
-            # 2. Estimated Study Hours
+            # Estimated Study Hours
             stats['study_hours'] = round(stats['conversations'] * 0.25, 1)
             
-            # 3. Topics Mastered
-            cursor.execute("SELECT COUNT(DISTINCT assistant_type) FROM conversations WHERE user_id = ?", (user_id,))
-            stats['topics_mastered'] = cursor.fetchone()[0]
-            
-            # 4. Exams Completed
-            cursor.execute("SELECT COUNT(*) FROM conversations WHERE assistant_type = 'exam' AND user_id = ?", (user_id,))
-            stats['exams_completed'] = cursor.fetchone()[0]
-            
             return stats
         except Exception as e:
             logger.error(f"Error fetching stats: {e}")
             return stats
         finally:
             conn.close()
+
+    # --- STATS MAINTENANCE ---
+
+    def _compute_user_stats(self, cursor):
+        """Recount stats for every user from the conversations table"""
+        cursor.execute("""
+            SELECT user_id, COUNT(*), COUNT(DISTINCT assistant_type), SUM(CASE WHEN assistant_type = 'exam' THEN 1 ELSE 0 END)
+            FROM conversations GROUP BY user_id
+        """)
+        return {
+            row[0]: {'conversations': row[1], 'topics_mastered': row[2], 'exams_completed': row[3] or 0}
+            for row in cursor.fetchall()
+        }
+
+    def backfill_user_stats(self):
+        """Rebuild user_stats and user_assistant_types from the full conversation history"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("DELETE FROM user_assistant_types")
+            cursor.execute("""
+                INSERT INTO user_assistant_types (user_id, assistant_type)
+                SELECT DISTINCT user_id, assistant_type FROM conversations WHERE assistant_type IS NOT NULL
+            """)
+            cursor.execute("DELETE FROM user_stats")
+            rows = self._compute_user_stats(cursor)
+            cursor.executemany(
+                "INSERT INTO user_stats (user_id, conversations, topics_mastered, exams_completed) VALUES (?, ?, ?, ?)",
+                [(uid, s['conversations'], s['topics_mastered'], s['exams_completed']) for uid, s in rows.items()]
+            )
+            conn.commit()
+            logger.info(f"✅ Rebuilt stats for {len(rows)} users")
+            return len(rows)
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"User stats backfill failed: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def check_user_stats(self):
+        """Compare materialized counters with a full recount; returns the mismatching users"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            expected = self._compute_user_stats(cursor)
+            cursor.execute("SELECT user_id, conversations, topics_mastered, exams_completed FROM user_stats")
+            actual = {
+                row['user_id']: {
+                    'conversations': row['conversations'],
+                    'topics_mastered': row['topics_mastered'],
+                    'exams_completed': row['exams_completed']
+                }
+                for row in cursor.fetchall()
+            }
+            zero = {'conversations': 0, 'topics_mastered': 0, 'exams_completed': 0}
+            mismatches = []
+            for uid in set(expected) | set(actual):
+                exp = expected.get(uid, zero)
+                act = actual.get(uid, zero)
+                if exp != act:
+                    mismatches.append({'user_id': uid, 'expected': exp, 'actual': act})
+            return mismatches
+        finally:
+            conn.close()
@@ -0,0 +1,129 @@
+"""
+SQLite-backed docstore for the vector store's chunks
+
+Replaces LangChain's pickled InMemoryDocstore, which every worker had to unpickle in full.
+Chunk text lives in vector_store/docstore.db and is read on demand, so workers share it
+through the page cache (SQLite mmap) and only touched chunks are loaded.
+
+Deletes are only hidden in memory until VectorDB compacts; rows are then garbage-collected
+against the live IDs, so a crash never loses a chunk that a committed manifest still uses.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    def __init__(self, path=None):
+        self.path = None
+        self._local = threading.local()
+        self._hidden = set()
+        if path:
+            self.open(path)
+
+    def open(self, path):
+        """Attach to the database file (it is not part of the pickled state)"""
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc_id TEXT PRIMARY KEY,
+                source TEXT,
+                page_content TEXT,
+                metadata TEXT
+            )
+        """)
+        conn.commit()
+
+    def __getstate__(self):
+        # Pickled inside index.pkl by save_local; only a marker, the rows stay in docstore.db
+        return {}
+
+    def __setstate__(self, state):
+        self.path = None
+        self._local = threading.local()
+        self._hidden = set()
+
+    # --- CONNECTIONS ---
+
+    def _connect(self):
+        """One connection per thread, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        if self.path is None:
+            raise RuntimeError("SQLiteDocstore is not attached to a database file")
+        conn = sqlite3.connect(self.path, timeout=config.SQLITE_BUSY_TIMEOUT / 1000, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA mmap_size={int(config.VECTOR_DOCSTORE_MMAP_SIZE)}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # --- DOCSTORE INTERFACE ---
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._hidden:
+            return f"ID {search} not found."
+        row = self._connect().execute(
+            "SELECT page_content, metadata FROM docs WHERE doc_id = ?", (search,)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]) if row[1] else {})
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Insert documents; ones already stored (e.g. replayed from a segment) are skipped without writing"""
+        conn = self._connect()
+        ids = list(texts)
+        existing = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            existing.update(r[0] for r in conn.execute(f"SELECT doc_id FROM docs WHERE doc_id IN ({placeholders})", batch))
+        rows = [
+            (doc_id, doc.metadata.get('source', 'Unknown'), doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+            for doc_id, doc in texts.items() if doc_id not in existing
+        ]
+        self._hidden.difference_update(texts)
+        if not rows:
+            return
+        conn.executemany(
+            "INSERT OR REPLACE INTO docs (doc_id, source, page_content, metadata) VALUES (?, ?, ?, ?)", rows
+        )
+        conn.commit()
+
+    def delete(self, ids: List) -> None:
+        self._hidden.update(ids)
+
+    # --- MAINTENANCE ---
+
+    def sources(self) -> Dict[str, str]:
+        """doc_id -> book title for every stored chunk, in one query"""
+        return dict(self._connect().execute("SELECT doc_id, source FROM docs"))
+
+    def retain(self, live_ids: Iterable[str]):
+        """Delete rows that no committed base or segment references any more"""
+        conn = self._connect()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_ids (doc_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM live_ids")
+        conn.executemany("INSERT OR IGNORE INTO live_ids (doc_id) VALUES (?)", ((i,) for i in live_ids))
+        removed = conn.execute("DELETE FROM docs WHERE doc_id NOT IN (SELECT doc_id FROM live_ids)").rowcount
+        conn.execute("DELETE FROM live_ids")
+        conn.commit()
+        self._hidden.clear()
+        if removed:
+            logger.info(f"Removed {removed} deleted chunks from the docstore")
+        return removed
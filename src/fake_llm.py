@@ -0,0 +1,160 @@
+"""
+In-process fake of an OpenAI-compatible chat completions server
+
+Used by LLM_BACKEND=fake to load-test the whole chat path without network or a key.
+Replies are canned: the first entry of FAKE_LLM_RESPONSES (a JSON list of
+{"match": "...", "response": "..."}) whose match occurs in the last user message,
+else a fixed reply of FAKE_LLM_REPLY_WORDS words.
+
+Latency is shaped like a real model: time to first token is drawn from a log-normal
+around FAKE_LLM_TTFT_MS (spread FAKE_LLM_LATENCY_SIGMA), then words are produced at
+FAKE_LLM_TOKENS_PER_SEC. FAKE_LLM_ERROR_RATE of requests get a 429 with Retry-After,
+to exercise retries. Both streaming (SSE) and blocking responses are supported.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPLY = (
+    "This is a canned answer from the fake LLM backend. It stands in for the model "
+    "so chat throughput and tail latency can be measured without calling the real API."
+)
+
+_lock = threading.Lock()
+_server = None
+_server_pid = None
+
+def _load_responses():
+    path = config.FAKE_LLM_RESPONSES
+    if not path:
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Cannot read FAKE_LLM_RESPONSES {path}: {e}")
+        return []
+
+def _default_reply(words):
+    base = DEFAULT_REPLY.split()
+    return " ".join(base[i % len(base)] for i in range(words))
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, _Handler)
+        self.responses = _load_responses()
+        self.rng = random.Random(config.FAKE_LLM_SEED)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reply_for(self, messages):
+        question = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        for entry in self.responses:
+            if entry.get('match', '') in question:
+                return entry['response']
+        return _default_reply(config.FAKE_LLM_REPLY_WORDS)
+
+    def draw(self):
+        """(time to first token in seconds, whether to fail this request)"""
+        with self.rng_lock:
+            self.requests += 1
+            median = config.FAKE_LLM_TTFT_MS / 1000
+            ttft = median * math.exp(self.rng.gauss(0, config.FAKE_LLM_LATENCY_SIGMA))
+            fail = self.rng.random() < config.FAKE_LLM_ERROR_RATE
+        return ttft, fail
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'No route for {self.path}'}})
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Request body is not JSON'}})
+            return
+
+        ttft, fail = self.server.draw()
+        if fail:
+            self._send_json(429, {'error': {'message': 'Rate limit reached (fake)'}}, {'Retry-After': '1'})
+            return
+
+        reply = self.server.reply_for(body.get('messages', []))
+        words = reply.split(' ')
+        per_word = 1 / config.FAKE_LLM_TOKENS_PER_SEC if config.FAKE_LLM_TOKENS_PER_SEC > 0 else 0
+        time.sleep(ttft)
+
+        if not body.get('stream'):
+            time.sleep(per_word * len(words))
+            self._send_json(200, {
+                'id': 'fake-completion',
+                'object': 'chat.completion',
+                'model': body.get('model', 'fake-llm'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': {'completion_tokens': len(words)}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for i, word in enumerate(words):
+                delta = word if i == 0 else " " + word
+                chunk = {'choices': [{'index': 0, 'delta': {'content': delta}}]}
+                self._send_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                time.sleep(per_word)
+            self._send_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away mid-stream (cancelled request)
+            pass
+
+    def _send_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def ensure_fake_server() -> str:
+    """Start this process's fake server if needed and return its base URL"""
+    global _server, _server_pid
+    with _lock:
+        if _server is None or _server_pid != os.getpid():
+            _server = FakeLLMServer()
+            _server_pid = os.getpid()
+            threading.Thread(target=_server.serve_forever, name="fake-llm", daemon=True).start()
+            logger.info(f"Fake LLM server listening on {_server.url}")
+        return _server.url
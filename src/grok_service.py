@@ -2,70 +2,20 @@
 Grok API Service Integration (X.ai)
 """
 
-import requests
+import contextvars
 import json
 import logging
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator
 from src import config
+from src.llm_backends import make_backend
+from src.llm_gateway import LLMGateway, CircuitOpenError, GatewayBusyError, NETWORK_ERRORS
+from src.prompt_budget import count_messages, count_tokens, fit_chunks, fit_history, render_library_preamble, truncate_tokens
+from src.response_cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
-class GrokService:
-    def __init__(self):
-        self.api_key = config.GROK_API_KEY
-        self.base_url = config.GROK_BASE_URL
-        self.model = config.GROK_MODEL
-        self.headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-    
-    def _build_context(self, books_context: List[Dict], available_books_titles: List[str] = None) -> str:
-        """Build context from books for the AI"""
-        context = ""
-        
-        # Add list of available books first
-        if available_books_titles:
-            context += "=== AVAILABLE LIBRARY BOOKS ===\n"
-            context += "\n".join([f"- {title}" for title in available_books_titles])
-            context += "\n\n"
-        else:
-            context += "=== AVAILABLE LIBRARY BOOKS ===\n(No books found in library)\n\n"
-
-        if not books_context:
-            context += "=== RELEVANT BOOK CONTENT ===\n"
-            context += "⚠️ IMPORTANT: No relevant reference materials found in your uploaded library for this specific query.\n"
-            context += "INSTRUCTION: You MUST still answer the question using your general knowledge.\n"
-            context += "FORMAT: Start your response with: 'I could not find this topic in your uploaded references, but based on general knowledge:'\n"
-            context += "Then provide a comprehensive, accurate answer using your training data.\n"
-            return context
-        
-        context += "=== RELEVANT BOOK CONTENT ===\n"
-        for i, book in enumerate(books_context, 1):
-            # Content is already chunked by database.py
-            context += f"{i}. {book['title']}:\n{book['content']}\n\n"
-        
-        return context
-    
-    def _detect_language(self, message: str) -> str:
-        """Simple language detection: Arabic if contains Arabic script characters, otherwise English"""
-        if not message:
-            return "English"
-        # Check for Arabic script characters (Unicode range includes Arabic, Persian, etc)
-        is_arabic = any(ord(c) > 1000 for c in message)
-        return "Arabic" if is_arabic else "English"
-
-    def _call_grok_api(self, prompt: str, history: List[Dict] = None, enforce_lang: str = None) -> str:
-        """Make API call to Grok (x.ai) / Groq with history and retry logic"""
-        import time
-        max_retries = 3
-        retry_delay = 2
-        
-        # Use session for connection pooling
-        session = requests.Session()
-        
-        # Build the messages list starting with an enhanced system prompt
-        system_prompt = """You are SkillCode GPT, a world-class educational AI 'Detective' and Expert Tutor. 
+# Base system prompt shared by every assistant
+SYSTEM_PROMPT = """You are SkillCode GPT, a world-class educational AI 'Detective' and Expert Tutor. 
 
 === CRITICAL CONVERSATION RULES ===
 1. **CONTEXT AWARENESS**: Always read the FULL conversation history before responding. If the user says "give me examples" or "explain more" or "اعطنى امثله" or "وضح اكثر", they are asking about the PREVIOUS topic, NOT a new topic.
@@ -94,90 +44,301 @@ When explaining Arabic grammar (النحو العربي), use the correct Arabic
 2. Use Markdown formatting (headers, tables, bold).
 3. Cite sources when available (Book Name, Page Number).
 4. If no database info exists, use general knowledge but label it as "معرفة عامة" or "General Knowledge"."""
+
+# Messages containing these (or of 3 words or fewer) continue the previous topic
+FOLLOW_UP_INDICATORS = [
+    'examples', 'example', 'more', 'explain', 'details', 'continue',
+    'امثله', 'امثلة', 'مثال', 'اعطنى', 'اعطني', 'وضح', 'اشرح', 'اكثر', 'زيد', 'تفصيل', 'اكمل'
+]
+
+# Fallback texts _call_grok_api returns on failure; these are never cached
+ERROR_RESPONSE_MARKERS = (
+    "Sorry, I encountered an API error",
+    "Sorry, I'm having trouble connecting",
+    "Sorry, an unexpected error occurred",
+    "Sorry, I failed to get a response",
+    "Sorry, the AI server is busy",
+    "Sorry, the AI server is temporarily unavailable",
+)
+
+BUSY_RESPONSE = "Sorry, the AI server is busy right now. Please try again in a moment."
+UNAVAILABLE_RESPONSE = "Sorry, the AI server is temporarily unavailable. Please try again in a minute."
+
+# Per-call values _call_grok_api needs without threading them through every assistant:
+# 'user_id' (the gateway caps concurrent calls per user) and 'library_preamble'
+_current_call = contextvars.ContextVar('llm_call', default={})
+
+# 'prefix': system prompt + book list form a byte-identical first message and everything
+# that varies (hint, retrieved chunks, question, reminder) goes last, so OpenAI-compatible
+# servers with prefix caching (vLLM, llama.cpp) reuse the shared prefix across requests
+PROMPT_LAYOUTS = ('classic', 'prefix')
+
+class GrokService:
+    def __init__(self, embeddings=None, backend=None):
+        # Groq, any OpenAI-compatible URL, a self-hosted server or the fake (LLM_BACKEND)
+        self.backend = backend or make_backend()
+        self.model = self.backend.model
+        self.extra_payload = self.backend.extra_payload
+        layout = config.PROMPT_LAYOUT or self.backend.prompt_layout
+        self.prompt_layout = layout if layout in PROMPT_LAYOUTS else 'classic'
+        self.gateway = LLMGateway(self.backend)
+        logger.info(f"LLM backend: {self.backend.describe()}, {self.prompt_layout} prompt layout")
+        self.response_cache = None
+        if config.RESPONSE_CACHE_ENABLED:
+            embed_fn = embeddings.embed_query if (embeddings is not None and config.RESPONSE_CACHE_SEMANTIC) else None
+            self.response_cache = ResponseCache(
+                db_path=config.RESPONSE_CACHE_DB or None,
+                max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+                ttl=config.RESPONSE_CACHE_TTL,
+                embed_fn=embed_fn,
+                similarity=config.RESPONSE_CACHE_SIMILARITY
+            )
+
+    def gateway_stats(self) -> Dict:
+        """Queue depth, in-flight calls and wait times of this worker's LLM gateway"""
+        return self.gateway.stats()
+
+    def close(self):
+        """Stop the gateway's event loop and release pooled connections"""
+        self.gateway.close()
+
+    def reset_session(self):
+        """In a forked worker, drop the parent's gateway loop; a fresh one starts on first use"""
+        self.gateway.reset()
+    
+    def _build_context(self, books_context: List[Dict], available_books_titles: List[str] = None,
+                       library_preamble: str = None) -> str:
+        """Build context from books for the AI"""
+        # Add list of available books first (pre-rendered by the book catalog cache when given);
+        # the prefix layout puts it in the system message instead
+        if library_preamble is None:
+            library_preamble = render_library_preamble(available_books_titles)
+        context = library_preamble if self.prompt_layout == 'classic' else ""
+
+        if not books_context:
+            context += "=== RELEVANT BOOK CONTENT ===\n"
+            context += "⚠️ IMPORTANT: No relevant reference materials found in your uploaded library for this specific query.\n"
+            context += "INSTRUCTION: You MUST still answer the question using your general knowledge.\n"
+            context += "FORMAT: Start your response with: 'I could not find this topic in your uploaded references, but based on general knowledge:'\n"
+            context += "Then provide a comprehensive, accurate answer using your training data.\n"
+            return context
         
+        context += "=== RELEVANT BOOK CONTENT ===\n"
+        # Lowest-ranked chunks give way first
+        for i, book in enumerate(fit_chunks(books_context, config.PROMPT_CONTEXT_TOKENS), 1):
+            # Content is already chunked by database.py
+            context += f"{i}. {book['title']}:\n{book['content']}\n\n"
+        
+        return context
+    
+    def _detect_language(self, message: str) -> str:
+        """Simple language detection: Arabic if contains Arabic script characters, otherwise English"""
+        if not message:
+            return "English"
+        # Check for Arabic script characters (Unicode range includes Arabic, Persian, etc)
+        is_arabic = any(ord(c) > 1000 for c in message)
+        return "Arabic" if is_arabic else "English"
+
+    def _build_messages(self, prompt: str, history: List[Dict] = None, enforce_lang: str = None) -> List[Dict]:
+        """Assemble the OpenAI-style messages list (system prompt, history, prompt)"""
+        prefix_layout = self.prompt_layout == 'prefix'
+        # Build the messages list starting with an enhanced system prompt
         messages = [
             {
                 "role": "system",
-                "content": system_prompt
+                "content": self._static_prefix() if prefix_layout else SYSTEM_PROMPT
             }
         ]
 
         # Add history if available - ENHANCED to provide better context
+        history = fit_history(history, config.PROMPT_HISTORY_TOKENS)
+        context_hint = None
         if history:
             # Add a context summary for the AI
-            if len(history) > 0:
-                last_topic = history[-1]['user_message'] if history else ""
-                context_hint = f"[CONTEXT: The user's last question was about: '{last_topic[:100]}'. If the new message is short or asks for more/examples, it refers to this topic.]"
+            last_topic = history[-1]['user_message']
+            context_hint = f"[CONTEXT: The user's last question was about: '{last_topic[:100]}'. If the new message is short or asks for more/examples, it refers to this topic.]"
+            if prefix_layout:
+                # Folded into the final message so nothing variable precedes the history
+                prompt = f"{context_hint}\n\n{prompt}"
+            else:
                 messages.append({"role": "system", "content": context_hint})
-            
-            for chat in history:
-                messages.append({"role": "user", "content": chat['user_message']})
-                messages.append({"role": "assistant", "content": chat['ai_response']})
-
-        # Final safety check: Limit prompt length to avoid 413 errors
-        # 12,000 tokens is roughly 25,000-30,000 chars for Arabic/English mix
-        max_chars = 25000
-        if len(prompt) > max_chars:
-            logger.warning(f"Prompt too long ({len(prompt)} chars), truncating to {max_chars}")
-            prompt = prompt[:max_chars] + "... [Truncated for Context Limit]"
+
+        turns = []
+        for chat in history:
+            turns.append([
+                {"role": "user", "content": chat['user_message']},
+                {"role": "assistant", "content": chat['ai_response']}
+            ])
+
+        reminder = None
+        if enforce_lang:
+            reminder_text = f"REMINDER: You MUST respond in {enforce_lang} only."
+            if prefix_layout:
+                prompt = f"{prompt}\n\n{reminder_text}"
+            else:
+                reminder = {"role": "system", "content": reminder_text}
+
+        # Whole-request budget: drop the oldest turns, then shorten the prompt as a last resort
+        fixed = count_messages(messages) + (count_messages([reminder]) if reminder else 0)
+        prompt_tokens = count_tokens(prompt)
+        while turns and fixed + count_messages([m for turn in turns for m in turn]) + prompt_tokens > config.PROMPT_TOKEN_BUDGET:
+            turns.pop(0)
+        history_tokens = count_messages([m for turn in turns for m in turn])
+        room = config.PROMPT_TOKEN_BUDGET - fixed - history_tokens - 4
+        if prompt_tokens > room:
+            logger.warning(f"Prompt too long ({prompt_tokens} tokens), truncating to {room}")
+            prompt = truncate_tokens(prompt, room, " ... [Truncated for Context Limit]")
+
+        for turn in turns:
+            messages.extend(turn)
 
         # Add the current prompt
         messages.append({"role": "user", "content": prompt})
         
         # Add a final reinforcing rule if language is detected
-        if enforce_lang:
-            messages.append({"role": "system", "content": f"REMINDER: You MUST respond in {enforce_lang} only."})
-
-        for attempt in range(max_retries):
-            try:
-                # Grok/Groq API format (OpenAI compatible)
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "stream": False,
-                    "temperature": 0.7
-                }
-                
-                api_url = f"{self.base_url}/chat/completions"
-                
-                logger.info(f"Calling API (Attempt {attempt+1}) with model: {self.model} (Lang: {enforce_lang})")
-                
-                response = session.post(
-                    api_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=45 # Slightly shorter timeout to catch hangs
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return data['choices'][0]['message']['content']
-                else:
-                    error_msg = response.json().get('error', {}).get('message', 'Unknown error')
-                    logger.error(f"API error (Status: {response.status_code}): {error_msg}")
-                    if response.status_code in [429, 500, 502, 503, 504]:
-                        time.sleep(retry_delay * (attempt + 1))
-                        continue
-                    return f"Sorry, I encountered an API error (Status: {response.status_code}). Error: {error_msg}"
-            
-            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError) as e:
-                logger.error(f"Network error on attempt {attempt+1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay * (attempt + 1))
+        if reminder:
+            messages.append(reminder)
+
+        logger.info(
+            f"Prompt tokens: {count_messages(messages)} of {config.PROMPT_TOKEN_BUDGET} "
+            f"(history {history_tokens} in {len(turns)} turns, prompt {count_tokens(prompt)})"
+        )
+        return messages
+
+    def _static_prefix(self) -> str:
+        """System prompt + book list: identical bytes on every call until the catalog changes"""
+        library_preamble = _current_call.get().get('library_preamble')
+        if not library_preamble:
+            return SYSTEM_PROMPT
+        return f"{SYSTEM_PROMPT}\n\n{library_preamble.rstrip()}"
+
+    def _call_grok_api(self, prompt: str, history: List[Dict] = None, enforce_lang: str = None, stream: bool = False):
+        """Make API call to Grok (x.ai) / Groq with history; the gateway handles retries.
+
+        With stream=True a generator of text deltas is returned instead of the full string.
+        """
+        messages = self._build_messages(prompt, history, enforce_lang)
+        user = _current_call.get().get('user_id')
+        if stream:
+            return self._stream_grok_api(messages, enforce_lang, user)
+
+        # Grok/Groq API format (OpenAI compatible)
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": False,
+            "temperature": 0.7,
+            **self.extra_payload
+        }
+        logger.info(f"Calling API with model: {self.model} (Lang: {enforce_lang})")
+
+        try:
+            # Runs on the gateway's event loop; this thread only waits for the result
+            response = self.gateway.post(payload, user=user, timeout=45)
+            if response.status_code == 200:
+                data = response.json()
+                return data['choices'][0]['message']['content']
+            error_msg = self._error_message(response)
+            logger.error(f"API error (Status: {response.status_code}): {error_msg}")
+            if response.status_code in (429, 500, 502, 503, 504):
+                return "Sorry, I failed to get a response after multiple attempts. Please check your internet connection."
+            return f"Sorry, I encountered an API error (Status: {response.status_code}). Error: {error_msg}"
+        except GatewayBusyError:
+            return BUSY_RESPONSE
+        except CircuitOpenError:
+            # The gateway saw repeated upstream failures and is failing fast for now
+            return UNAVAILABLE_RESPONSE
+        except NETWORK_ERRORS as e:
+            return f"Sorry, I'm having trouble connecting to the AI server. (Error: {str(e)})"
+        except Exception as e:
+            logger.error(f"Unexpected API error: {str(e)}", exc_info=True)
+            return f"Sorry, an unexpected error occurred: {str(e)}"
+
+    def _error_message(self, response) -> str:
+        """Error text from an API error body, which is not always JSON"""
+        try:
+            return response.json().get('error', {}).get('message', 'Unknown error')
+        except ValueError:
+            return response.text[:200] or 'Unknown error'
+
+    def _stream_grok_api(self, messages: List[Dict], enforce_lang: str = None, user=None) -> Iterator[str]:
+        """Stream a chat completion, yielding text deltas from the SSE chunks as they arrive.
+
+        Retries only happen before the first token is yielded; errors are yielded as text
+        so the caller always gets something to show, same as the blocking call.
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": True,
+            "temperature": 0.7,
+            **self.extra_payload
+        }
+        logger.info(f"Streaming API with model: {self.model} (Lang: {enforce_lang})")
+
+        # (connect timeout, read timeout between chunks)
+        lines = self.gateway.stream(payload, user=user, timeout=(10, 45))
+        try:
+            response = next(lines)
+            if response.status_code != 200:
+                error_msg = self._error_message(response)
+                logger.error(f"API error (Status: {response.status_code}): {error_msg}")
+                yield f"Sorry, I encountered an API error (Status: {response.status_code}). Error: {error_msg}"
+                return
+
+            for line in lines:
+                # SSE frames look like "data: {...}"; blank lines and comments are keep-alives
+                if not line or not line.startswith('data:'):
                     continue
-                return f"Sorry, I'm having trouble connecting to the AI server. (Error: {str(e)})"
-            except Exception as e:
-                logger.error(f"Unexpected API error: {str(e)}", exc_info=True)
-                return f"Sorry, an unexpected error occurred: {str(e)}"
-        
-        return "Sorry, I failed to get a response after multiple attempts. Please check your internet connection."
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    return
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    logger.warning(f"Skipping malformed stream chunk: {data[:100]}")
+                    continue
+                choices = chunk.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    yield delta
+
+        except GatewayBusyError:
+            yield BUSY_RESPONSE
+        except CircuitOpenError:
+            yield UNAVAILABLE_RESPONSE
+        except NETWORK_ERRORS as e:
+            logger.error(f"Network error on stream: {str(e)}")
+            yield f"\n\nSorry, I'm having trouble connecting to the AI server. (Error: {str(e)})"
+        except StopIteration:
+            yield "Sorry, I failed to get a response after multiple attempts. Please check your internet connection."
+        except Exception as e:
+            logger.error(f"Unexpected streaming error: {str(e)}", exc_info=True)
+            yield f"Sorry, an unexpected error occurred: {str(e)}"
+        finally:
+            # Cancels the upstream call if the client went away mid-stream
+            lines.close()
 
     def get_response(self, message: str, assistant_type: str = 'general',
                     books_context: List[Dict] = None,
                     custom_params: Dict = None,
                     available_books_titles: List[str] = None,
-                    chat_history: List[Dict] = None) -> str:
-        """Get response from appropriate assistant"""
+                    chat_history: List[Dict] = None,
+                    stream: bool = False,
+                    library_preamble: str = None,
+                    user_id=None):
+        """Get response from appropriate assistant (an iterator of text deltas if stream=True)"""
+        if library_preamble is None:
+            library_preamble = render_library_preamble(available_books_titles)
+        token = _current_call.set({'user_id': user_id, 'library_preamble': library_preamble})
+        try:
+            return self._get_response(message, assistant_type, books_context, custom_params,
+                                      available_books_titles, chat_history, stream, library_preamble)
+        finally:
+            _current_call.reset(token)
+
+    def _get_response(self, message, assistant_type, books_context, custom_params,
+                      available_books_titles, chat_history, stream, library_preamble):
         
         if books_context is None:
             books_context = []
@@ -188,39 +349,80 @@ When explaining Arabic grammar (النحو العربي), use the correct Arabic
         if chat_history is None:
             chat_history = []
         
-        context = self._build_context(books_context, available_books_titles)
+        context = self._build_context(books_context, available_books_titles, library_preamble)
         lang_name = self._detect_language(message)
-        
+
+        # Follow-ups depend on chat_history, so they always go to the model
+        if self.response_cache is None or self._is_follow_up(message, chat_history):
+            if self.response_cache is not None:
+                self.response_cache.record_bypass()
+            return self._dispatch(message, assistant_type, context, custom_params, chat_history, lang_name, stream)
+
+        scope = self.response_cache.make_scope(assistant_type, lang_name, books_context, custom_params)
+        cached = self.response_cache.get(message, scope)
+        if cached is not None:
+            logger.info(f"Response cache hit for: {message[:50]}")
+            return iter([cached]) if stream else cached
+
+        result = self._dispatch(message, assistant_type, context, custom_params, chat_history, lang_name, stream)
+        if stream:
+            return self._cache_stream(result, message, scope)
+        if self._is_cacheable(result):
+            self.response_cache.set(message, scope, result)
+        return result
+
+    def _dispatch(self, message: str, assistant_type: str, context: str, custom_params: Dict,
+                  chat_history: List[Dict], lang_name: str, stream: bool = False):
+        """Route to the assistant-specific prompt"""
         if assistant_type == 'general':
-            return self._general_assistant(message, context, chat_history, lang_name)
+            return self._general_assistant(message, context, chat_history, lang_name, stream=stream)
         elif assistant_type == 'homework':
-            return self._homework_assistant(message, context, custom_params, chat_history, lang_name)
+            return self._homework_assistant(message, context, custom_params, chat_history, lang_name, stream=stream)
         elif assistant_type == 'exam':
-            return self._exam_assistant(message, context, custom_params, chat_history, lang_name)
+            return self._exam_assistant(message, context, custom_params, chat_history, lang_name, stream=stream)
         elif assistant_type == 'study_plan':
-            return self._study_planner(message, context, custom_params, chat_history, lang_name)
+            return self._study_planner(message, context, custom_params, chat_history, lang_name, stream=stream)
         elif assistant_type == 'tutor':
-            return self._tutor_assistant(message, context, custom_params, chat_history, lang_name)
+            return self._tutor_assistant(message, context, custom_params, chat_history, lang_name, stream=stream)
         elif assistant_type == 'mind_map':
-            return self._mind_mapper(message, context, chat_history, lang_name)
+            return self._mind_mapper(message, context, chat_history, lang_name, stream=stream)
         else:
-            return self._general_assistant(message, context, chat_history, lang_name)
+            return self._general_assistant(message, context, chat_history, lang_name, stream=stream)
+
+    def _is_follow_up(self, message: str, history: List[Dict] = None) -> bool:
+        """True if the message refers back to the previous turn"""
+        if not history:
+            return False
+        return len(message.split()) <= 3 or any(ind in message.lower() for ind in FOLLOW_UP_INDICATORS)
+
+    def _is_cacheable(self, response: str) -> bool:
+        # A stream can fail after partial output, so look for the error text anywhere
+        return bool(response) and not any(marker in response for marker in ERROR_RESPONSE_MARKERS)
+
+    def _cache_stream(self, deltas: Iterator[str], message: str, scope: str) -> Iterator[str]:
+        """Pass a stream through and cache the full text once it completes"""
+        parts = []
+        for delta in deltas:
+            parts.append(delta)
+            yield delta
+        response = "".join(parts)
+        if self._is_cacheable(response):
+            self.response_cache.set(message, scope, response)
+
+    def cache_stats(self) -> Dict:
+        return self.response_cache.stats() if self.response_cache is not None else {}
     
-    def _general_assistant(self, message: str, context: str, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _general_assistant(self, message: str, context: str, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """High-intelligence educational AI that prioritizes literal evidence with subject focus"""
         
         # Immediate response for simple social prompts
         social_prompts = ['hello', 'hi', 'hey', 'thanks', 'thank you', 'how are you', 'مرحبا', 'اهلا', 'شكرا']
         if message.lower().strip() in social_prompts:
             p = f"The student said '{message}'. Reply like a friendly, expert tutor in one sentence in {'Arabic' if lang_name == 'Arabic' else 'English'}."
-            return self._call_grok_api(p, history, enforce_lang=lang_name)
+            return self._call_grok_api(p, history, enforce_lang=lang_name, stream=stream)
 
         # Detect follow-up questions and enrich message with context
-        follow_up_indicators = [
-            'examples', 'example', 'more', 'explain', 'details', 'continue',
-            'امثله', 'امثلة', 'مثال', 'اعطنى', 'اعطني', 'وضح', 'اشرح', 'اكثر', 'زيد', 'تفصيل', 'اكمل'
-        ]
-        is_follow_up = len(message.split()) <= 3 or any(ind in message.lower() for ind in follow_up_indicators)
+        is_follow_up = len(message.split()) <= 3 or any(ind in message.lower() for ind in FOLLOW_UP_INDICATORS)
         
         # If it's a follow-up and we have history, enrich the message
         enriched_message = message
@@ -277,10 +479,10 @@ You MUST respond in **{lang_name}**.
 
 Answer:"""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
 
     
-    def _homework_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _homework_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """Homework solver with customization"""
         edu_level = params.get('edu_level', 'high school')
         subject = params.get('subject', '')
@@ -305,9 +507,9 @@ Instructions:
 3. If the context is missing or insufficient for this specific math/science problem, solve it using your general knowledge but state: '[General Method - Not from Textbooks]'.
 4. You MUST respond in **{lang_name}**."""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
     
-    def _exam_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _exam_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """Exam and quiz preparation assistant"""
         prompt = f"""You are helping a student prepare for exams. 
         
@@ -324,9 +526,9 @@ Provide a comprehensive study guide that includes:
 
 You MUST respond in **{lang_name}**."""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
     
-    def _study_planner(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _study_planner(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """Generate adaptive study plans"""
         subject = params.get('subject', '')
         daily_hours = params.get('daily_hours', 2)
@@ -347,9 +549,9 @@ Create a detailed, day-by-day adaptive study plan that allocates topics correctl
 
 You MUST respond in **{lang_name}**."""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
     
-    def _tutor_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _tutor_assistant(self, message: str, context: str, params: Dict, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """Virtual tutor that explains and references materials"""
         prompt = f"""You are a virtual tutor helping a student learn using specific study materials.
         
@@ -365,9 +567,9 @@ Instructions:
 4. If the materials do not cover the topic, state that clearly.
 5. You MUST respond in **{lang_name}**."""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
     
-    def _mind_mapper(self, message: str, context: str, history: List[Dict] = None, lang_name: str = 'English') -> str:
+    def _mind_mapper(self, message: str, context: str, history: List[Dict] = None, lang_name: str = 'English', stream: bool = False):
         """Generate professional visual mind maps using Mermaid.js"""
         prompt = f"""You are a 'Visual Learning Expert'. Your goal is to create a professional Mind Map for: '{message}'.
         
@@ -404,7 +606,7 @@ graph TD
 
 Respond in the language of the USER'S QUESTION ({lang_name}). High-Quality Visual Response:"""
         
-        return self._call_grok_api(prompt, history, enforce_lang=lang_name)
+        return self._call_grok_api(prompt, history, enforce_lang=lang_name, stream=stream)
     
     def generate_exam(self, params: Dict, books_context: List[Dict]) -> str:
         """Generate exam questions"""
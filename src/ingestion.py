@@ -0,0 +1,330 @@
+"""
+Parallel, resumable book ingestion
+
+Pages are extracted by a pool of OCR worker processes (one RapidOCR engine per worker)
+and checkpointed in SQLite as they finish, so an interrupted run resumes instead of
+restarting. Finished books are embedded and indexed in batches.
+
+run_ingestion() is the entry point for the scheduler and CLIs: it runs the pipeline only
+in the process holding the vector store lease and records the run for the status endpoint.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from src import config
+from src.leader import LeaderLease
+from src.ocr_utils import init_ocr_worker, ocr_page, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+# A book that takes down its OCR worker this many times while extracted on its own is failed
+POOL_CRASHES_PER_BOOK = 2
+
+def find_pdfs(books_dir):
+    """All PDFs under books_dir (recursive), in a stable order"""
+    pdf_files = []
+    for root, dirs, files in os.walk(books_dir):
+        for f in files:
+            if f.endswith('.pdf'):
+                pdf_files.append(os.path.join(root, f))
+    return sorted(pdf_files)
+
+def book_title(file_path, books_dir):
+    """Title of a book: its path under books_dir, so same-named PDFs in different folders stay apart"""
+    return os.path.relpath(file_path, books_dir).replace(os.sep, '/')
+
+def file_md5(file_path, block_size=1024 * 1024):
+    """MD5 of a file, streamed in blocks so large PDFs are never read whole"""
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def run_ingestion(db, books_dir, trigger='manual', workers=None):
+    """
+    Run the pipeline if no other process is writing the vector store.
+    Returns the stats dict, or None when another process holds the lease.
+    """
+    lease = LeaderLease(db.sql_db)
+    if not lease.acquire():
+        holder = lease.holder() or {}
+        logger.info(f"Skipping ingestion: the vector store lease is held by {holder.get('owner', 'another process')}")
+        return None
+    with lease:
+        # The previous holder (full sync, index rebuild) may have committed or compacted since
+        # this process loaded the store; writing from the old manifest would undo that
+        if db.vector_db.refresh():
+            logger.info("Reloaded the vector store committed by the previous lease holder")
+        run_id = db.sql_db.start_ingest_run(lease.owner, trigger)
+        pipeline = IngestionPipeline(db, workers=workers, lease=lease)
+        try:
+            stats = pipeline.run(books_dir)
+        except Exception as e:
+            db.sql_db.finish_ingest_run(run_id, 'failed', pipeline.stats, str(e))
+            raise
+        db.sql_db.finish_ingest_run(run_id, 'completed', stats)
+        _compact_vector_store(db, lease)
+        return stats
+
+def _compact_vector_store(db, lease):
+    """Leave a single base behind, so readers mmap it and keep chunks in docstore.db"""
+    try:
+        if db.vector_db.needs_compaction():
+            lease.check()
+            db.vector_db.compact()
+    except Exception as e:
+        logger.warning(f"Vector store compaction after ingestion failed, the next run retries: {e}")
+
+class IngestionPipeline:
+    def __init__(self, db, workers=None, embed_batch_books=None, lease=None):
+        """
+        db is the unified src.database.Database (checkpoints live in its SQLite store).
+        lease, if given, is checked before every vector store write.
+        """
+        self.db = db
+        self.sql_db = db.sql_db
+        self.lease = lease
+        self.workers = max(1, workers or config.INGEST_WORKERS)
+        self.embed_batch_books = max(1, embed_batch_books or config.INGEST_EMBED_BATCH_BOOKS)
+        self._batch = []
+        self._indexed_hashes = {}
+        self.books_dir = None
+        self.stats = {}
+
+    def run(self, books_dir):
+        """Ingest every PDF under books_dir; returns a stats dict"""
+        started = time.time()
+        self.stats = {'books': 0, 'indexed': 0, 'unchanged': 0, 'skipped': 0, 'empty': 0, 'failed': 0, 'pages': 0, 'chunks': 0}
+        self._batch = []
+        self.books_dir = books_dir
+        # Content hashes of what is already indexed; unchanged files are skipped entirely
+        self._indexed_hashes = self.db.get_book_hashes()
+        embed_before = self.db.vector_db.embedding_stats()
+
+        resuming = self.sql_db.begin_ingest_run()
+        if resuming:
+            logger.info("Resuming unfinished ingestion run from checkpoints")
+
+        pdf_files = find_pdfs(books_dir)
+        self.stats['books'] = len(pdf_files)
+        if not pdf_files:
+            logger.info("No PDF files found to upload")
+            return self.stats
+        logger.info(f"Found {len(pdf_files)} PDF files to process (recursive)")
+
+        # book -> page indexes still to extract
+        remaining = {}
+        for file_path in pdf_files:
+            missing = self._plan_book(file_path)
+            if missing is None:
+                continue
+            if missing:
+                remaining[file_path] = set(missing)
+            else:
+                # Every page was checkpointed before the last run stopped
+                self._finish_book(file_path)
+
+        if remaining:
+            self._extract_pages(remaining)
+
+        self._flush_batch()
+        self.db.vector_db.close_embed_pool()
+        embed_after = self.db.vector_db.embedding_stats()
+        chunks = embed_after['chunks'] - embed_before['chunks']
+        embed_seconds = embed_after['seconds'] - embed_before['seconds']
+        self.stats['chunks'] = chunks
+        elapsed = time.time() - started
+        logger.info(
+            f"Book ingestion completed in {elapsed:.1f}s: {self.stats['indexed']} indexed, "
+            f"{self.stats['unchanged']} unchanged, {self.stats['skipped']} skipped, {self.stats['empty']} empty, "
+            f"{self.stats['failed']} failed, {self.stats['pages']} pages extracted, "
+            f"{chunks} chunks embedded ({chunks / embed_seconds if embed_seconds else 0.0:.1f} chunks/sec)"
+        )
+        return self.stats
+
+    # --- PLANNING ---
+
+    def _plan_book(self, file_path):
+        """Checkpoint a book and return the page indexes still missing (None = nothing to do)"""
+        title = book_title(file_path, self.books_dir)
+        state = self.sql_db.get_ingest_state(file_path)
+        if state and state['status'] in ('indexed', 'empty', 'failed'):
+            self.stats['skipped'] += 1
+            return None
+
+        try:
+            md5_hash = file_md5(file_path)
+            if self._indexed_hashes.get(title) == md5_hash:
+                self.stats['unchanged'] += 1
+                return None
+            page_count = pdf_page_count(file_path)
+        except Exception as e:
+            logger.error(f"❌ Cannot open {title}: {e}")
+            self.sql_db.set_ingest_state(file_path, title, 0, 'failed')
+            self.stats['failed'] += 1
+            return None
+
+        if state and (state['page_count'] != page_count or state.get('md5_hash') != md5_hash):
+            # The file changed since it was checkpointed
+            self.sql_db.reset_ingest(file_path)
+            state = None
+
+        done = self.sql_db.get_ingest_pages(file_path) if state else {}
+        self.sql_db.set_ingest_state(file_path, title, page_count, 'ocr', md5_hash)
+        missing = [i for i in range(page_count) if i not in done]
+        if done:
+            logger.info(f"{title}: {len(done)}/{page_count} pages already extracted")
+        return missing
+
+    # --- PAGE EXTRACTION ---
+
+    def _extract_pages(self, remaining):
+        tasks = [(file_path, i) for file_path in remaining for i in sorted(remaining[file_path])]
+        logger.info(f"Extracting {len(tasks)} pages with {self.workers} worker(s)")
+
+        if self.workers == 1:
+            init_ocr_worker()
+            for file_path, page_index in tasks:
+                if file_path not in remaining:
+                    continue
+                try:
+                    result = ocr_page(file_path, page_index)
+                except Exception as e:
+                    self._fail_book(file_path, remaining, e)
+                    continue
+                self._page_done(file_path, result, remaining)
+            return
+
+        crashes = {}
+        while remaining:
+            suspects = self._run_pool(remaining)
+            if not suspects:
+                break
+            # A worker died (e.g. OCR ran out of memory); the culprit is one of the books in flight.
+            # Each is retried on its own, so a crash only counts against the book that caused it
+            logger.warning(f"OCR worker pool broke; retrying {len(suspects)} book(s) in flight one at a time")
+            for file_path in sorted(suspects):
+                while file_path in remaining:
+                    alone = {file_path: remaining[file_path]}
+                    if not self._run_pool(alone, workers=1):
+                        # Finished (or failed on a page error) without taking the worker down
+                        remaining.pop(file_path, None)
+                        break
+                    crashes[file_path] = crashes.get(file_path, 0) + 1
+                    if crashes[file_path] >= POOL_CRASHES_PER_BOOK:
+                        self._fail_book(file_path, remaining, "an OCR worker process died while extracting it")
+
+    def _run_pool(self, remaining, workers=None):
+        """
+        Extract the remaining pages with a process pool. Returns the books that had pages in
+        flight if the pool broke (their finished pages stay checkpointed), else None.
+        """
+        workers = workers or self.workers
+        tasks = [(file_path, i) for file_path in remaining for i in sorted(remaining[file_path])]
+        # Spawned workers avoid forking a process that already holds models and threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_ocr_worker) as pool:
+            task_iter = iter(tasks)
+            in_flight = {}
+
+            def submit_next():
+                for file_path, page_index in task_iter:
+                    if file_path in remaining:
+                        in_flight[pool.submit(ocr_page, file_path, page_index)] = file_path
+                        return
+
+            try:
+                # Keep a bounded number of pages queued so results are checkpointed as we go
+                for _ in range(workers * 2):
+                    submit_next()
+
+                while in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = in_flight[future]
+                        if file_path in remaining:
+                            try:
+                                result = future.result()
+                            except BrokenProcessPool:
+                                raise
+                            except Exception as e:
+                                self._fail_book(file_path, remaining, e)
+                            else:
+                                try:
+                                    self._page_done(file_path, result, remaining)
+                                except Exception as e:
+                                    self._fail_book(file_path, remaining, e)
+                        del in_flight[future]
+                        submit_next()
+            except BrokenProcessPool:
+                return {file_path for file_path in in_flight.values() if file_path in remaining}
+        return None
+
+    def _page_done(self, file_path, result, remaining):
+        page_index, text = result
+        self.sql_db.save_ingest_page(file_path, page_index, text)
+        self.stats['pages'] += 1
+        pages_left = remaining[file_path]
+        pages_left.discard(page_index)
+        if not pages_left:
+            del remaining[file_path]
+            self._finish_book(file_path)
+
+    def _fail_book(self, file_path, remaining, error):
+        title = book_title(file_path, self.books_dir)
+        logger.error(f"❌ Error processing {title}: {error}")
+        remaining.pop(file_path, None)
+        state = self.sql_db.get_ingest_state(file_path) or {}
+        self.sql_db.set_ingest_state(file_path, title, state.get('page_count', 0), 'failed')
+        self.stats['failed'] += 1
+
+    # --- INDEXING ---
+
+    def _finish_book(self, file_path):
+        """All pages extracted: assemble the text and queue it for batched embedding"""
+        title = book_title(file_path, self.books_dir)
+        pages = self.sql_db.get_ingest_pages(file_path)
+        full_text = "".join(pages[i] for i in sorted(pages))
+        state = self.sql_db.get_ingest_state(file_path) or {}
+        page_count = state.get('page_count', len(pages))
+
+        if not full_text.strip():
+            logger.warning(f"No text extracted from {title}")
+            self.sql_db.set_ingest_state(file_path, title, page_count, 'empty')
+            self.stats['empty'] += 1
+            return
+
+        self.sql_db.set_ingest_state(file_path, title, page_count, 'ocr_done')
+        self._batch.append({
+            'title': title,
+            'file_path': file_path,
+            'content': full_text,
+            'page_count': page_count,
+            'md5_hash': state.get('md5_hash')
+        })
+        if len(self._batch) >= self.embed_batch_books:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        if not self._batch:
+            return
+        if self.lease is not None:
+            # Books stay checkpointed as 'ocr_done', so the next leader indexes them
+            self.lease.check()
+        batch, self._batch = self._batch, []
+        success = self.db.add_books(batch)
+        status = 'indexed' if success else 'failed'
+        for book in batch:
+            self.sql_db.set_ingest_state(book['file_path'], book['title'], book['page_count'], status)
+            if success:
+                logger.info(f"✅ Successfully uploaded: {book['title']}")
+            else:
+                logger.error(f"❌ Failed to index: {book['title']}")
+        self.stats[status] += len(batch)
@@ -0,0 +1,96 @@
+"""
+Leader election through a lease row in SQLite
+
+Every gunicorn worker (and any CLI started by hand) may try to write the vector store;
+only the process holding the lease does. The holder renews the lease from a heartbeat
+thread, so if it dies the lease expires after LEADER_LEASE_TTL seconds and the next
+attempt takes over. A row in the shared database works across processes on any
+platform, and its state is what the ingestion status endpoint reports.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+# One lease guards every writer of vector_store/ (nightly ingestion, full sync, index rebuild)
+VECTOR_STORE_LEASE = "vector_store"
+
+class LeaseLostError(RuntimeError):
+    """The lease expired and may belong to another process; stop writing"""
+
+class LeaderLease:
+    def __init__(self, sql_db, name=VECTOR_STORE_LEASE, ttl=None, heartbeat=None):
+        self.sql_db = sql_db
+        self.name = name
+        self.ttl = ttl or config.LEADER_LEASE_TTL
+        self.heartbeat = heartbeat or config.LEADER_LEASE_HEARTBEAT
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._held = False
+        self._expires_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def held(self):
+        """False once a heartbeat found the lease taken, or renewals failed until it expired"""
+        return self._held and time.time() < self._expires_at
+
+    def acquire(self):
+        """Try once; on success a heartbeat thread keeps the lease alive until release()"""
+        started = time.time()
+        if not self.sql_db.acquire_lease(self.name, self.owner, self.ttl):
+            return False
+        self._held = True
+        self._expires_at = started + self.ttl
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._beat, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"Acquired lease '{self.name}' as {self.owner}")
+        return True
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._held:
+            self._held = False
+            self.sql_db.release_lease(self.name, self.owner)
+            logger.info(f"Released lease '{self.name}'")
+
+    def check(self):
+        """Raise LeaseLostError unless the lease is still ours (call before each write)"""
+        if not self.held:
+            raise LeaseLostError(f"Lease '{self.name}' was lost")
+
+    def holder(self):
+        """Current lease row (owner, timestamps), or None if free"""
+        return self.sql_db.get_lease(self.name)
+
+    def _beat(self):
+        while not self._stop.wait(self.heartbeat):
+            started = time.time()
+            try:
+                renewed = self.sql_db.renew_lease(self.name, self.owner, self.ttl)
+            except Exception as e:
+                # Keep trying until the TTL runs out; a locked database is usually transient
+                logger.warning(f"Lease '{self.name}' heartbeat failed: {e}")
+                continue
+            if not renewed:
+                logger.error(f"Lost lease '{self.name}'; another process may have taken over")
+                self._held = False
+                return
+            self._expires_at = started + self.ttl
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
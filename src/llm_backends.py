@@ -0,0 +1,93 @@
+"""
+LLM backends selectable with LLM_BACKEND
+
+Every backend is an OpenAI-compatible /chat/completions endpoint, so they differ only in
+where requests go and what extra fields they carry:
+
+- groq:   the hosted Groq API (GROK_* settings)
+- openai: any OpenAI-compatible provider or gateway (LLM_BASE_URL, LLM_MODEL, LLM_API_KEY)
+- local:  a self-hosted llama.cpp / vLLM server (LOCAL_LLM_*), with prompt caching
+- fake:   an in-process stub server with canned, latency-shaped replies (FAKE_LLM_*),
+          for load tests and CI without network or a key
+"""
+
+import logging
+from typing import Dict
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+class LLMBackend:
+    name = None
+    # Prompt layout used when PROMPT_LAYOUT is not set (see grok_service.PROMPT_LAYOUTS)
+    prompt_layout = 'classic'
+
+    def __init__(self, base_url, model, api_key=None, extra_payload=None):
+        self._base_url = base_url.rstrip('/')
+        self.model = model
+        self.api_key = api_key
+        self.extra_payload = extra_payload or {}
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
+
+    def headers(self) -> Dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def describe(self) -> str:
+        return f"{self.name} ({self.model})"
+
+class GroqBackend(LLMBackend):
+    name = 'groq'
+
+    def __init__(self):
+        super().__init__(config.GROK_BASE_URL, config.GROK_MODEL, config.GROK_API_KEY)
+
+class OpenAICompatibleBackend(LLMBackend):
+    name = 'openai'
+
+    def __init__(self):
+        super().__init__(config.LLM_BASE_URL, config.LLM_MODEL, config.LLM_API_KEY)
+
+class LocalBackend(LLMBackend):
+    name = 'local'
+    prompt_layout = 'prefix'
+
+    def __init__(self):
+        extra_payload = {}
+        if config.LOCAL_LLM_CACHE_PROMPT:
+            # llama.cpp keeps the KV cache of the matching prefix; vLLM ignores the field
+            extra_payload['cache_prompt'] = True
+        super().__init__(config.LOCAL_LLM_BASE_URL, config.LOCAL_LLM_MODEL, config.LOCAL_LLM_API_KEY, extra_payload)
+
+class FakeBackend(LLMBackend):
+    name = 'fake'
+
+    def __init__(self):
+        super().__init__("http://127.0.0.1", "fake-llm")
+
+    @property
+    def base_url(self) -> str:
+        # Started on first use in each process, so forked workers get their own server
+        from src.fake_llm import ensure_fake_server
+        return ensure_fake_server()
+
+BACKENDS = {
+    'groq': GroqBackend,
+    'openai': OpenAICompatibleBackend,
+    'local': LocalBackend,
+    'fake': FakeBackend,
+}
+
+def make_backend(name=None) -> LLMBackend:
+    """Backend named by LLM_BACKEND (or name); unknown names fall back to groq"""
+    name = (name or config.LLM_BACKEND).lower()
+    if name not in BACKENDS:
+        logger.warning(f"Unknown LLM_BACKEND '{name}', using groq")
+        name = 'groq'
+    return BACKENDS[name]()
@@ -0,0 +1,406 @@
+"""
+Asyncio gateway for LLM completions
+
+Each worker process runs one event loop on a daemon thread with a shared httpx.AsyncClient.
+Request threads hand their completion to the loop and wait on the result, so the upstream
+I/O and retry back-off of every in-flight chat is multiplexed on the loop instead of each
+call owning a blocking socket and sleeping in place.
+
+Admission control:
+- a process-wide limit on in-flight upstream calls (LLM_MAX_CONCURRENCY)
+- a per-user limit (LLM_MAX_PER_USER) so one student's tabs cannot take every slot
+- a bounded wait queue (LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT); past it callers get
+  GatewayBusyError right away instead of piling up behind a slow upstream
+
+Each upstream attempt also passes the resilience policy in src/llm_resilience.py: a
+circuit breaker, RPM/TPM token buckets, and jittered back-off that honours Retry-After.
+
+stats() reports queue depth, in-flight calls, wait times and keep-alive connection reuse
+for the status endpoint.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterator
+
+import httpx
+
+from src import config
+from src.llm_resilience import (CircuitBreaker, CircuitOpenError, RateLimiter, RateLimitWaitError,
+                                backoff_delay, parse_retry_after)
+from src.prompt_budget import count_messages
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth retrying (rate limited / temporarily unavailable)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Network failures retried like the statuses above
+NETWORK_ERRORS = (httpx.TransportError,)
+
+__all__ = ['LLMGateway', 'GatewayBusyError', 'CircuitOpenError', 'NETWORK_ERRORS', 'RETRY_STATUSES']
+
+class GatewayBusyError(RuntimeError):
+    """Too many completions queued in this worker; the caller should ask the user to retry"""
+
+class LLMGateway:
+    def __init__(self, backend, max_concurrency=None, max_per_user=None,
+                 max_queue=None, queue_timeout=None, max_retries=None):
+        self.backend = backend
+        self.max_concurrency = max_concurrency or config.LLM_MAX_CONCURRENCY
+        self.max_per_user = max_per_user or config.LLM_MAX_PER_USER
+        self.max_queue = config.LLM_MAX_QUEUE if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout or config.LLM_QUEUE_TIMEOUT
+        self.max_retries = max_retries or config.LLM_MAX_RETRIES
+        self._lock = threading.Lock()
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._reset_state()
+
+    def _reset_state(self):
+        # Only touched from the loop thread, except for reads in stats()
+        self._slots = None
+        self.limiter = RateLimiter()
+        self.breaker = CircuitBreaker()
+        self._user_slots = {}
+        self._user_refs = {}
+        self._waiting = 0
+        self._in_flight = 0
+        self._metrics = {
+            'requests': 0, 'admitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'retries': 0,
+            'peak_waiting': 0, 'peak_in_flight': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            'upstream_requests': 0, 'connections_opened': 0
+        }
+
+    # --- EVENT LOOP ---
+
+    def _ensure_loop(self):
+        """Start the loop thread on first use, and again in a forked worker"""
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            # A loop inherited over fork has no thread behind it; start over
+            self._reset_state()
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+            thread.start()
+            self._loop, self._thread, self._pid = loop, thread, os.getpid()
+            asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+            return loop
+
+    async def _open(self):
+        # asyncio primitives and the client must be created on the loop that uses them
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        socket_options = None
+        if config.GROK_TCP_KEEPALIVE:
+            # Idle pooled sockets survive between chats
+            socket_options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60))
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=config.GROK_POOL_MAXSIZE
+            ),
+            socket_options=socket_options
+        )
+        # Resolved here, in the process that makes the calls (the fake backend starts its server now)
+        self._client = httpx.AsyncClient(
+            base_url=self.backend.base_url, headers=self.backend.headers(), transport=transport,
+            event_hooks={'request': [self._on_request]}
+        )
+
+    async def _on_request(self, request):
+        # Every attempt, retries included; the trace hook sees when it needs a new connection
+        self._metrics['upstream_requests'] += 1
+        request.extensions['trace'] = self._trace
+
+    async def _trace(self, event, info):
+        if event == 'connection.connect_tcp.complete':
+            self._metrics['connections_opened'] += 1
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def close(self):
+        """Close the client and stop the loop thread"""
+        with self._lock:
+            loop, thread, client = self._loop, self._thread, self._client
+            owned = self._pid == os.getpid()
+            self._loop = self._thread = self._client = None
+        if loop is None or not owned:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Closing LLM client failed: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+
+    def reset(self):
+        """Forget a loop inherited from the parent process; the next call starts a fresh one"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._loop = self._thread = self._client = None
+                self._pid = None
+
+    # --- ADMISSION CONTROL ---
+
+    @asynccontextmanager
+    async def _slot(self, user):
+        """Hold one upstream slot (and one of the user's) for the duration of a call"""
+        semaphores = [self._slots]
+        if user is not None:
+            if user not in self._user_slots:
+                self._user_slots[user] = asyncio.Semaphore(self.max_per_user)
+            # Per-user first, so a user over their cap does not hold a global slot while waiting
+            semaphores.insert(0, self._user_slots[user])
+            self._user_refs[user] = self._user_refs.get(user, 0) + 1
+
+        started = time.monotonic()
+        acquired = []
+        waiting = False
+        try:
+            try:
+                for semaphore in semaphores:
+                    if not semaphore.locked():
+                        # A free slot is taken without yielding; only callers that wait count as queued
+                        await semaphore.acquire()
+                        acquired.append(semaphore)
+                        continue
+                    if not waiting:
+                        if self._waiting >= self.max_queue:
+                            self._metrics['rejected'] += 1
+                            logger.warning(f"LLM gateway busy: {self._waiting} waiting, {self._in_flight} in flight")
+                            raise GatewayBusyError("Too many requests are waiting for the AI server")
+                        waiting = True
+                        self._waiting += 1
+                        self._metrics['peak_waiting'] = max(self._metrics['peak_waiting'], self._waiting)
+                    remaining = self.queue_timeout - (time.monotonic() - started)
+                    await asyncio.wait_for(semaphore.acquire(), timeout=max(remaining, 0.001))
+                    acquired.append(semaphore)
+            except asyncio.TimeoutError:
+                self._metrics['rejected'] += 1
+                logger.warning(f"LLM gateway busy: no slot within {self.queue_timeout}s")
+                raise GatewayBusyError(f"Waited {self.queue_timeout}s for a free slot")
+            finally:
+                if waiting:
+                    self._waiting -= 1
+
+            waited = time.monotonic() - started
+            self._metrics['admitted'] += 1
+            self._metrics['wait_seconds'] += waited
+            self._metrics['max_wait_seconds'] = max(self._metrics['max_wait_seconds'], waited)
+            self._in_flight += 1
+            self._metrics['peak_in_flight'] = max(self._metrics['peak_in_flight'], self._in_flight)
+            try:
+                yield
+            finally:
+                self._in_flight -= 1
+        finally:
+            for semaphore in acquired:
+                semaphore.release()
+            if user is not None:
+                self._user_refs[user] -= 1
+                if not self._user_refs[user]:
+                    # Nobody holds or waits on the user's semaphore any more
+                    del self._user_refs[user]
+                    del self._user_slots[user]
+
+    async def _backoff(self, attempt, retry_after=None):
+        self._metrics['retries'] += 1
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    # --- RESILIENCE ---
+
+    async def _admit(self, tokens, started):
+        """Rate limit and circuit breaker checks before an upstream attempt"""
+        # Fail fast during an outage instead of queueing on the limiter
+        self.breaker.check()
+        remaining = self.queue_timeout - (time.monotonic() - started)
+        try:
+            await self.limiter.acquire(tokens, max(remaining, 0.0))
+        except RateLimitWaitError as e:
+            self._metrics['rejected'] += 1
+            logger.warning(f"LLM gateway busy: {e}")
+            raise GatewayBusyError(str(e))
+        self.breaker.before_call()
+
+    def _record(self, status=None):
+        """Feed an attempt's outcome to the breaker; status None means a network failure"""
+        if status is None or status >= 500:
+            self.breaker.record_failure()
+        else:
+            # 429 and other 4xx still prove the upstream is up
+            self.breaker.record_success()
+
+    def _should_retry(self, response, attempt):
+        """(retry?, Retry-After seconds) for a non-200 response"""
+        if response.status_code not in RETRY_STATUSES:
+            return False, None
+        retry_after = parse_retry_after(response.headers.get('retry-after'))
+        if response.status_code == 429:
+            # Hold every queued call, not just this one
+            self.limiter.pause(retry_after if retry_after is not None else backoff_delay(attempt))
+        if attempt >= self.max_retries - 1 or self.breaker.state == 'open':
+            return False, retry_after
+        if retry_after is not None and retry_after > config.LLM_RETRY_MAX_DELAY:
+            logger.warning(f"Retry-After {retry_after:.0f}s is longer than LLM_RETRY_MAX_DELAY; giving up")
+            return False, retry_after
+        return True, retry_after
+
+    def _estimate_tokens(self, payload):
+        return count_messages(payload.get('messages', [])) + config.LLM_COMPLETION_TOKENS
+
+    # --- COMPLETIONS ---
+
+    def post(self, payload: Dict, user=None, timeout=45) -> httpx.Response:
+        """
+        POST a chat completion and block the calling thread until it finishes (retries included).
+        Returns the last response, which may be an error status; raises httpx.TransportError
+        after the last network failure and GatewayBusyError when no slot frees up in time.
+        """
+        return self._submit(self._post(payload, user, timeout)).result()
+
+    async def _post(self, payload, user, timeout):
+        self._metrics['requests'] += 1
+        tokens = self._estimate_tokens(payload)
+        started = time.monotonic()
+        try:
+            for attempt in range(self.max_retries):
+                await self._admit(tokens, started)
+                try:
+                    async with self._slot(user):
+                        response = await self._client.post("/chat/completions", json=payload, timeout=timeout)
+                except NETWORK_ERRORS as e:
+                    self._record(None)
+                    logger.error(f"Network error on attempt {attempt+1}: {str(e)}")
+                    if attempt < self.max_retries - 1 and self.breaker.state != 'open':
+                        await self._backoff(attempt)
+                        continue
+                    raise
+                except BaseException:
+                    self.breaker.release_probe()
+                    raise
+                self._record(response.status_code)
+                if response.status_code == 200:
+                    self.limiter.correct(tokens, self._usage(response))
+                else:
+                    retry, retry_after = self._should_retry(response, attempt)
+                    if retry:
+                        logger.error(f"API error (Status: {response.status_code}), retrying")
+                        # The slot is released while backing off so other chats can use it
+                        await self._backoff(attempt, retry_after)
+                        continue
+                self._metrics['completed'] += 1
+                return response
+        except BaseException:
+            self._metrics['failed'] += 1
+            raise
+
+    def _usage(self, response):
+        """Total tokens the provider charged, if it says"""
+        try:
+            return response.json().get('usage', {}).get('total_tokens')
+        except (ValueError, AttributeError):
+            return None
+
+    def stream(self, payload: Dict, user=None, timeout=(10, 45)) -> Iterator:
+        """
+        Stream a chat completion. Yields the httpx.Response first (body already read if the
+        status is not 200), then the SSE lines as they arrive. Retries happen only before the
+        response is yielded. Closing the iterator cancels the upstream call.
+        """
+        lines = queue.Queue()
+        future = self._submit(self._stream(payload, user, timeout, lines))
+        try:
+            while True:
+                kind, value = lines.get()
+                if kind == 'end':
+                    break
+                if kind == 'error':
+                    raise value
+                yield value
+        finally:
+            # No-op once finished; stops the upstream read when the client disconnects
+            future.cancel()
+
+    async def _stream(self, payload, user, timeout, lines):
+        connect_timeout, read_timeout = timeout
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._metrics['requests'] += 1
+        tokens = self._estimate_tokens(payload)
+        begun = time.monotonic()
+        started = False
+        try:
+            for attempt in range(self.max_retries):
+                await self._admit(tokens, begun)
+                retry, retry_after = False, None
+                try:
+                    async with self._slot(user):
+                        async with self._client.stream("POST", "/chat/completions", json=payload, timeout=timeout) as response:
+                            self._record(response.status_code)
+                            if response.status_code != 200:
+                                await response.aread()
+                                retry, retry_after = self._should_retry(response, attempt)
+                                if retry:
+                                    logger.error(f"API error (Status: {response.status_code}), retrying")
+                                else:
+                                    lines.put(('response', response))
+                            else:
+                                lines.put(('response', response))
+                                started = True
+                                async for line in response.aiter_lines():
+                                    lines.put(('line', line))
+                except NETWORK_ERRORS as e:
+                    self._record(None)
+                    if attempt < self.max_retries - 1 and not started and self.breaker.state != 'open':
+                        logger.error(f"Network error on stream attempt {attempt+1}: {str(e)}")
+                        await self._backoff(attempt)
+                        continue
+                    raise
+                except BaseException:
+                    self.breaker.release_probe()
+                    raise
+                if retry:
+                    await self._backoff(attempt, retry_after)
+                    continue
+                self._metrics['completed'] += 1
+                return
+        except BaseException as e:
+            self._metrics['failed'] += 1
+            lines.put(('error', e if isinstance(e, Exception) else GatewayBusyError("Stream cancelled")))
+            raise
+        finally:
+            lines.put(('end', None))
+
+    # --- METRICS ---
+
+    def stats(self) -> Dict:
+        """Queue depth, in-flight calls, wait times and connection reuse for this worker process"""
+        metrics = dict(self._metrics)
+        admitted = metrics['admitted']
+        metrics['avg_wait_ms'] = round(metrics.pop('wait_seconds') / admitted * 1000, 1) if admitted else 0.0
+        metrics['max_wait_ms'] = round(metrics.pop('max_wait_seconds') * 1000, 1)
+        # Attempts that went over an already open keep-alive connection
+        metrics['connections_reused'] = max(metrics['upstream_requests'] - metrics['connections_opened'], 0)
+        metrics.update({
+            'pid': os.getpid(),
+            'waiting': self._waiting,
+            'in_flight': self._in_flight,
+            'active_users': len(self._user_refs),
+            'max_concurrency': self.max_concurrency,
+            'max_per_user': self.max_per_user,
+            'max_queue': self.max_queue
+        })
+        metrics.update(self.limiter.stats())
+        metrics.update(self.breaker.stats())
+        return metrics
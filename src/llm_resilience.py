@@ -0,0 +1,178 @@
+"""
+Client-side resilience policy for LLM calls
+
+Used by the LLM gateway, on its event loop (so none of this needs locking):
+- backoff_delay(): exponential back-off with full jitter, or the server's Retry-After
+  plus jitter, so workers that failed together do not retry together
+- RateLimiter: token buckets for requests/minute and tokens/minute, this worker's
+  share of the provider tier; a 429 pauses it for Retry-After so queued calls wait instead of
+  hammering the API
+- CircuitBreaker: after repeated upstream failures, calls fail fast for a cool-down,
+  then a single probe decides whether to close again
+"""
+
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is failing; calls are rejected until the cool-down ends"""
+
+class RateLimitWaitError(RuntimeError):
+    """The rate limiter would make the call wait longer than allowed"""
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, retry_after=None, base=None, cap=None):
+    """Seconds to wait before retry number attempt+1"""
+    base = config.LLM_RETRY_BASE_DELAY if base is None else base
+    cap = config.LLM_RETRY_MAX_DELAY if cap is None else cap
+    if retry_after is not None:
+        # Honour the server, plus a little jitter to spread the retries out
+        return retry_after + random.uniform(0, base)
+    # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (0 if it is now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        # May go negative when a reservation is corrected upwards; refill pays it back
+        self.level -= amount
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets; 0 disables a limit.
+    By default this worker gets its share of the configured tier limits.
+    """
+    def __init__(self, rpm=None, tpm=None):
+        rpm = config.LLM_RATE_RPM / config.WEB_CONCURRENCY if rpm is None else rpm
+        tpm = config.LLM_RATE_TPM / config.WEB_CONCURRENCY if tpm is None else tpm
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.paused_until = 0.0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self, tokens, max_wait):
+        """Wait until one request and tokens fit, then take them (RateLimitWaitError past max_wait)"""
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self.paused_until - now,
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(tokens, now) if self.tokens else 0.0,
+            )
+            if wait <= 0:
+                break
+            if now + wait > deadline:
+                raise RateLimitWaitError(f"Rate limit would delay the call {wait:.1f}s")
+            if not waited:
+                self.waits += 1
+                waited = True
+            self.wait_seconds += wait
+            await asyncio.sleep(wait)
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(min(tokens, self.tokens.capacity))
+
+    def correct(self, reserved, actual):
+        """Charge the difference once the provider reports the real token usage"""
+        if self.tokens and actual is not None:
+            self.tokens.take(actual - min(reserved, self.tokens.capacity))
+
+    def pause(self, seconds):
+        """Hold every call for seconds (the provider answered 429 with Retry-After)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        return {
+            'rate_limited_calls': self.waits,
+            'rate_limit_wait_seconds': round(self.wait_seconds, 1),
+            'rpm_available': int(self.requests.level) if self.requests else None,
+            'tpm_available': int(self.tokens.level) if self.tokens else None,
+        }
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold consecutive failures -> half_open after cooldown"""
+    def __init__(self, failure_threshold=None, cooldown=None):
+        self.failure_threshold = failure_threshold or config.LLM_BREAKER_FAILURES
+        self.cooldown = cooldown or config.LLM_BREAKER_COOLDOWN
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def check(self):
+        """Raise CircuitOpenError if a call would be rejected now, without claiming the probe"""
+        if self.state == 'open' and time.monotonic() - self.opened_at < self.cooldown:
+            raise CircuitOpenError("The AI server is failing; not calling it for now")
+        if self.state == 'half_open' and self._probing:
+            raise CircuitOpenError("Waiting for the probe call to the AI server")
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go upstream now; may claim the probe"""
+        self.check()
+        if self.state == 'open':
+            self.state = 'half_open'
+        if self.state == 'half_open':
+            self._probing = True
+
+    def record_success(self):
+        if self.state != 'closed':
+            logger.info("Circuit breaker closed: the AI server is answering again")
+        self.state = 'closed'
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            if self.state != 'open':
+                self.times_opened += 1
+                logger.error(f"Circuit breaker opened after {self.failures} failures; failing fast for {self.cooldown}s")
+            self.state = 'open'
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """The probe ended without a verdict (e.g. cancelled); let the next call probe"""
+        self._probing = False
+
+    def stats(self):
+        return {'breaker_state': self.state, 'breaker_failures': self.failures, 'breaker_opened': self.times_opened}
@@ -35,6 +35,44 @@ class OCRProcessor:
                 logger.error(f"Failed to initialize RapidOCR: {e}")
                 self.engine = None
 
+    def process_page(self, page, i):
+        """Extract one PyMuPDF page as a '--- Page N ---' block, OCRing it if the text layer is missing or junk"""
+        import re
+        # Try standard text extraction first
+        text = page.get_text().strip()
+        
+        # Check if text is "junk" (too many l, i, |, /, etc. and no Arabic/English words)
+        is_junk = False
+        if text:
+            # If it has some text, check if it's rubbish
+            # Egyptian books should have Arabic or English words
+            has_arabic = bool(re.search(r'[\u0600-\u06FF]', text))
+            has_english = bool(re.search(r'[a-zA-Z]{3,}', text))
+            
+            if not has_arabic and not has_english:
+                is_junk = True
+            elif len(text) > 100:
+                # High density of symbols/single chars often means bad encoding
+                weird_chars = len(re.findall(r'[|/\\_l1iI]', text))
+                if weird_chars / len(text) > 0.4:
+                    is_junk = True
+        
+        if text and not is_junk:
+            return f"\n--- Page {i+1} ---\n{normalize_arabic(text)}\n"
+
+        # If no text or junk text, perform OCR
+        logger.info(f"Page {i+1} {'is empty' if not text else 'looks like junk'}. Performing OCR...")
+        pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Better resolution
+        img_data = pix.tobytes("png")
+        
+        # Run OCR
+        result, _ = self.engine(img_data)
+        
+        if result:
+            ocr_text = "\n".join([line[1] for line in result])
+            return f"\n--- Page {i+1} [OCR] ---\n{normalize_arabic(ocr_text)}\n"
+        return f"\n--- Page {i+1} [EMPTY] ---\n"
+
     def process_pdf(self, file_path):
         """Process PDF and return text with page markers, using OCR where needed."""
         if not HAS_OCR:
@@ -57,45 +95,10 @@ class OCRProcessor:
             return "OCR Engine missing but libs installed."
 
         full_text = ""
-        import re
         try:
             doc = fitz.open(file_path)
             for i, page in enumerate(doc):
-                # Try standard text extraction first
-                text = page.get_text().strip()
-                
-                # Check if text is "junk" (too many l, i, |, /, etc. and no Arabic/English words)
-                is_junk = False
-                if text:
-                    # If it has some text, check if it's rubbish
-                    # Egyptian books should have Arabic or English words
-                    has_arabic = bool(re.search(r'[\u0600-\u06FF]', text))
-                    has_english = bool(re.search(r'[a-zA-Z]{3,}', text))
-                    
-                    if not has_arabic and not has_english:
-                        is_junk = True
-                    elif len(text) > 100:
-                        # High density of symbols/single chars often means bad encoding
-                        weird_chars = len(re.findall(r'[|/\\_l1iI]', text))
-                        if weird_chars / len(text) > 0.4:
-                            is_junk = True
-                
-                if text and not is_junk:
-                    full_text += f"\n--- Page {i+1} ---\n{normalize_arabic(text)}\n"
-                else:
-                    # If no text or junk text, perform OCR
-                    logger.info(f"Page {i+1} {'is empty' if not text else 'looks like junk'}. Performing OCR...")
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # Better resolution
-                    img_data = pix.tobytes("png")
-                    
-                    # Run OCR
-                    result, _ = self.engine(img_data)
-                    
-                    if result:
-                        ocr_text = "\n".join([line[1] for line in result])
-                        full_text += f"\n--- Page {i+1} [OCR] ---\n{normalize_arabic(ocr_text)}\n"
-                    else:
-                        full_text += f"\n--- Page {i+1} [EMPTY] ---\n"
+                full_text += self.process_page(page, i)
             
             doc.close()
             
@@ -113,6 +116,49 @@ class OCRProcessor:
             logger.error(f"Error in process_pdf: {e}")
             return f"Error processing file with OCR: {e}"
 
+def pdf_page_count(file_path):
+    """Number of pages in a PDF"""
+    if HAS_OCR:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    from PyPDF2 import PdfReader
+    return len(PdfReader(file_path).pages)
+
+# --- Process pool workers (one OCR engine per worker process) ---
+
+_worker_ocr = None
+_worker_doc = None  # (file_path, open document) reused while a worker stays on one book
+
+def init_ocr_worker():
+    """ProcessPoolExecutor initializer: build this worker's RapidOCR engine once"""
+    global _worker_ocr
+    logging.basicConfig(level=logging.INFO)
+    _worker_ocr = OCRProcessor()
+
+def _open_worker_doc(file_path):
+    global _worker_doc
+    if _worker_doc is None or _worker_doc[0] != file_path:
+        if _worker_doc is not None and HAS_OCR:
+            _worker_doc[1].close()
+        if HAS_OCR:
+            _worker_doc = (file_path, fitz.open(file_path))
+        else:
+            from PyPDF2 import PdfReader
+            _worker_doc = (file_path, PdfReader(file_path))
+    return _worker_doc[1]
+
+def ocr_page(file_path, page_index):
+    """Worker task: extract one page; returns (page_index, page block) in process_pdf's format"""
+    doc = _open_worker_doc(file_path)
+    if not HAS_OCR:
+        text = doc.pages[page_index].extract_text()
+        if text and text.strip():
+            return page_index, f"\n--- Page {page_index+1} ---\n{text}\n"
+        return page_index, f"\n--- Page {page_index+1} [IMAGE/OCR NEEDED] ---\n"
+    if _worker_ocr is None or _worker_ocr.engine is None:
+        raise RuntimeError("OCR Engine missing but libs installed.")
+    return page_index, _worker_ocr.process_page(doc[page_index], page_index)
+
 if __name__ == "__main__":
     # Test script
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,150 @@
+"""
+Token budgets for prompt assembly
+
+Groq bills and rate-limits by tokens, so the prompt is measured in tokens rather than
+characters, and each part gets its own budget: the library title list, the retrieved
+chunks and the chat history. The lowest-value pieces go first: lower-ranked chunks,
+older turns (whose answers are shortened before whole turns are dropped) and the
+titles at the end of the list.
+
+Tokens are counted with tiktoken when it is installed (cl100k_base is the BPE that
+Llama 3's tokenizer extends, so counts are close). Without it a conservative estimate
+is used: ~4 characters per token for ASCII text, ~2 for Arabic and other scripts.
+"""
+
+import logging
+import math
+from functools import lru_cache
+from typing import Dict, List
+
+from src import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    HAS_TIKTOKEN = True
+except ImportError:
+    HAS_TIKTOKEN = False
+    logger.warning("tiktoken not installed. Prompt tokens will be estimated from character counts.")
+
+# Per-message framing (role markers) added by chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Below this a truncated piece is not worth sending
+MIN_PIECE_TOKENS = 64
+
+TRUNCATION_MARKER = " ... [shortened]"
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and HAS_TIKTOKEN:
+        try:
+            _encoding = tiktoken.get_encoding(config.PROMPT_TOKENIZER)
+        except Exception as e:
+            # The BPE file is downloaded on first use; offline hosts fall back to estimates
+            logger.warning(f"Cannot load tokenizer {config.PROMPT_TOKENIZER}: {e}. Estimating tokens instead.")
+            _encoding = False
+    return _encoding or None
+
+@lru_cache(maxsize=256)
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+def _estimate_prefix(text: str, max_tokens: int) -> str:
+    """Longest prefix whose estimated count fits max_tokens"""
+    cost = 0.0
+    for i, c in enumerate(text):
+        cost += 0.25 if ord(c) < 128 else 0.5
+        if math.ceil(cost) > max_tokens:
+            return text[:i]
+    return text
+
+def truncate_tokens(text: str, max_tokens: int, marker: str = TRUNCATION_MARKER) -> str:
+    """Cut text to at most max_tokens, marker included"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    budget = max(max_tokens - count_tokens(marker), 0)
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:budget]) + marker
+    return _estimate_prefix(text, budget) + marker
+
+def fit_titles(titles: List[str], max_tokens: int) -> List[str]:
+    """Title lines that fit, with a final '... and N more' line for the rest"""
+    lines, used = [], 0
+    for i, title in enumerate(titles):
+        line = f"- {title}"
+        cost = count_tokens(line) + 1
+        # Leave room for the summary line
+        if used + cost > max_tokens - 12:
+            lines.append(f"- ... and {len(titles) - i} more books")
+            break
+        lines.append(line)
+        used += cost
+    return lines
+
+def render_library_preamble(available_books_titles: List[str] = None) -> str:
+    """Render the AVAILABLE LIBRARY BOOKS block of the context, cut to PROMPT_TITLES_TOKENS"""
+    if available_books_titles:
+        lines = fit_titles(available_books_titles, config.PROMPT_TITLES_TOKENS)
+        return "=== AVAILABLE LIBRARY BOOKS ===\n" + "\n".join(lines) + "\n\n"
+    return "=== AVAILABLE LIBRARY BOOKS ===\n(No books found in library)\n\n"
+
+def fit_chunks(books_context: List[Dict], max_tokens: int) -> List[Dict]:
+    """Chunks in rank order while they fit; the first one that does not is shortened, the rest dropped"""
+    fitted, used = [], 0
+    for i, book in enumerate(books_context, 1):
+        header = f"{i}. {book['title']}:\n"
+        cost = count_tokens(header) + count_tokens(book['content']) + 1
+        if used + cost <= max_tokens:
+            fitted.append(book)
+            used += cost
+            continue
+        remaining = max_tokens - used - count_tokens(header) - 1
+        if remaining >= MIN_PIECE_TOKENS:
+            fitted.append(dict(book, content=truncate_tokens(book['content'], remaining)))
+        dropped = len(books_context) - len(fitted)
+        if dropped:
+            logger.info(f"Context budget: dropped {dropped} lower-ranked chunk(s)")
+        break
+    return fitted
+
+def fit_history(history: List[Dict], max_tokens: int, answer_tokens: int = None) -> List[Dict]:
+    """
+    Most recent turns that fit, oldest dropped first. Answers in all but the latest turn
+    are shortened to answer_tokens first, since they matter less than the last exchange.
+    """
+    if not history or max_tokens <= 0:
+        return []
+    if answer_tokens is None:
+        answer_tokens = config.PROMPT_HISTORY_ANSWER_TOKENS
+    kept, used = [], 0
+    for age, chat in enumerate(reversed(history)):
+        answer = chat['ai_response'] if age == 0 else truncate_tokens(chat['ai_response'], answer_tokens)
+        cost = count_tokens(chat['user_message']) + count_tokens(answer) + 2 * MESSAGE_OVERHEAD_TOKENS
+        if used + cost > max_tokens:
+            if age == 0:
+                # Always keep some of the last exchange; follow-ups depend on it
+                question = truncate_tokens(chat['user_message'], max_tokens // 3)
+                remaining = max_tokens - count_tokens(question) - 2 * MESSAGE_OVERHEAD_TOKENS
+                if remaining >= MIN_PIECE_TOKENS:
+                    kept.append(dict(chat, user_message=question, ai_response=truncate_tokens(answer, remaining)))
+            break
+        kept.append(dict(chat, ai_response=answer) if answer is not chat['ai_response'] else chat)
+        used += cost
+    if len(kept) < len(history):
+        logger.info(f"History budget: kept {len(kept)} of {len(history)} turns")
+    kept.reverse()
+    return kept
+
+def count_messages(messages: List[Dict]) -> int:
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD_TOKENS for m in messages)
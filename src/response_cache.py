@@ -0,0 +1,311 @@
+"""
+Response cache for GrokService.get_response
+
+Exact tier: in-memory LRU with TTL, backed by a SQLite table so answers survive restarts.
+Semantic tier (optional): near-duplicate questions that retrieved the same chunks are matched
+by cosine similarity of their query embeddings.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock, local
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from src.ocr_utils import normalize_arabic
+
+logger = logging.getLogger(__name__)
+
+# Params that change the generated answer; anything else in custom_params is ignored for the key
+CACHE_PARAM_KEYS = ('subject', 'edu_level', 'tone', 'detail_level', 'daily_hours', 'sleep_time', 'duration_days')
+
+# Lookup embeddings kept for the set() that follows a miss
+LOOKUP_EMBEDDINGS_KEPT = 64
+
+# Persistent hits only bump last_hit (used to pick rows to trim) in batches, at most this often
+LAST_HIT_FLUSH_SECONDS = 60
+
+def normalize_query(text: str) -> str:
+    """Normalize a user message for cache lookups (Arabic letter forms, case, punctuation, spaces)"""
+    text = normalize_arabic(text or "").lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def chunk_id(book: Dict) -> str:
+    """Stable ID for a retrieved chunk (its own ID if the store returned one)"""
+    if book.get('id'):
+        return str(book['id'])
+    raw = f"{book.get('title', '')}\n{book.get('content', '')}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+class ResponseCache:
+    def __init__(self, db_path: Optional[str] = None, max_entries: int = 2000, ttl: int = 86400,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None, similarity: float = 0.95):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.similarity = similarity
+
+        self._lock = Lock()
+        # key -> (scope, response, created_at, unit-length embedding or None)
+        self._entries = OrderedDict()
+        # normalized message -> embedding from a semantic lookup, reused when the answer is stored
+        self._lookup_embeddings = OrderedDict()
+        # One SQLite connection per thread (and process), reused across lookups
+        self._local = local()
+        # cache_key -> last hit time, written to SQLite in batches
+        self._pending_hits = {}
+        self._hits_flushed_at = time.time()
+        self._metrics = {
+            'hits': 0,
+            'semantic_hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'bypassed': 0,
+            'evictions': 0
+        }
+
+        if self.db_path:
+            self._init_db()
+
+    # --- KEYS ---
+
+    def make_scope(self, assistant_type: str, language: str, books_context: List[Dict], custom_params: Dict) -> str:
+        """Everything besides the message text that the answer depends on"""
+        params = {k: custom_params.get(k) for k in CACHE_PARAM_KEYS if custom_params.get(k) not in (None, '')}
+        raw = json.dumps({
+            'assistant_type': assistant_type,
+            'language': language,
+            'chunks': sorted(chunk_id(b) for b in books_context),
+            'params': params
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def make_key(self, message: str, scope: str) -> str:
+        return hashlib.sha256(f"{scope}\n{normalize_query(message)}".encode('utf-8')).hexdigest()
+
+    # --- LOOKUP / STORE ---
+
+    def get(self, message: str, scope: str) -> Optional[str]:
+        """Return a cached response for this message + scope, or None"""
+        key = self.make_key(message, scope)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[2] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._metrics['hits'] += 1
+                    return entry[1]
+                del self._entries[key]
+
+        response = self._db_get(key, now)
+        if response is not None:
+            with self._lock:
+                self._metrics['hits'] += 1
+                self._metrics['persistent_hits'] += 1
+            self._remember(key, scope, response, now, None)
+            return response
+
+        response = self._semantic_get(message, scope, now)
+        if response is not None:
+            with self._lock:
+                self._metrics['hits'] += 1
+                self._metrics['semantic_hits'] += 1
+            return response
+
+        with self._lock:
+            self._metrics['misses'] += 1
+        return None
+
+    def set(self, message: str, scope: str, response: str):
+        """Store a response in memory and in the persistent tier"""
+        if not response:
+            return
+        key = self.make_key(message, scope)
+        now = time.time()
+        embedding = None
+        if self.embed_fn:
+            with self._lock:
+                embedding = self._lookup_embeddings.pop(normalize_query(message), None)
+            if embedding is None:
+                embedding = self._embed(message)
+        self._remember(key, scope, response, now, embedding)
+        self._db_set(key, scope, response, now)
+
+    def record_bypass(self):
+        with self._lock:
+            self._metrics['bypassed'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lookup_embeddings.clear()
+            self._pending_hits.clear()
+        if self.db_path:
+            conn = self._connect()
+            conn.execute("DELETE FROM response_cache")
+            conn.commit()
+
+    # --- MEMORY TIER ---
+
+    def _remember(self, key, scope, response, created_at, embedding):
+        with self._lock:
+            self._entries[key] = (scope, response, created_at, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def _embed(self, message: str):
+        """Unit-length float32 embedding, so cosine similarity is a dot product"""
+        try:
+            vector = np.asarray(self.embed_fn(normalize_query(message)), dtype='float32')
+        except Exception as e:
+            logger.warning(f"Response cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _semantic_get(self, message: str, scope: str, now: float) -> Optional[str]:
+        """Best match among live entries with the same scope, if similar enough"""
+        if not self.embed_fn:
+            return None
+        with self._lock:
+            candidates = [
+                (entry[3], entry[1]) for entry in self._entries.values()
+                if entry[0] == scope and entry[3] is not None and now - entry[2] <= self.ttl
+            ]
+        if not candidates:
+            return None
+
+        query = self._embed(message)
+        if query is None:
+            return None
+        with self._lock:
+            # A miss is usually followed by set() for the same message
+            self._lookup_embeddings[normalize_query(message)] = query
+            while len(self._lookup_embeddings) > LOOKUP_EMBEDDINGS_KEPT:
+                self._lookup_embeddings.popitem(last=False)
+
+        scores = np.vstack([vector for vector, _ in candidates]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity:
+            logger.info(f"Semantic cache hit (similarity {scores[best]:.3f})")
+            return candidates[best][1]
+        return None
+
+    # --- PERSISTENT TIER (SQLite) ---
+
+    def _connect(self):
+        """This thread's connection; a forked worker opens its own instead of the parent's"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            # Readers in other workers do not wait on the occasional write
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    scope TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_hit REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_last_hit ON response_cache(last_hit)")
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Response cache init failed, persistent tier disabled: {e}")
+            self.db_path = None
+        finally:
+            conn.close()
+
+    def _db_get(self, key: str, now: float) -> Optional[str]:
+        if not self.db_path:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT response, created_at FROM response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (key,))
+                conn.commit()
+                return None
+            self._record_hit(key, now)
+            return row[0]
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            return None
+
+    def _record_hit(self, key: str, now: float):
+        """Queue a last_hit update; written in one transaction every LAST_HIT_FLUSH_SECONDS"""
+        with self._lock:
+            self._pending_hits[key] = now
+            if now - self._hits_flushed_at < LAST_HIT_FLUSH_SECONDS:
+                return
+            hits = list(self._pending_hits.items())
+            self._pending_hits.clear()
+            self._hits_flushed_at = now
+        try:
+            conn = self._connect()
+            self._write_hits(conn, hits)
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"Response cache last_hit update failed: {e}")
+
+    def _write_hits(self, conn, hits):
+        conn.executemany("UPDATE response_cache SET last_hit = ? WHERE cache_key = ?", [(t, k) for k, t in hits])
+
+    def _db_set(self, key: str, scope: str, response: str, now: float):
+        if not self.db_path:
+            return
+        with self._lock:
+            # Hits so far count before rows are trimmed by last_hit below
+            hits = list(self._pending_hits.items())
+            self._pending_hits.clear()
+            self._hits_flushed_at = now
+        try:
+            conn = self._connect()
+            self._write_hits(conn, hits)
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache (cache_key, scope, response, created_at, last_hit) VALUES (?, ?, ?, ?, ?)",
+                (key, scope, response, now, now)
+            )
+            # Expire old rows and keep the table within the same size bound (least recently hit first)
+            conn.execute("DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl,))
+            conn.execute("""
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_hit DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+            conn.commit()
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
@@ -1,6 +1,15 @@
 
 
 import os
+import copy
+import json
+import re
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from threading import Lock, RLock
+import faiss
 from langchain_community.vectorstores import FAISS
 try:
     from langchain_community.embeddings import HuggingFaceEmbeddings
@@ -13,10 +22,14 @@ try:
 except ImportError:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 import logging
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 import pickle
+from src import config
+from src.bm25_index import BM25Index
+from src.docstore import SQLiteDocstore
 
 logger = logging.getLogger(__name__)
 
@@ -37,42 +50,295 @@ class SimpleTfidfEmbeddings:
             return [0] * 384
         return self.vectorizer.transform([text]).toarray()[0].tolist()
 
+class QueryEmbeddingCache:
+    """Thread-safe LRU of query text -> embedding vector"""
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self._metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self._metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics['hits'] += 1
+            return vector
+
+    def set(self, key, vector):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq')
+
+def make_index(index_type, dim, train_vectors=None):
+    """
+    Empty IndexIDMap2 of the given type. ivfpq is trained on train_vectors, which should be
+    the whole store (or a large sample of it); flat and hnsw need no training.
+    """
+    if index_type == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dim, config.HNSW_M)
+        inner.hnsw.efConstruction = config.HNSW_EF_CONSTRUCTION
+        inner.hnsw.efSearch = config.HNSW_EF_SEARCH
+    elif index_type == 'ivfpq':
+        count = 0 if train_vectors is None else len(train_vectors)
+        nlist = config.IVF_NLIST or max(1, int(4 * count ** 0.5))
+        # 8-bit PQ codebooks need at least 256 training points, and every list needs some
+        if count < max(256, nlist):
+            raise ValueError(f"ivfpq needs at least {max(256, nlist)} vectors to train, got {count}")
+        inner = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, config.IVFPQ_M, 8)
+        inner.nprobe = config.IVF_NPROBE
+        inner.train(train_vectors)
+    elif index_type == 'flat':
+        inner = faiss.IndexFlatL2(dim)
+    else:
+        raise ValueError(f"Unknown vector index type '{index_type}' (expected one of {', '.join(INDEX_TYPES)})")
+    return faiss.IndexIDMap2(inner)
+
+class LazyEmbeddings(Embeddings):
+    """Stands in for the model until a text actually has to be embedded"""
+    def __init__(self, vector_db):
+        self._vector_db = vector_db
+
+    def embed_documents(self, texts):
+        return self._vector_db.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._vector_db.embeddings.embed_query(text)
+
+MANIFEST_FILE = "manifest.json"
+DOCSTORE_FILE = "docstore.db"
+SEGMENTS_DIR = "segments"
+
+class StaleIndexError(RuntimeError):
+    """Another process committed a newer generation; changes built on the loaded one are refused"""
+
+def _fsync_file(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+
+def _fsync_dir(path):
+    # Makes renames inside the directory durable; not supported on Windows
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 class VectorDB:
+    """
+    FAISS store persisted as a base index plus append-only segments.
+
+    On disk (index_path):
+        index.faiss / index.pkl   original LangChain save_local base (migrated by the first commit)
+        base-<gen>/               compacted base, same LangChain format (the pickled docstore is a SQLiteDocstore)
+        docstore.db               chunk text and metadata, read on demand
+        segments/seg-<gen>.pkl    one per commit: the chunks added and the IDs removed since the last one
+        <base>/bm25/              BM25 keyword index of the base's chunks (memory-mapped)
+        manifest.json             current base + ordered segments; replaced atomically, so it is the commit point
+
+    A commit writes only what changed. After VECTOR_COMPACT_SEGMENTS segments the whole store
+    is rewritten as a new base and the old files are dropped; run_ingestion() also compacts at
+    the end of every run, so readers are left with a base they can mmap.
+
+    With VECTOR_LAZY_LOAD the model and index are loaded on first use, and with VECTOR_MMAP a
+    base without segments is opened memory-mapped, so workers share its pages.
+
+    Other processes may commit in the meantime: commit() refuses to write over a newer
+    generation, and search() reloads at most every VECTOR_REFRESH_SECONDS when there is one.
+    """
+
+    # Attributes replaced together when the index is (re)loaded
+    _LOADED_STATE = ('vector_store', '_mmapped', 'bm25', 'book_ids', '_next_id', '_tombstones', '_pending', 'manifest')
+
     def __init__(self, index_path="vector_store"):
         self.index_path = os.path.join(os.getcwd(), index_path)
-        
+        self._embeddings = None
+        self.embedding_function = LazyEmbeddings(self)
+        self._load_lock = RLock()
+        self._loaded = False
+        self._mmapped = False
+        self._refreshed_at = time.monotonic()
+
+        self.vector_store = None
+        self.bm25 = BM25Index()
+        # book title -> FAISS IDs of its chunks, so a book can be removed without scanning the store
+        self.book_ids = {}
+        self._next_id = 0
+        # IDs deleted from the docstore but still in an index that cannot remove vectors (HNSW)
+        self._tombstones = set()
+        # Changes applied in memory but not yet committed to disk, in order
+        self._pending = []
+        self.manifest = self._empty_manifest()
+        # sentence-transformers multi-process pool, started on first bulk embed when EMBED_WORKERS > 1
+        self._embed_pool = None
+        self._embed_stats = {'chunks': 0, 'seconds': 0.0}
+        self.query_cache = QueryEmbeddingCache(config.QUERY_EMBED_CACHE_SIZE)
+        if not config.VECTOR_LAZY_LOAD:
+            self.ensure_loaded()
+
+    @property
+    def embeddings(self):
+        """The embedding model, loaded on first access"""
+        if self._embeddings is None:
+            with self._load_lock:
+                if self._embeddings is None:
+                    self._embeddings = self._load_embeddings()
+        return self._embeddings
+
+    def _load_embeddings(self):
         # Try HuggingFace first, fallback to TF-IDF
         if USE_HUGGINGFACE:
             try:
-                self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+                embeddings = HuggingFaceEmbeddings(
+                    model_name="all-MiniLM-L6-v2",
+                    encode_kwargs={'batch_size': config.EMBED_BATCH_SIZE}
+                )
                 logger.info("Using HuggingFace embeddings")
+                return embeddings
             except Exception as e:
                 logger.warning(f"HuggingFace failed: {e}, using TF-IDF")
-                self.embeddings = SimpleTfidfEmbeddings()
-        else:
-            logger.info("Using TF-IDF embeddings (fallback)")
-            self.embeddings = SimpleTfidfEmbeddings()
-            
-        self.vector_store = None
-        self.load_index()
+                return SimpleTfidfEmbeddings()
+        logger.info("Using TF-IDF embeddings (fallback)")
+        return SimpleTfidfEmbeddings()
+
+    def ensure_loaded(self):
+        """Load the index on first use (thread-safe)"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self.load_index()
+
+    def load_index(self, mmap=None):
+        """Load the base index and replay committed segments, or wait for books if there is none"""
+        with self._load_lock:
+            self._load_index(config.VECTOR_MMAP if mmap is None else mmap)
+            self._loaded = True
 
-    def load_index(self):
-        """Load existing index or initialize new one"""
-        if os.path.exists(self.index_path):
+    def refresh(self):
+        """
+        Reload if manifest.json names a different generation than the one loaded (another
+        process committed). Returns True if it reloaded. The new state is loaded on the side
+        and swapped in, so concurrent searches keep using the old one until then.
+        """
+        with self._load_lock:
+            self._refreshed_at = time.monotonic()
+            if not self._loaded:
+                return False
+            on_disk = self._read_manifest()
+            if on_disk['generation'] == self.manifest['generation']:
+                return False
+            if self._pending:
+                logger.warning("Vector store changed on disk, but uncommitted changes are pending; not reloading")
+                return False
+            logger.info(f"Vector store generation {self.manifest['generation']} -> {on_disk['generation']} on disk; reloading")
+            staged = copy.copy(self)
+            staged._load_index(config.VECTOR_MMAP)
+            if staged.vector_store is None and os.path.exists(os.path.join(staged._base_path(), "index.faiss")):
+                # _load_index logged the error; keep serving the loaded generation and retry next interval
+                logger.error(f"Could not load vector store generation {on_disk['generation']}; keeping {self.manifest['generation']}")
+                return False
+            for name in self._LOADED_STATE:
+                setattr(self, name, getattr(staged, name))
+            return True
+
+    def _maybe_refresh(self):
+        interval = config.VECTOR_REFRESH_SECONDS
+        if interval > 0 and time.monotonic() - self._refreshed_at >= interval:
             try:
-                self.vector_store = FAISS.load_local(self.index_path, self.embeddings, allow_dangerous_deserialization=True)
-                logger.info(f"✅ Loaded Vector Store from {self.index_path}")
+                self.refresh()
             except Exception as e:
-                logger.error(f"Failed to load vector store: {e}")
-                self.vector_store = None
-        else:
+                logger.error(f"Vector store refresh failed, keeping the loaded generation: {e}")
+
+    def _check_generation(self):
+        """Raise StaleIndexError if another process committed since this one loaded"""
+        on_disk = self._read_manifest()['generation']
+        if on_disk != self.manifest['generation']:
+            raise StaleIndexError(
+                f"Vector store is at generation {on_disk} on disk but {self.manifest['generation']} here; reload before writing"
+            )
+
+    def _load_index(self, mmap):
+        self.vector_store = None
+        self._mmapped = False
+        self.bm25 = BM25Index()
+        self.book_ids = {}
+        self._next_id = 0
+        self._tombstones = set()
+        self._pending = []
+        self.query_cache.clear()
+        self.manifest = self._read_manifest()
+        base_path = self._base_path()
+        if not os.path.exists(os.path.join(base_path, "index.faiss")):
             logger.info("ℹ️ No existing vector store found. Waiting for books.")
+            return
+
+        try:
+            # Segments have to be replayed into the index, which needs an owned (non-mmapped) copy
+            mmap = mmap and not self.manifest['segments'] and hasattr(faiss, 'IO_FLAG_MMAP_IFC')
+            if mmap:
+                index = faiss.read_index(os.path.join(base_path, "index.faiss"), faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+            else:
+                index = faiss.read_index(os.path.join(base_path, "index.faiss"))
+            with open(os.path.join(base_path, "index.pkl"), 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            if isinstance(docstore, SQLiteDocstore):
+                docstore.open(self._docstore_path())
+            self.vector_store = FAISS(self.embedding_function, index, docstore, index_to_docstore_id)
+            self._mmapped = mmap
+            self._ensure_id_map()
+            self._load_bm25(base_path)
+            for name in self.manifest['segments']:
+                self._replay_segment(name)
+            self._next_id = max(self._next_id, self.manifest.get('next_id', 0))
+            logger.info(
+                f"✅ Loaded Vector Store from {self.index_path} "
+                f"({self.vector_store.index.ntotal} chunks, {len(self.manifest['segments'])} segment(s)"
+                f"{', mmapped' if self._mmapped else ''})"
+            )
+        except Exception as e:
+            logger.error(f"Failed to load vector store: {e}")
+            self.vector_store = None
 
     def add_book(self, title, content):
         """Chunk book content and add to vector store"""
+        return self.add_books([(title, content)])
+
+    def add_books(self, books, replace=False):
+        """
+        Chunk several (title, content) books, embed them together and save the index once.
+        With replace=True any chunks already stored under those titles are removed first.
+        """
+        self.ensure_loaded()
+        self._ensure_writable()
         try:
-            logger.info(f"Processing book: {title}...")
-            
+            if replace:
+                for title, _ in books:
+                    self._remove_chunks(title)
+
             # Split text into chunks
             text_splitter = RecursiveCharacterTextSplitter(
                 chunk_size=1000,
@@ -80,72 +346,543 @@ class VectorDB:
                 length_function=len
             )
             
-            texts = text_splitter.split_text(content)
-            
             # Create Documents with metadata
-            documents = [
-                Document(page_content=t, metadata={"source": title})
-                for t in texts
-            ]
+            documents = []
+            for title, content in books:
+                logger.info(f"Processing book: {title}...")
+                texts = text_splitter.split_text(content)
+                documents.extend(Document(page_content=t, metadata={"source": title}) for t in texts)
             
-            if self.vector_store is None:
-                self.vector_store = FAISS.from_documents(documents, self.embeddings)
-            else:
-                self.vector_store.add_documents(documents)
+            if not documents:
+                # Do not leave replace=True removals pending for the next unrelated commit
+                self._rollback()
+                return False
             
-            # Save index
-            self.vector_store.save_local(self.index_path)
-            logger.info(f"✅ Added {len(documents)} chunks from '{title}' to Vector Store")
+            self._add_documents(documents)
+            
+            # One commit for the whole batch
+            self.commit()
+            logger.info(f"✅ Added {len(documents)} chunks from {len(books)} book(s) to Vector Store")
             return True
         except Exception as e:
-            logger.error(f"❌ Failed to add book to vector store: {e}")
+            logger.error(f"❌ Failed to add books to vector store: {e}")
+            self._rollback()
             return False
 
+    # --- ID MAP ---
+    # The FAISS index is an IndexIDMap2, so chunk IDs stay stable across deletions and
+    # index_to_docstore_id is keyed by those IDs instead of by position.
+
+    def _ensure_id_map(self):
+        """Wrap a legacy positional index in an IndexIDMap2 and rebuild the per-book ID map"""
+        store = self.vector_store
+        if not isinstance(store.index, faiss.IndexIDMap2):
+            flat = store.index
+            wrapped = faiss.IndexIDMap2(faiss.IndexFlatL2(flat.d))
+            if flat.ntotal:
+                # Old positions become the IDs, so index_to_docstore_id stays valid
+                vectors = flat.reconstruct_n(0, flat.ntotal)
+                wrapped.add_with_ids(vectors, np.arange(flat.ntotal, dtype='int64'))
+            store.index = wrapped
+            self._mmapped = False
+            logger.info(f"Converted vector index to IndexIDMap2 ({wrapped.ntotal} vectors)")
+
+        self.book_ids = {}
+        if isinstance(store.docstore, SQLiteDocstore):
+            sources = store.docstore.sources()
+        else:
+            sources = {doc_id: doc.metadata.get('source', 'Unknown') for doc_id, doc in store.docstore._dict.items()}
+        for label, doc_id in store.index_to_docstore_id.items():
+            self.book_ids.setdefault(sources.get(doc_id, 'Unknown'), []).append(int(label))
+        self._next_id = max(store.index_to_docstore_id, default=-1) + 1
+
+        if not self._supports_remove():
+            stored = faiss.vector_to_array(store.index.id_map)
+            self._tombstones = set(stored.tolist()) - set(store.index_to_docstore_id)
+            if self._tombstones:
+                logger.info(f"{len(self._tombstones)} deleted chunks are still in the HNSW graph; "
+                            f"run build_vector_index.py to purge them")
+
+    def _add_documents(self, documents):
+        """Embed documents and add them under fresh IDs (pending until commit)"""
+        vectors = self._embed_documents([doc.page_content for doc in documents])
+        labels = np.arange(self._next_id, self._next_id + len(documents), dtype='int64')
+        doc_ids = [str(uuid.uuid4()) for _ in documents]
+        self._apply_add(labels, vectors, doc_ids, documents)
+        self._pending.append(('add', labels, vectors, doc_ids, documents))
+
+    # --- EMBEDDING ---
+
+    def _embed_documents(self, texts):
+        """Embed chunk texts in EMBED_BATCH_SIZE batches, across CPU cores when EMBED_WORKERS > 1"""
+        started = time.time()
+        pool = self._get_embed_pool()
+        if pool is not None:
+            # Same preprocessing and options as HuggingFaceEmbeddings.embed_documents
+            texts = [t.replace("\n", " ") for t in texts]
+            vectors = self.embeddings.client.encode_multi_process(
+                texts,
+                pool,
+                batch_size=config.EMBED_BATCH_SIZE,
+                normalize_embeddings=self.embeddings.encode_kwargs.get('normalize_embeddings', False)
+            )
+        else:
+            vectors = self.embeddings.embed_documents(texts)
+            if isinstance(self.embeddings, SimpleTfidfEmbeddings):
+                # A (re)fitted vectorizer invalidates cached query vectors
+                self.query_cache.clear()
+        vectors = np.asarray(vectors, dtype='float32')
+
+        elapsed = time.time() - started
+        self._embed_stats['chunks'] += len(texts)
+        self._embed_stats['seconds'] += elapsed
+        rate = len(texts) / elapsed if elapsed else 0.0
+        logger.info(f"Embedded {len(texts)} chunks in {elapsed:.1f}s ({rate:.1f} chunks/sec)")
+        return vectors
+
+    def _embed_query(self, query):
+        """Query vector, cached on the whitespace/case-normalized text (MiniLM is uncased)"""
+        text = re.sub(r'\s+', ' ', query or '').strip().lower()
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.set(text, vector)
+        return vector
+
+    def query_cache_stats(self):
+        return self.query_cache.stats()
+
+    def _get_embed_pool(self):
+        if self._embed_pool is not None:
+            return self._embed_pool
+        client = getattr(self.embeddings, 'client', None)
+        if config.EMBED_WORKERS <= 1 or not hasattr(client, 'start_multi_process_pool'):
+            return None
+        try:
+            self._embed_pool = client.start_multi_process_pool(target_devices=['cpu'] * config.EMBED_WORKERS)
+            logger.info(f"Started embedding pool with {config.EMBED_WORKERS} processes")
+        except Exception as e:
+            logger.warning(f"Embedding pool failed to start, encoding in-process: {e}")
+        return self._embed_pool
+
+    def close_embed_pool(self):
+        """Stop the embedding worker processes (they hold a model copy each)"""
+        if self._embed_pool is None:
+            return
+        try:
+            self.embeddings.client.stop_multi_process_pool(self._embed_pool)
+        except Exception as e:
+            logger.warning(f"Failed to stop embedding pool: {e}")
+        self._embed_pool = None
+
+    def embedding_stats(self):
+        """Chunks embedded by this instance and overall throughput"""
+        seconds = self._embed_stats['seconds']
+        return {
+            'chunks': self._embed_stats['chunks'],
+            'seconds': round(seconds, 2),
+            'chunks_per_sec': round(self._embed_stats['chunks'] / seconds, 1) if seconds else 0.0
+        }
+
+    def _apply_add(self, labels, vectors, doc_ids, documents):
+        if self.vector_store is None:
+            # ivfpq has to be trained on a full store first (build_vector_index.py), so start flat
+            index_type = 'hnsw' if config.VECTOR_INDEX_TYPE == 'hnsw' else 'flat'
+            index = make_index(index_type, vectors.shape[1])
+            os.makedirs(self.index_path, exist_ok=True)
+            self.vector_store = FAISS(self.embedding_function, index, SQLiteDocstore(self._docstore_path()), {})
+
+        self.vector_store.index.add_with_ids(vectors, labels)
+        self.vector_store.docstore.add(dict(zip(doc_ids, documents)))
+        self.bm25.add(labels.tolist(), [doc.page_content for doc in documents])
+        for label, doc_id, doc in zip(labels.tolist(), doc_ids, documents):
+            self.vector_store.index_to_docstore_id[label] = doc_id
+            self.book_ids.setdefault(doc.metadata.get('source', 'Unknown'), []).append(label)
+        if len(labels):
+            self._next_id = max(self._next_id, int(labels[-1]) + 1)
+
+    def _remove_chunks(self, title):
+        """Drop a book's chunks from the index and docstore (pending until commit); O(chunks of that book)"""
+        labels = self.book_ids.pop(title, [])
+        if not labels or self.vector_store is None:
+            return 0
+        self._apply_remove(labels)
+        self._pending.append(('remove', title, labels))
+        logger.info(f"Removed {len(labels)} old chunks of '{title}'")
+        return len(labels)
+
+    def _apply_remove(self, labels):
+        if self._supports_remove():
+            self.vector_store.index.remove_ids(np.asarray(labels, dtype='int64'))
+        else:
+            # Hidden from search by a selector until the index is rebuilt
+            self._tombstones.update(labels)
+        self.bm25.remove(labels)
+        doc_ids = [self.vector_store.index_to_docstore_id.pop(label) for label in labels]
+        self.vector_store.docstore.delete(doc_ids)
+
+    def _ensure_writable(self):
+        """A memory-mapped index is read-only; reload an owned copy before the first change"""
+        if self._mmapped:
+            logger.info("Reloading vector index without mmap for writing")
+            self.load_index(mmap=False)
+
+    def _inner_index(self):
+        return faiss.downcast_index(self.vector_store.index.index)
+
+    def _supports_remove(self):
+        return not isinstance(self._inner_index(), faiss.IndexHNSW)
+
+    def remove_book(self, title):
+        """Remove a book's chunks and commit"""
+        self.ensure_loaded()
+        self._ensure_writable()
+        try:
+            removed = self._remove_chunks(title)
+            if removed:
+                self.commit()
+            return removed
+        except Exception as e:
+            logger.error(f"❌ Failed to remove '{title}' from vector store: {e}")
+            self._rollback()
+            return 0
+
+    def replace_book(self, title, content):
+        """Swap a book's chunks for a new version of its content (e.g. corrected OCR)"""
+        return self.add_books([(title, content)], replace=True)
+
+    # --- PERSISTENCE ---
+
+    def commit(self):
+        """
+        Persist pending changes: append them as one segment, or compact into a new base
+        when there is no base yet or too many segments have piled up. The manifest swap is
+        the commit point; a crash before it leaves the previous commit intact.
+        """
+        if not self._pending or self.vector_store is None:
+            return
+        self._check_generation()
+        if not self.manifest['base']:
+            # No base yet, or the pre-manifest index.faiss/index.pkl: every load would convert its
+            # positional index and unpickle the whole docstore, so migrate it into base-<gen>
+            self.compact()
+            return
+        if len(self.manifest['segments']) + 1 > config.VECTOR_COMPACT_SEGMENTS:
+            self.compact()
+            return
+
+        generation = self.manifest['generation'] + 1
+        name = f"seg-{generation:06d}.pkl"
+        segments_dir = os.path.join(self.index_path, SEGMENTS_DIR)
+        os.makedirs(segments_dir, exist_ok=True)
+        path = os.path.join(segments_dir, name)
+        with open(path + ".tmp", 'wb') as f:
+            pickle.dump({'ops': self._pending, 'next_id': self._next_id}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_dir(segments_dir)
+
+        manifest = dict(self.manifest)
+        manifest['segments'] = self.manifest['segments'] + [name]
+        manifest['generation'] = generation
+        manifest['next_id'] = self._next_id
+        self._write_manifest(manifest)
+        self._pending = []
+        logger.info(f"Committed vector segment {name} ({len(manifest['segments'])} since last compaction)")
+
+    def needs_compaction(self):
+        """
+        True if readers cannot open the store as committed with mmap: there are segments to
+        replay, or it is still the legacy index.faiss/index.pkl with an in-memory docstore
+        """
+        self.ensure_loaded()
+        if self.vector_store is None:
+            return False
+        return bool(self.manifest['segments']) or not self.manifest['base']
+
+    def compact(self):
+        """Rewrite the whole store as a new base and drop the segments it replaces"""
+        if self.vector_store is None:
+            return
+        # Another process's manifest may still point at the base and segments dropped below
+        self._check_generation()
+        old_base = self.manifest['base']
+        old_segments = self.manifest['segments']
+        generation = self.manifest['generation'] + 1
+        name = f"base-{generation:06d}"
+        path = os.path.join(self.index_path, name)
+        tmp_path = path + ".tmp"
+
+        for leftover in (tmp_path, path):
+            # From a compaction that crashed before its manifest was written
+            if os.path.exists(leftover):
+                shutil.rmtree(leftover)
+        if not isinstance(self.vector_store.docstore, SQLiteDocstore):
+            # Move a pickled in-memory docstore out of the base into docstore.db
+            docstore = SQLiteDocstore(self._docstore_path())
+            docstore.add(dict(self.vector_store.docstore._dict))
+            self.vector_store.docstore = docstore
+        self.vector_store.save_local(tmp_path)
+        self.bm25.compact()
+        self.bm25.save(os.path.join(tmp_path, "bm25"))
+        for root, _, filenames in os.walk(tmp_path):
+            for filename in filenames:
+                _fsync_file(os.path.join(root, filename))
+        os.replace(tmp_path, path)
+        _fsync_dir(self.index_path)
+
+        self._write_manifest({
+            'version': 1,
+            'base': name,
+            'segments': [],
+            'generation': generation,
+            'next_id': self._next_id
+        })
+        self._pending = []
+
+        # The new manifest no longer references these; the original index.faiss/index.pkl are left alone
+        for segment in old_segments:
+            try:
+                os.remove(os.path.join(self.index_path, SEGMENTS_DIR, segment))
+            except OSError:
+                pass
+        if old_base:
+            shutil.rmtree(os.path.join(self.index_path, old_base), ignore_errors=True)
+        self.vector_store.docstore.retain(self.vector_store.index_to_docstore_id.values())
+        logger.info(f"Compacted vector store into {name} ({self.vector_store.index.ntotal} chunks)")
+
+    # --- INDEX TYPE ---
+
+    def index_type(self):
+        self.ensure_loaded()
+        inner = self._inner_index()
+        if isinstance(inner, faiss.IndexHNSW):
+            return 'hnsw'
+        if isinstance(inner, faiss.IndexIVFPQ):
+            return 'ivfpq'
+        return 'flat'
+
+    def export_vectors(self, reembed=False):
+        """
+        (labels, vectors) of every live chunk. Vectors are read back from the index, or
+        re-embedded from the chunk text with reembed=True (needed to leave a lossy ivfpq index).
+        """
+        self.ensure_loaded()
+        store = self.vector_store
+        if reembed:
+            labels = np.asarray(sorted(store.index_to_docstore_id), dtype='int64')
+            texts = [store.docstore.search(store.index_to_docstore_id[label]).page_content for label in labels.tolist()]
+            return labels, self._embed_documents(texts)
+
+        inner = self._inner_index()
+        ivf = faiss.try_extract_index_ivf(inner)
+        if ivf is not None:
+            ivf.make_direct_map()
+        vectors = inner.reconstruct_n(0, inner.ntotal)
+        labels = faiss.vector_to_array(store.index.id_map)
+        live = np.fromiter((label in store.index_to_docstore_id for label in labels.tolist()), dtype=bool, count=len(labels))
+        return labels[live], vectors[live]
+
+    def build_index(self, index_type, labels, vectors):
+        """A new index of index_type holding the given vectors (the store is not touched)"""
+        index = make_index(index_type, vectors.shape[1], vectors)
+        index.add_with_ids(vectors, labels)
+        return index
+
+    def swap_index(self, index):
+        """Replace the live index (same IDs) and commit it as a new base"""
+        self.vector_store.index = index
+        self._mmapped = False
+        self._tombstones = set()
+        self.query_cache.clear()
+        self.compact()
+        logger.info(f"Vector index is now {self.index_type()} ({index.ntotal} chunks)")
+
+    def _load_bm25(self, base_path):
+        """
+        Open the base's BM25 index, or build it in memory from the docstore if the base predates
+        it. Only compact() writes it to disk, so readers never race on the shared base directory.
+        """
+        path = os.path.join(base_path, "bm25")
+        if os.path.exists(os.path.join(path, "vocab.json")):
+            self.bm25 = BM25Index.load(path)
+            return
+        store = self.vector_store
+        labels = sorted(store.index_to_docstore_id)
+        texts = []
+        for label in labels:
+            doc = store.docstore.search(store.index_to_docstore_id[label])
+            texts.append(doc.page_content if isinstance(doc, Document) else '')
+        self.bm25 = BM25Index()
+        self.bm25.add(labels, texts)
+        self.bm25.compact()
+        logger.info(f"Built BM25 index for {len(labels)} chunks in memory; it is saved at the next compaction")
+
+    def _rollback(self):
+        """Discard uncommitted in-memory changes by reloading the last commit"""
+        if self._pending:
+            logger.warning("Discarding uncommitted vector store changes")
+            self.load_index()
+
+    def _docstore_path(self):
+        return os.path.join(self.index_path, DOCSTORE_FILE)
+
+    def _empty_manifest(self):
+        return {'version': 1, 'base': None, 'segments': [], 'generation': 0, 'next_id': 0}
+
+    def _base_path(self):
+        if self.manifest['base']:
+            return os.path.join(self.index_path, self.manifest['base'])
+        return self.index_path
+
+    def _read_manifest(self):
+        path = os.path.join(self.index_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return self._empty_manifest()
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.index_path, exist_ok=True)
+        path = os.path.join(self.index_path, MANIFEST_FILE)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_dir(self.index_path)
+        self.manifest = manifest
+
+    def _replay_segment(self, name):
+        with open(os.path.join(self.index_path, SEGMENTS_DIR, name), 'rb') as f:
+            segment = pickle.load(f)
+        for op in segment['ops']:
+            if op[0] == 'add':
+                self._apply_add(*op[1:])
+            else:
+                _, title, labels = op
+                self.book_ids.pop(title, None)
+                self._apply_remove(labels)
+        self._next_id = max(self._next_id, segment.get('next_id', 0))
+
     def search(self, query, limit=5, subject_filter=None):
-        """Search vector store for relevant chunks"""
+        """
+        Search vector store for relevant chunks.
+        With subject_filter both retrievers run only over chunks of books whose title contains it.
+        'score' is always the L2 distance (lower is better). With HYBRID_SEARCH, vector and BM25
+        hits are fused by reciprocal rank and ordered by 'fused_score' (higher is better); a
+        keyword-only hit has no distance, so its 'score' is None.
+        """
+        self.ensure_loaded()
+        self._maybe_refresh()
         if self.vector_store is None:
             logger.warning("Vector store is empty.")
             return []
 
         try:
-            # Increase k for better filtering results
-            search_k = limit * 4 if subject_filter else limit
-            
-            # FAISS scores: lower is better (L2 distance)
-            docs = self.vector_store.similarity_search_with_score(query, k=search_k)
-            
-            results = []
-            for doc, score in docs:
-                source_title = doc.metadata.get('source', 'Unknown')
-                
-                # If subject filter is specified, prioritize it
-                # We can do this by skipping non-matching ones or just marking them
-                # Let's do simple inclusion filtering if subject_filter is strongly specified
-                # e.g. "English" should match books with "English" in title
-                if subject_filter:
-                    if subject_filter.lower() not in source_title.lower():
-                        continue
-
-                results.append({
-                    'title': source_title,
-                    'content': doc.page_content,
-                    'score': float(score)
-                })
-                
-                if len(results) >= limit:
-                    break
-            
-            # If filtering left us with nothing, fall back to all results
-            if subject_filter and not results:
-                logger.info(f"Subject filter '{subject_filter}' returned no results. Falling back to general search.")
-                for doc, score in docs[:limit]:
-                    results.append({
+            labels = None
+            if subject_filter:
+                labels = self._subject_labels(subject_filter)
+                if not labels:
+                    logger.info(f"Subject filter '{subject_filter}' matches no books. Falling back to general search.")
+                    labels = None
+
+            vector = self._embed_query(query)
+            if not config.HYBRID_SEARCH:
+                # FAISS scores: lower is better (L2 distance)
+                return [
+                    {
                         'title': doc.metadata.get('source', 'Unknown'),
                         'content': doc.page_content,
-                        'score': float(score)
-                    })
-            
-            return results
+                        'score': distance
+                    }
+                    for _, doc, distance in self._knn(vector, limit, labels)
+                ]
+            return [
+                {
+                    'title': doc.metadata.get('source', 'Unknown'),
+                    'content': doc.page_content,
+                    'score': distance,
+                    'fused_score': fused
+                }
+                for doc, distance, fused in self._hybrid(query, vector, limit, labels)
+            ]
         except Exception as e:
             logger.error(f"Vector search failed: {e}")
             return []
+
+    def _hybrid(self, query, vector, limit, labels=None):
+        """Reciprocal rank fusion of vector and BM25 candidates -> [(Document, distance or None, fused score)]"""
+        candidates = max(config.HYBRID_CANDIDATES, limit)
+        fused = {}
+        docs = {}
+        distances = {}
+        for rank, (label, doc, distance) in enumerate(self._knn(vector, candidates, labels)):
+            fused[label] = fused.get(label, 0.0) + 1.0 / (config.RRF_K + rank + 1)
+            docs[label] = doc
+            distances[label] = distance
+        for rank, (label, _) in enumerate(self.bm25.search(query, candidates, labels)):
+            fused[label] = fused.get(label, 0.0) + 1.0 / (config.RRF_K + rank + 1)
+
+        hits = []
+        for label in sorted(fused, key=fused.get, reverse=True):
+            doc = docs.get(label)
+            if doc is None:
+                doc_id = self.vector_store.index_to_docstore_id.get(label)
+                doc = self.vector_store.docstore.search(doc_id) if doc_id is not None else None
+            if isinstance(doc, Document):
+                hits.append((doc, distances.get(label), round(fused[label], 6)))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def _subject_labels(self, subject_filter):
+        """Chunk IDs of every book whose title contains subject_filter (e.g. "English")"""
+        subject = subject_filter.lower()
+        labels = []
+        for title, ids in self.book_ids.items():
+            if subject in title.lower():
+                labels.extend(ids)
+        return labels
+
+    def _knn(self, vector, k, labels=None):
+        """k nearest chunks as (ID, Document, distance), restricted to the given IDs if any"""
+        index = self.vector_store.index
+        selector = None
+        selectivity = 1.0
+        if labels is not None:
+            selector = faiss.IDSelectorBatch(np.asarray(labels, dtype='int64'))
+            selectivity = len(labels) / max(index.ntotal, 1)
+            k = min(k, len(labels))
+        elif self._tombstones:
+            excluded = faiss.IDSelectorBatch(np.asarray(list(self._tombstones), dtype='int64'))
+            selector = faiss.IDSelectorNot(excluded)
+
+        query = np.asarray([vector], dtype='float32')
+        distances, ids = index.search(query, k, params=self.search_params(selector, selectivity))
+
+        results = []
+        for label, distance in zip(ids[0].tolist(), distances[0].tolist()):
+            doc_id = self.vector_store.index_to_docstore_id.get(label)
+            if doc_id is None:
+                continue
+            doc = self.vector_store.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                results.append((label, doc, float(distance)))
+        return results
+
+    def search_params(self, selector=None, selectivity=1.0, index=None):
+        """
+        FAISS search parameters for the index type. A filter that keeps only a fraction of
+        the chunks widens the HNSW beam / IVF probe count by the same factor, so filtered
+        searches still see enough candidates.
+        """
+        inner = faiss.downcast_index((index or self.vector_store.index).index)
+        kwargs = {'sel': selector} if selector is not None else {}
+        widen = 1.0 / max(selectivity, 1e-6)
+        if isinstance(inner, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(efSearch=int(min(config.HNSW_EF_SEARCH * widen, 4096)), **kwargs)
+        if isinstance(inner, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(nprobe=int(min(config.IVF_NPROBE * widen, inner.nlist)), **kwargs)
+        return faiss.SearchParameters(**kwargs) if kwargs else None
@@ -391,7 +391,41 @@ function sendMessage(event, assistantType, customParams = {}) {
         params: customParams
     };
 
-    // Send to API
+    // Send to API (streamed; falls back to the blocking endpoint if streaming is unavailable)
+    if (!window.ReadableStream || !window.TextDecoder) {
+        sendMessageBlocking(requestData, assistantType);
+    } else {
+        sendMessageStreaming(requestData, assistantType);
+    }
+
+    // Focus input
+    input.focus();
+}
+
+// Finish rendering a bot answer (sources, diagrams, download button, sidebar refresh)
+function finishBotMessage(botMessageDiv, sources, assistantType) {
+    // Show sources if available
+    if (sources && sources.length > 0) {
+        const sourcesText = '\n📚 **Reference Materials analyzed:** ' + sources.join(', ');
+        addMessage('bot', sourcesText);
+    }
+
+    // Trigger visual rendering for mind maps/diagrams
+    renderDiagrams();
+
+    // Add Download Button for relevant assistants
+    if (['mind_map', 'exam', 'study_plan'].includes(assistantType)) {
+        addDownloadButton(botMessageDiv, assistantType);
+    }
+
+    // Refresh history sidebar
+    if (typeof assistantType !== 'undefined') {
+        loadHistory(assistantType, true); // true means refresh sidebar only
+    }
+}
+
+// Send a message and wait for the full JSON answer
+function sendMessageBlocking(requestData, assistantType) {
     fetch('/api/chat', {
         method: 'POST',
         headers: {
@@ -408,25 +442,7 @@ function sendMessage(event, assistantType, customParams = {}) {
 
             if (data.success) {
                 const botMessageDiv = addMessage('bot', data.response);
-
-                // Show sources if available
-                if (data.sources && data.sources.length > 0) {
-                    const sourcesText = '\n📚 **Reference Materials analyzed:** ' + data.sources.join(', ');
-                    addMessage('bot', sourcesText);
-                }
-
-                // Trigger visual rendering for mind maps/diagrams
-                renderDiagrams();
-
-                // Add Download Button for relevant assistants
-                if (['mind_map', 'exam', 'study_plan'].includes(assistantType)) {
-                    addDownloadButton(botMessageDiv, assistantType);
-                }
-
-                // Refresh history sidebar
-                if (typeof assistantType !== 'undefined') {
-                    loadHistory(assistantType, true); // true means refresh sidebar only
-                }
+                finishBotMessage(botMessageDiv, data.sources, assistantType);
             } else {
                 addMessage('bot', '❌ Error: ' + (data.error || 'Unknown error occurred'));
             }
@@ -436,25 +452,100 @@ function sendMessage(event, assistantType, customParams = {}) {
             console.error('Error:', error);
             addMessage('bot', '❌ Error: Failed to get response. Please try again.');
         });
+}
 
-    // Focus input
-    input.focus();
+// Send a message and render the answer as Server-Sent Events arrive
+async function sendMessageStreaming(requestData, assistantType) {
+    let botMessageDiv = null;
+    let text = '';
+
+    try {
+        const response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestData)
+        });
+        if (!response.ok || !response.body) throw new Error('Network error');
+
+        const container = document.getElementById('messagesContainer');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE frames are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.substring(0, boundary);
+                buffer = buffer.substring(boundary + 2);
+
+                let event = 'message';
+                let data = '';
+                frame.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) event = line.substring(6).trim();
+                    else if (line.startsWith('data:')) data += line.substring(5).trim();
+                });
+                if (!data) continue;
+                const payload = JSON.parse(data);
+
+                if (event === 'done') {
+                    removeLoading();
+                    if (!botMessageDiv) botMessageDiv = addMessage('bot', text);
+                    finishBotMessage(botMessageDiv, payload.sources, assistantType);
+                    finished = true;
+                    break;
+                } else if (event === 'error') {
+                    throw new Error(payload.error || 'Unknown error occurred');
+                } else if (payload.delta) {
+                    text += payload.delta;
+                    if (!botMessageDiv) {
+                        removeLoading();
+                        botMessageDiv = addMessage('bot', text);
+                    } else {
+                        botMessageDiv.querySelector('.message-content').innerHTML = formatText(text);
+                        container.scrollTop = container.scrollHeight;
+                    }
+                }
+            }
+        }
+
+        // Stream closed without a 'done' event (e.g. proxy cut the connection)
+        if (!finished) {
+            removeLoading();
+            if (!botMessageDiv) throw new Error('Empty response');
+            finishBotMessage(botMessageDiv, [], assistantType);
+        }
+    } catch (error) {
+        removeLoading();
+        console.error('Error:', error);
+        addMessage('bot', '❌ Error: Failed to get response. Please try again.');
+    }
 }
 
+// Number of recent conversations restored as chat bubbles on page load
+const HISTORY_RESTORE_LIMIT = 20;
+// Sidebar history page size (summaries only)
+const HISTORY_PAGE_SIZE = 50;
+
 // Function to load conversation history
 function loadHistory(assistantType, refreshOnly = false) {
     const container = document.getElementById('messagesContainer');
-    const historyList = document.getElementById('sidebarHistoryList');
 
     console.log(`Loading history for ${assistantType} (refreshOnly: ${refreshOnly})`);
 
-    fetch(`/api/conversation-history?type=${assistantType}&limit=500`)
-        .then(response => response.json())
-        .then(data => {
-            console.log('History data received:', data);
-            if (data.success && data.conversations.length > 0) {
-                // Restore chat bubbles (chronological)
-                if (!refreshOnly && container) {
+    // Restore recent chat bubbles (full bodies, most recent page only)
+    if (!refreshOnly && container) {
+        fetch(`/api/conversation-history?type=${assistantType}&limit=${HISTORY_RESTORE_LIMIT}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.success && data.conversations.length > 0) {
                     const chats = [...data.conversations].reverse();
                     chats.forEach(conv => {
                         addMessage('user', conv.user_message);
@@ -467,31 +558,66 @@ function loadHistory(assistantType, refreshOnly = false) {
                     });
                     container.scrollTop = container.scrollHeight;
                 }
+            })
+            .catch(error => console.error('Error loading history:', error));
+    }
 
-                // Populate Sidebar History
-                if (historyList) {
-                    historyList.innerHTML = '';
-                    data.conversations.forEach(conv => {
-                        const item = document.createElement('div');
-                        item.className = 'history-item';
+    // Populate Sidebar History (summaries, paginated)
+    loadHistoryPage(assistantType, null);
+}
+
+// Load one page of sidebar history; cursor is the previous page's next_cursor
+function loadHistoryPage(assistantType, cursor) {
+    const historyList = document.getElementById('sidebarHistoryList');
+    if (!historyList) return;
 
-                        const snippet = conv.user_message.length > 60
-                            ? conv.user_message.substring(0, 60) + '...'
-                            : conv.user_message;
+    let url = `/api/conversation-history?type=${assistantType}&fields=summary&limit=${HISTORY_PAGE_SIZE}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
 
-                        item.innerHTML = `
-                            <div class="history-item-text">${snippet}</div>
-                            <div class="history-item-date">${conv.created_at || 'Recent'}</div>
-                        `;
+    fetch(url)
+        .then(response => response.json())
+        .then(data => {
+            console.log('History data received:', data);
+            if (!data.success) return;
+
+            if (!cursor) historyList.innerHTML = '';
+            const oldMore = historyList.querySelector('.history-load-more');
+            if (oldMore) oldMore.remove();
+
+            data.conversations.forEach(conv => {
+                const item = document.createElement('div');
+                item.className = 'history-item';
+
+                const snippet = conv.user_message.length > 60
+                    ? conv.user_message.substring(0, 60) + '...'
+                    : conv.user_message;
+
+                item.innerHTML = `
+                    <div class="history-item-text">${snippet}</div>
+                    <div class="history-item-date">${conv.created_at || 'Recent'}</div>
+                `;
+
+                // Click handler: fetch the full conversation and load it into chat
+                item.addEventListener('click', () => {
+                    fetch(`/api/conversation/${conv.id}`)
+                        .then(response => response.json())
+                        .then(full => {
+                            if (full.success) {
+                                loadConversationIntoChat(full.conversation.user_message, full.conversation.ai_response);
+                            }
+                        })
+                        .catch(error => console.error('Error loading conversation:', error));
+                });
 
-                        // Click handler to load this conversation into chat
-                        item.addEventListener('click', () => {
-                            loadConversationIntoChat(conv.user_message, conv.ai_response);
-                        });
+                historyList.appendChild(item);
+            });
 
-                        historyList.appendChild(item);
-                    });
-                }
+            if (data.next_cursor) {
+                const more = document.createElement('div');
+                more.className = 'history-item history-load-more';
+                more.innerHTML = '<div class="history-item-text">Load more…</div>';
+                more.addEventListener('click', () => loadHistoryPage(assistantType, data.next_cursor));
+                historyList.appendChild(more);
             }
         })
         .catch(error => console.error('Error loading history:', error));
@@ -0,0 +1,140 @@
+"""
+Shared fixtures for the pytest suites. Everything runs in a temporary directory, so the
+tracked skillcode.db and vector_store/ are never touched.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """A fresh src.database_sqlite.Database in tmp_path (the class is a singleton)"""
+    from src.database_sqlite import Database
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Database, '_instance', None)
+    db = Database()
+    yield db
+    db.pool.close_all()
+
+class HashEmbeddings:
+    """Deterministic bag-of-words embeddings, so vector tests need no model download"""
+    dim = 64
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        import re
+        import zlib
+
+        import numpy as np
+        vector = np.zeros(self.dim, dtype='float32')
+        for word in re.findall(r'\w+', text.lower()):
+            vector[zlib.crc32(word.encode('utf-8')) % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+@pytest.fixture
+def make_vector_db(tmp_path, monkeypatch):
+    """Factory of VectorDB instances over the same vector_store in tmp_path (like separate processes)"""
+    from src.vector_db import VectorDB
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(VectorDB, '_load_embeddings', lambda self: HashEmbeddings())
+    created = []
+
+    def make(index_path="vector_store"):
+        vdb = VectorDB(index_path)
+        created.append(vdb)
+        return vdb
+
+    yield make
+    for vdb in created:
+        vdb.close_embed_pool()
+
+def book_text(topic, sentences=12):
+    """A book long enough to split into several chunks, all about topic"""
+    return " ".join(f"Sentence {i} explains {topic} in detail with {topic} examples." for i in range(sentences * 10))
+
+class ScriptedLLMServer(ThreadingHTTPServer):
+    """
+    Chat completions endpoint that answers after `delay` seconds. Statuses are popped from
+    `statuses` first, then `status` is used; a 429 carries `retry_after`.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), _ScriptedLLMHandler)
+        self.delay = delay
+        self.statuses = []
+        self.status = 200
+        self.retry_after = '0'
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.peak = 0
+        self.peak_by_user = {}
+        self.active_by_user = {}
+
+class _ScriptedLLMHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        user = payload.get('user')
+        with server.lock:
+            server.requests += 1
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+            server.active_by_user[user] = server.active_by_user.get(user, 0) + 1
+            server.peak_by_user[user] = max(server.peak_by_user.get(user, 0), server.active_by_user[user])
+            status = server.statuses.pop(0) if server.statuses else server.status
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+            server.active_by_user[user] -= 1
+        body = json.dumps({'choices': [{'message': {'content': 'ok'}}], 'usage': {'total_tokens': 10}}).encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', server.retry_after)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def llm_server():
+    """A running ScriptedLLMServer"""
+    server = ScriptedLLMServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def make_gateway(llm_server, monkeypatch):
+    """Factory of LLMGateway instances talking to llm_server, closed afterwards"""
+    from src import config
+    from src.llm_gateway import LLMGateway
+    monkeypatch.setattr(config, 'LLM_RETRY_BASE_DELAY', 0.01)
+    backend = SimpleNamespace(base_url=f"http://127.0.0.1:{llm_server.server_port}", headers=lambda: {})
+    gateways = []
+
+    def make(**kwargs):
+        gateway = LLMGateway(backend, **kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
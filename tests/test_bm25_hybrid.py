@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import pytest
+
+from src import config
+from src.bm25_index import BM25Index, tokenize
+from conftest import book_text
+
+def test_arabic_prefixes_are_stemmed():
+    assert tokenize("والخبر") == tokenize("الخبر") == tokenize("خبر")
+
+def test_stopwords_digits_and_single_letters_are_dropped():
+    assert tokenize("What is the 2 x factor?") == ["factor"]
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.add([1, 2, 3], ["المبتدأ والخبر في الجملة الاسمية", "الفعل والفاعل", "the subject and the predicate"])
+    return index
+
+def test_keyword_search_ranks_matching_chunks(index):
+    assert [label for label, _ in index.search("الخبر")] == [1]
+    assert index.search("nothing matches") == []
+
+def test_search_respects_removals_and_allowed_ids(index):
+    assert index.search("subject", allowed=[1, 2]) == []
+    index.remove([1])
+    assert index.search("المبتدأ") == []
+
+def test_compact_and_save_round_trip(index, tmp_path):
+    index.remove([2])
+    index.add([4], ["predicate logic"])
+    before = index.search("predicate")
+    index.compact()
+    index.save(str(tmp_path / "bm25"))
+    loaded = BM25Index.load(str(tmp_path / "bm25"))
+    assert loaded.n_docs == 3
+    assert loaded.search("predicate") == pytest.approx(before)
+    assert loaded.search("الفعل") == []
+
+@pytest.fixture
+def vdb(make_vector_db, monkeypatch):
+    monkeypatch.setattr(config, 'HYBRID_SEARCH', True)
+    vdb = make_vector_db()
+    vdb.add_books([("Grammar", book_text("grammar")), ("Biology", book_text("cells"))])
+    return vdb
+
+def test_rrf_fuses_both_rankings(vdb, monkeypatch):
+    store = vdb.vector_store
+    a, b, c = sorted(store.index_to_docstore_id)[:3]
+    docs = {label: store.docstore.search(store.index_to_docstore_id[label]) for label in (a, b, c)}
+    monkeypatch.setattr(vdb, '_knn', lambda vector, k, labels=None: [(a, docs[a], 0.5), (b, docs[b], 0.7)])
+    monkeypatch.setattr(vdb.bm25, 'search', lambda query, k, allowed=None: [(b, 9.0), (c, 4.0)])
+
+    results = vdb.search("anything", limit=3)
+    rrf = lambda rank: 1.0 / (config.RRF_K + rank + 1)
+    # b is in both lists, so it beats a (vector rank 0) and c (keyword rank 1)
+    assert [hit['content'] for hit in results] == [docs[b].page_content, docs[a].page_content, docs[c].page_content]
+    assert [hit['fused_score'] for hit in results] == pytest.approx([rrf(1) + rrf(0), rrf(0), rrf(1)], abs=1e-6)
+    # 'score' stays the vector distance; a keyword-only hit has none
+    assert [hit['score'] for hit in results] == [0.7, 0.5, None]
+
+def test_vector_only_results_have_no_fused_score(vdb, monkeypatch):
+    monkeypatch.setattr(config, 'HYBRID_SEARCH', False)
+    results = vdb.search("grammar", limit=3)
+    assert results and all('fused_score' not in hit and hit['score'] >= 0 for hit in results)
+    assert [hit['score'] for hit in results] == sorted(hit['score'] for hit in results)
+
+def test_readers_build_bm25_in_memory_only(vdb, make_vector_db):
+    bm25_path = os.path.join(vdb._base_path(), "bm25")
+    shutil.rmtree(bm25_path)
+    reader = make_vector_db()
+    reader.ensure_loaded()
+    assert reader.bm25.n_docs == len(reader.vector_store.index_to_docstore_id)
+    assert reader.search("grammar", limit=1)[0]['title'] == "Grammar"
+    assert not os.path.exists(bm25_path)
+
+    # The writer persists it with the next base
+    reader.load_index(mmap=False)
+    reader.compact()
+    assert os.path.exists(os.path.join(reader._base_path(), "bm25", "vocab.json"))
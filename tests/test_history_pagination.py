@@ -0,0 +1,62 @@
+import pytest
+
+from src.database_sqlite import SUMMARY_PREVIEW_CHARS
+
+USER = 1
+
+@pytest.fixture
+def history(sqlite_db):
+    for i in range(25):
+        sqlite_db.save_conversation(USER, 'exam' if i % 3 == 0 else 'general', f"question {i}", f"answer {i} " + "x" * 500)
+    sqlite_db.save_conversation(2, 'general', "someone else", "not yours")
+    conn = sqlite_db.get_connection()
+    try:
+        # Several rows share a timestamp, so id has to break the tie
+        conn.execute("UPDATE conversations SET created_at = '2024-01-01 10:00:00' WHERE id <= 10")
+        conn.commit()
+    finally:
+        conn.close()
+    return sqlite_db
+
+def all_pages(db, assistant_type='all', limit=7, fields='full'):
+    pages, cursor = [], None
+    while True:
+        page = db.get_conversations(USER, assistant_type, limit=limit, cursor=cursor, fields=fields)
+        pages.append(page)
+        if len(page) < limit:
+            return pages
+        cursor = db.encode_cursor(page[-1])
+
+def test_pages_cover_history_once_newest_first(history):
+    rows = [row for page in all_pages(history) for row in page]
+    ids = [row['id'] for row in rows]
+    assert len(ids) == 25 and len(set(ids)) == 25
+    keys = [(row['created_at'], row['id']) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+
+def test_assistant_type_filter_with_cursor(history):
+    rows = [row for page in all_pages(history, 'exam', limit=3) for row in page]
+    assert len(rows) == 9
+    assert all(row['user_message'] in {f"question {i}" for i in range(0, 25, 3)} for row in rows)
+
+def test_summary_fields_are_truncated(history):
+    page = history.get_conversations(USER, limit=5, fields='summary')
+    assert all(len(row['ai_response']) == SUMMARY_PREVIEW_CHARS for row in page)
+
+def test_cursor_round_trip_and_bad_cursor(history):
+    row = history.get_conversations(USER, limit=1)[0]
+    assert history.decode_cursor(history.encode_cursor(row)) == (row['created_at'], row['id'])
+    with pytest.raises(ValueError):
+        history.get_conversations(USER, cursor="garbage")
+
+def test_page_query_is_an_index_range_scan(history):
+    conn = history.get_connection()
+    try:
+        plan = " ".join(row[3] for row in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM conversations WHERE user_id = ? AND (created_at, id) < (?, ?) "
+            "ORDER BY created_at DESC, id DESC LIMIT 20", (USER, '2030-01-01', 1)
+        ))
+    finally:
+        conn.close()
+    assert "idx_conversations_user_created_id" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from src import ingestion
+
+PAGES = 3
+
+def fake_ocr_page(file_path, page_index):
+    """Runs in the spawned OCR workers; a 'crash' book takes its worker down like an OOM kill"""
+    if 'crash' in os.path.basename(file_path):
+        os._exit(1)
+    return page_index, f"{os.path.basename(file_path)} page {page_index}. "
+
+class FakeDatabase:
+    def __init__(self, sql_db):
+        self.sql_db = sql_db
+        self.added = []
+
+    def get_book_hashes(self):
+        return {}
+
+    def add_books(self, books):
+        self.added.extend(books)
+        return True
+
+    @property
+    def vector_db(self):
+        return self
+
+    def embedding_stats(self):
+        return {'chunks': 0, 'seconds': 0.0}
+
+    def close_embed_pool(self):
+        pass
+
+@pytest.fixture
+def books_dir(tmp_path):
+    root = tmp_path / "books"
+    for relative in ("a/notes.pdf", "b/notes.pdf", "crash.pdf", "ok.pdf"):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(relative.encode())
+    return root
+
+@pytest.fixture
+def pipeline(sqlite_db, monkeypatch):
+    monkeypatch.setattr(ingestion, 'pdf_page_count', lambda file_path: PAGES)
+    monkeypatch.setattr(ingestion, 'ocr_page', fake_ocr_page)
+    db = FakeDatabase(sqlite_db)
+    return db, ingestion.IngestionPipeline(db, workers=2, embed_batch_books=10)
+
+def test_dead_worker_fails_its_book_and_the_run_continues(pipeline, books_dir):
+    db, pipe = pipeline
+    stats = pipe.run(str(books_dir))
+    assert stats['failed'] == 1
+    assert stats['indexed'] == 3
+    titles = sorted(book['title'] for book in db.added)
+    assert titles == ['a/notes.pdf', 'b/notes.pdf', 'ok.pdf']
+    crash = db.sql_db.get_ingest_state(str(books_dir / "crash.pdf"))
+    assert crash['status'] == 'failed'
+
+def test_same_file_names_in_different_folders_stay_apart(books_dir):
+    assert ingestion.book_title(str(books_dir / "a" / "notes.pdf"), str(books_dir)) == 'a/notes.pdf'
+    assert ingestion.book_title(str(books_dir / "ok.pdf"), str(books_dir)) == 'ok.pdf'
@@ -0,0 +1,68 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from src import config
+from src.llm_gateway import GatewayBusyError
+
+def payload(user):
+    return {'messages': [{'role': 'user', 'content': 'hi'}], 'user': user}
+
+def post_many(gateway, users):
+    """Post one completion per user from separate threads, like concurrent chat requests"""
+    def post(user):
+        try:
+            return gateway.post(payload(user), user=user).status_code
+        except GatewayBusyError:
+            return 'busy'
+    with ThreadPoolExecutor(len(users)) as pool:
+        return list(pool.map(post, users))
+
+def test_defaults_leave_gunicorn_threads_free():
+    assert config.LLM_MAX_CONCURRENCY + config.LLM_MAX_QUEUE < config.GUNICORN_THREADS
+
+def test_global_concurrency_cap(llm_server, make_gateway):
+    llm_server.delay = 0.2
+    gateway = make_gateway(max_concurrency=3, max_per_user=10, max_queue=20)
+    assert post_many(gateway, [f"u{i}" for i in range(8)]) == [200] * 8
+    assert llm_server.peak == 3
+    assert gateway.stats()['peak_in_flight'] == 3
+
+def test_per_user_cap(llm_server, make_gateway):
+    llm_server.delay = 0.2
+    gateway = make_gateway(max_concurrency=10, max_per_user=2, max_queue=20)
+    assert post_many(gateway, ["alice"] * 5 + ["bob"]) == [200] * 6
+    assert llm_server.peak_by_user["alice"] == 2
+    assert gateway.stats()['active_users'] == 0
+
+def test_full_queue_turns_callers_away(llm_server, make_gateway):
+    llm_server.delay = 0.5
+    gateway = make_gateway(max_concurrency=1, max_per_user=10, max_queue=2)
+    results = post_many(gateway, [f"u{i}" for i in range(6)])
+    # One in flight and two queued; the rest are rejected at once
+    assert results.count(200) == 3 and results.count('busy') == 3
+    assert gateway.stats()['rejected'] == 3
+
+def test_queue_timeout(llm_server, make_gateway):
+    llm_server.delay = 0.5
+    gateway = make_gateway(max_concurrency=1, max_per_user=10, max_queue=10, queue_timeout=0.1)
+    assert sorted(post_many(gateway, ["a", "b"]), key=str) == [200, 'busy']
+
+def test_429_is_retried(llm_server, make_gateway):
+    llm_server.statuses = [429, 503]
+    gateway = make_gateway(max_retries=3)
+    assert gateway.post(payload("alice"), user="alice").status_code == 200
+    assert llm_server.requests == 3
+    assert gateway.stats()['retries'] == 2
+
+def test_last_error_is_returned_after_the_final_attempt(llm_server, make_gateway):
+    llm_server.statuses = [503, 503]
+    gateway = make_gateway(max_retries=2)
+    assert gateway.post(payload("alice"), user="alice").status_code == 503
+    assert llm_server.requests == 2
+
+def test_stream_yields_response_then_lines(llm_server, make_gateway):
+    gateway = make_gateway()
+    chunks = list(gateway.stream(payload("alice"), user="alice"))
+    assert chunks[0].status_code == 200
+    assert json.loads("".join(chunks[1:]))['choices'][0]['message']['content'] == 'ok'
+    assert gateway.stats()['connections_opened'] >= 1
@@ -0,0 +1,184 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from src import config, llm_resilience
+from src.llm_resilience import (CircuitBreaker, CircuitOpenError, RateLimiter, RateLimitWaitError, TokenBucket,
+                                backoff_delay, parse_retry_after)
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock for the module; asyncio.sleep advances it instead of waiting"""
+    clock = SimpleNamespace(now=1000.0)
+
+    async def sleep(seconds):
+        clock.now += seconds
+
+    monkeypatch.setattr(llm_resilience, 'time', SimpleNamespace(monotonic=lambda: clock.now, time=time.time))
+    monkeypatch.setattr(llm_resilience, 'asyncio', SimpleNamespace(sleep=sleep))
+    return clock
+
+# --- RETRY-AFTER AND BACK-OFF ---
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-2") == 0.0
+
+def test_parse_retry_after_http_date():
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+@pytest.mark.parametrize("value", [None, "", "soon", "Mon, 99 Foo"])
+def test_parse_retry_after_garbage(value):
+    assert parse_retry_after(value) is None
+
+def test_backoff_is_jittered_under_the_cap():
+    for attempt in range(8):
+        delays = [backoff_delay(attempt, base=1, cap=4) for _ in range(50)]
+        assert all(0 <= delay <= min(4, 2 ** attempt) for delay in delays)
+    assert len({backoff_delay(3, base=1, cap=4) for _ in range(20)}) > 1
+
+def test_backoff_honours_retry_after():
+    assert all(5 <= backoff_delay(0, retry_after=5, base=0.5) <= 5.5 for _ in range(50))
+
+# --- RATE LIMITER ---
+
+def test_token_bucket_refills_at_its_rate(clock):
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1, clock.now) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.wait_time(30, clock.now) == 0.0
+    # Never fuller than a minute's worth
+    clock.now += 600
+    assert bucket.wait_time(0, clock.now) == 0.0 and bucket.level == 60
+
+def test_limiter_paces_calls_past_the_burst(clock):
+    limiter = RateLimiter(rpm=60, tpm=0)
+    start = clock.now
+
+    async def calls():
+        for _ in range(62):
+            await limiter.acquire(1, max_wait=10)
+    asyncio.run(calls())
+    assert clock.now - start == pytest.approx(2.0)
+    assert limiter.stats()['rate_limited_calls'] == 2
+
+def test_limiter_refuses_waits_past_max_wait(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000)
+    asyncio.run(limiter.acquire(1000, max_wait=0))
+    with pytest.raises(RateLimitWaitError):
+        asyncio.run(limiter.acquire(500, max_wait=5))
+    # The refused call took nothing
+    clock.now += 30
+    asyncio.run(limiter.acquire(500, max_wait=0))
+
+def test_pause_holds_every_call(clock):
+    limiter = RateLimiter(rpm=0, tpm=0)
+    limiter.pause(7)
+    start = clock.now
+    asyncio.run(limiter.acquire(1, max_wait=10))
+    assert clock.now - start == pytest.approx(7)
+    limiter.pause(7)
+    with pytest.raises(RateLimitWaitError):
+        asyncio.run(limiter.acquire(1, max_wait=1))
+
+def test_correct_charges_actual_usage(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000)
+    asyncio.run(limiter.acquire(100, max_wait=0))
+    limiter.correct(100, 400)
+    assert limiter.stats()['tpm_available'] == 600
+    limiter.correct(100, None)
+    assert limiter.stats()['tpm_available'] == 600
+
+def test_limits_are_split_across_workers(monkeypatch):
+    monkeypatch.setattr(config, 'LLM_RATE_RPM', 120)
+    monkeypatch.setattr(config, 'LLM_RATE_TPM', 0)
+    monkeypatch.setattr(config, 'WEB_CONCURRENCY', 4)
+    limiter = RateLimiter()
+    assert limiter.requests.capacity == 30 and limiter.tokens is None
+
+# --- CIRCUIT BREAKER ---
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.check()
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open' and breaker.stats()['breaker_opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.before_call()
+    breaker.release_probe()
+    breaker.before_call()
+    assert breaker.state == 'half_open'
+
+# --- GATEWAY ---
+
+def payload():
+    return {'messages': [{'role': 'user', 'content': 'hi'}]}
+
+def test_gateway_fails_fast_while_the_circuit_is_open(llm_server, make_gateway, monkeypatch):
+    monkeypatch.setattr(config, 'LLM_BREAKER_FAILURES', 3)
+    monkeypatch.setattr(config, 'LLM_BREAKER_COOLDOWN', 0.5)
+    llm_server.status = 503
+    gateway = make_gateway(max_retries=3)
+    assert gateway.post(payload()).status_code == 503
+    assert llm_server.requests == 3 and gateway.breaker.state == 'open'
+
+    with pytest.raises(CircuitOpenError):
+        gateway.post(payload())
+    with pytest.raises(CircuitOpenError):
+        list(gateway.stream(payload()))
+    assert llm_server.requests == 3
+
+    time.sleep(0.5)
+    llm_server.status = 200
+    assert gateway.post(payload()).status_code == 200
+    assert gateway.breaker.state == 'closed'
+
+def test_gateway_gives_up_on_a_long_retry_after(llm_server, make_gateway):
+    llm_server.statuses = [429]
+    llm_server.retry_after = '60'
+    gateway = make_gateway(max_retries=3)
+    assert gateway.post(payload()).status_code == 429
+    assert llm_server.requests == 1
+    # Every later call in the worker is held for the provider's window
+    assert gateway.limiter.paused_until - time.monotonic() == pytest.approx(60, abs=2)
+    # A 429 shows the upstream is alive
+    assert gateway.breaker.state == 'closed'
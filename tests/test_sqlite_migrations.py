@@ -0,0 +1,67 @@
+import pytest
+
+from src import database_sqlite
+from src.database_sqlite import MIGRATIONS
+
+def versions(db):
+    conn = db.get_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+    finally:
+        conn.close()
+
+def indexes(db):
+    conn = db.get_connection()
+    try:
+        return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+
+def test_fresh_database_gets_every_migration(sqlite_db):
+    assert versions(sqlite_db) == [version for version, _, _ in MIGRATIONS]
+    assert 'idx_conversations_user_created_id' in indexes(sqlite_db)
+    assert 'idx_conversations_user_created' not in indexes(sqlite_db)
+
+def test_versions_are_ordered_and_unique():
+    numbers = [version for version, _, _ in MIGRATIONS]
+    assert numbers == sorted(set(numbers))
+
+def test_migrate_again_is_a_no_op(sqlite_db):
+    conn = sqlite_db.get_connection()
+    try:
+        sqlite_db.migrate(conn)
+        sqlite_db.init_db()
+    finally:
+        conn.close()
+    assert versions(sqlite_db) == [version for version, _, _ in MIGRATIONS]
+
+def test_failed_migration_is_rolled_back(sqlite_db, monkeypatch):
+    latest = MIGRATIONS[-1][0]
+    monkeypatch.setattr(database_sqlite, 'MIGRATIONS', MIGRATIONS + [
+        (latest + 1, "Broken", [
+            "CREATE TABLE half_done (x INTEGER)",
+            "THIS IS NOT SQL",
+        ]),
+    ])
+    conn = sqlite_db.get_connection()
+    try:
+        with pytest.raises(Exception):
+            sqlite_db.migrate(conn)
+        assert sqlite_db.get_schema_version(conn) == latest
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    finally:
+        conn.close()
+
+def test_pending_migration_is_applied_once(sqlite_db, monkeypatch):
+    latest = MIGRATIONS[-1][0]
+    monkeypatch.setattr(database_sqlite, 'MIGRATIONS', MIGRATIONS + [
+        (latest + 1, "Extra column", ["ALTER TABLE users ADD COLUMN nickname TEXT"]),
+    ])
+    conn = sqlite_db.get_connection()
+    try:
+        sqlite_db.migrate(conn)
+        # A second run would fail on the duplicate column if it were not skipped
+        sqlite_db.migrate(conn)
+        assert sqlite_db.get_schema_version(conn) == latest + 1
+    finally:
+        conn.close()
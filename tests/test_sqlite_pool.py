@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src import config
+from src.database_sqlite import ConnectionPool
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=2)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.close()
+    yield pool
+    pool.close_all()
+
+def count(pool):
+    conn = pool.acquire()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_close_returns_the_connection_for_reuse(pool):
+    first = pool.acquire()
+    raw = first._conn
+    first.close()
+    second = pool.acquire()
+    assert second._conn is raw
+    second.close()
+    assert pool._created == 1
+
+def test_pragmas_and_row_factory(pool):
+    conn = pool.acquire()
+    try:
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == int(config.SQLITE_BUSY_TIMEOUT)
+        assert isinstance(conn.execute("SELECT 1 AS one").fetchone(), sqlite3.Row)
+    finally:
+        conn.close()
+
+def test_pool_is_bounded_and_times_out(pool, monkeypatch):
+    monkeypatch.setattr(config, 'SQLITE_BUSY_TIMEOUT', 50)
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    held[0].close()
+    conn = pool.acquire()
+    assert pool._created == 2
+    conn.close()
+    held[1].close()
+
+def test_waiter_gets_a_released_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    held[0].close()
+    waiter.join(timeout=5)
+    assert got and got[0]._conn is not None
+    got[0].close()
+    held[1].close()
+
+def test_release_rolls_back_an_open_transaction(pool):
+    conn = pool.acquire()
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    assert count(pool) == 0
+
+def test_with_block_commits(pool):
+    conn = pool.acquire()
+    with conn as c:
+        assert c is conn
+        c.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+    assert count(pool) == 1
+
+def test_with_block_rolls_back_on_error(pool):
+    conn = pool.acquire()
+    with pytest.raises(ValueError):
+        with conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("boom")
+    conn.close()
+    assert count(pool) == 0
+
+def test_forked_child_starts_a_fresh_pool(pool, monkeypatch):
+    conn = pool.acquire()
+    conn.close()
+    monkeypatch.setattr(pool, '_pid', -1)
+    fresh = pool.acquire()
+    assert pool._created == 1 and pool._idle.qsize() == 0
+    fresh.close()
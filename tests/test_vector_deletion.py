@@ -0,0 +1,46 @@
+import pytest
+
+from src import config
+from conftest import book_text
+
+def titles(results):
+    return {hit['title'] for hit in results}
+
+@pytest.fixture(params=['flat', 'hnsw'])
+def vdb(request, make_vector_db, monkeypatch):
+    # hnsw cannot remove vectors, so deletions are tombstoned instead
+    monkeypatch.setattr(config, 'VECTOR_INDEX_TYPE', request.param)
+    vdb = make_vector_db()
+    assert vdb.add_books([("Physics", book_text("gravity")), ("Chemistry", book_text("molecules"))])
+    return vdb
+
+def test_book_ids_map_every_chunk(vdb):
+    ids = vdb.book_ids["Physics"] + vdb.book_ids["Chemistry"]
+    assert len(ids) == len(set(ids)) == len(vdb.vector_store.index_to_docstore_id)
+
+def test_remove_book_drops_its_chunks(vdb):
+    removed = len(vdb.book_ids["Physics"])
+    assert vdb.remove_book("Physics") == removed
+    assert "Physics" not in vdb.book_ids
+    assert titles(vdb.search("gravity", limit=10)) == {"Chemistry"}
+
+def test_replace_book_swaps_content(vdb):
+    old_ids = set(vdb.book_ids["Physics"])
+    assert vdb.replace_book("Physics", book_text("quantum"))
+    assert not old_ids & set(vdb.book_ids["Physics"])
+    contents = [hit['content'] for hit in vdb.search("quantum gravity", limit=10) if hit['title'] == "Physics"]
+    assert contents and all("gravity" not in content for content in contents)
+
+def test_ids_survive_reload(vdb, make_vector_db):
+    other = make_vector_db()
+    other.ensure_loaded()
+    assert other.book_ids == vdb.book_ids
+
+def test_replace_with_no_text_keeps_the_old_chunks(vdb):
+    before = list(vdb.book_ids["Physics"])
+    assert vdb.add_books([("Physics", "")], replace=True) is False
+    assert vdb.book_ids["Physics"] == before
+    assert not vdb._pending
+    # The next unrelated commit must not carry the removal
+    assert vdb.add_books([("Biology", book_text("cells"))])
+    assert vdb.book_ids["Physics"] == before
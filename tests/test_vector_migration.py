@@ -0,0 +1,77 @@
+import os
+
+import faiss
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from src import config, ingestion
+from src.vector_db import SQLiteDocstore
+from conftest import HashEmbeddings, book_text
+
+MMAP = hasattr(faiss, 'IO_FLAG_MMAP_IFC')
+
+@pytest.fixture
+def legacy_store(make_vector_db):
+    """A store as the app shipped it: LangChain save_local with a positional index and a pickled docstore"""
+    docs = [Document(page_content=f"Chapter {i} on grammar and syntax", metadata={"source": "Arabic Grammar"}) for i in range(5)]
+    docs += [Document(page_content=f"Lesson {i} on plants and cells", metadata={"source": "Biology"}) for i in range(3)]
+    FAISS.from_documents(docs, HashEmbeddings()).save_local("vector_store")
+    return make_vector_db
+
+@pytest.fixture
+def run(sqlite_db, tmp_path):
+    """run_ingestion over an empty books folder, so only the end-of-run compaction does anything"""
+    class Db:
+        def __init__(self, vector_db):
+            self.sql_db = sqlite_db
+            self.vector_db = vector_db
+
+        def get_book_hashes(self):
+            return {}
+
+    (tmp_path / "books").mkdir()
+    return lambda vdb: ingestion.run_ingestion(Db(vdb), str(tmp_path / "books"))
+
+def test_legacy_store_loads_but_needs_compaction(legacy_store):
+    vdb = legacy_store()
+    vdb.ensure_loaded()
+    assert len(vdb.book_ids["Arabic Grammar"]) == 5
+    assert not vdb._mmapped
+    assert vdb.needs_compaction()
+
+def test_first_commit_migrates_the_legacy_base(legacy_store):
+    vdb = legacy_store()
+    assert vdb.add_books([("Physics", book_text("gravity"))])
+    assert vdb.manifest['base'] == 'base-000001' and vdb.manifest['segments'] == []
+    assert os.path.exists(os.path.join("vector_store", "docstore.db"))
+    assert not vdb.needs_compaction()
+
+    reader = legacy_store()
+    reader.ensure_loaded()
+    assert isinstance(reader.vector_store.docstore, SQLiteDocstore)
+    assert isinstance(reader.vector_store.index, faiss.IndexIDMap2)
+    assert reader._mmapped == MMAP
+    assert sorted(reader.book_ids) == ["Arabic Grammar", "Biology", "Physics"]
+    assert reader.search("grammar syntax", limit=1)[0]['title'] == "Arabic Grammar"
+
+def test_ingestion_run_compacts_segments(legacy_store, run, monkeypatch):
+    monkeypatch.setattr(config, 'VECTOR_COMPACT_SEGMENTS', 16)
+    vdb = legacy_store()
+    vdb.add_books([("Physics", book_text("gravity"))])
+    vdb.add_books([("Chemistry", book_text("molecules"))])
+    assert vdb.manifest['segments'] and vdb.needs_compaction()
+
+    assert run(vdb) is not None
+    assert vdb.manifest['segments'] == [] and not vdb.needs_compaction()
+
+    reader = legacy_store()
+    reader.ensure_loaded()
+    assert reader._mmapped == MMAP
+    assert "Chemistry" in reader.book_ids
+
+def test_ingestion_run_migrates_an_untouched_legacy_store(legacy_store, run):
+    vdb = legacy_store()
+    run(vdb)
+    assert vdb.manifest['base'] == 'base-000001'
+    assert isinstance(vdb.vector_store.docstore, SQLiteDocstore)
@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+from src import config
+from src.vector_db import MANIFEST_FILE, SEGMENTS_DIR, StaleIndexError
+from conftest import book_text
+
+def manifest():
+    with open(os.path.join("vector_store", MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def segment_files():
+    return sorted(os.listdir(os.path.join("vector_store", SEGMENTS_DIR)))
+
+@pytest.fixture(autouse=True)
+def small_compaction(monkeypatch):
+    monkeypatch.setattr(config, 'VECTOR_COMPACT_SEGMENTS', 3)
+    # Tests call refresh() explicitly
+    monkeypatch.setattr(config, 'VECTOR_REFRESH_SECONDS', 0)
+
+def test_first_commit_writes_a_base_then_segments(make_vector_db):
+    vdb = make_vector_db()
+    vdb.add_books([("A", book_text("alpha"))])
+    assert manifest()['base'] == 'base-000001' and manifest()['segments'] == []
+    vdb.add_books([("B", book_text("beta"))])
+    vdb.remove_book("A")
+    assert manifest()['segments'] == ['seg-000002.pkl', 'seg-000003.pkl']
+    assert manifest()['generation'] == 3
+    assert segment_files() == ['seg-000002.pkl', 'seg-000003.pkl']
+
+def test_reload_replays_segments(make_vector_db):
+    vdb = make_vector_db()
+    vdb.add_books([("A", book_text("alpha"))])
+    vdb.add_books([("B", book_text("beta"))])
+    vdb.remove_book("A")
+    other = make_vector_db()
+    other.ensure_loaded()
+    assert other.book_ids == vdb.book_ids
+    assert {hit['title'] for hit in other.search("alpha beta", limit=10)} == {"B"}
+    # Segments are replayed into an owned index, never a read-only mmap
+    assert not other._mmapped
+
+def test_compaction_after_too_many_segments(make_vector_db):
+    vdb = make_vector_db()
+    for topic in ["alpha", "beta", "gamma", "delta", "epsilon"]:
+        vdb.add_books([(topic, book_text(topic))])
+    assert manifest()['base'] == 'base-000005' and manifest()['segments'] == []
+    assert not os.path.exists(os.path.join("vector_store", "base-000001"))
+    assert segment_files() == []
+    other = make_vector_db()
+    other.ensure_loaded()
+    assert sorted(other.book_ids) == ["alpha", "beta", "delta", "epsilon", "gamma"]
+
+def test_stale_commit_is_refused(make_vector_db):
+    writer = make_vector_db()
+    writer.add_books([("A", book_text("alpha"))])
+    stale = make_vector_db()
+    # Writable already, so nothing reloads before the commit
+    stale.load_index(mmap=False)
+    writer.add_books([("B", book_text("beta"))])
+
+    stale._remove_chunks("A")
+    with pytest.raises(StaleIndexError):
+        stale.commit()
+    with pytest.raises(StaleIndexError):
+        stale.compact()
+    assert manifest()['generation'] == 2 and segment_files() == ['seg-000002.pkl']
+
+def test_refused_write_rolls_forward_to_the_newer_generation(make_vector_db):
+    writer = make_vector_db()
+    writer.add_books([("A", book_text("alpha"))])
+    stale = make_vector_db()
+    stale.load_index(mmap=False)
+    writer.add_books([("B", book_text("beta"))])
+
+    assert stale.add_books([("C", book_text("gamma"))]) is False
+    assert stale.manifest['generation'] == 2
+    assert sorted(stale.book_ids) == ["A", "B"]
+    # Retrying after the reload succeeds without losing the other writer's commit
+    assert stale.add_books([("C", book_text("gamma"))])
+    assert manifest()['segments'] == ['seg-000002.pkl', 'seg-000003.pkl']
+
+def test_refresh_picks_up_another_processes_commit(make_vector_db):
+    writer = make_vector_db()
+    writer.add_books([("A", book_text("alpha"))])
+    reader = make_vector_db()
+    reader.ensure_loaded()
+    assert reader.refresh() is False
+
+    writer.add_books([("B", book_text("beta"))])
+    assert reader.refresh() is True
+    assert reader.manifest['generation'] == 2
+    assert "B" in {hit['title'] for hit in reader.search("beta", limit=5)}
+
+def test_failed_refresh_keeps_the_loaded_generation(make_vector_db, monkeypatch):
+    writer = make_vector_db()
+    writer.add_books([("A", book_text("alpha"))])
+    reader = make_vector_db()
+    reader.ensure_loaded()
+    writer.add_books([("B", book_text("beta"))])
+
+    replay = type(reader)._replay_segment
+    broken = {'on': True}
+
+    def flaky_replay(self, name):
+        if broken['on']:
+            raise OSError("segment unreadable")
+        return replay(self, name)
+    monkeypatch.setattr(type(reader), '_replay_segment', flaky_replay)
+
+    assert reader.refresh() is False
+    assert reader.manifest['generation'] == 1
+    assert reader.vector_store is not None
+    assert {hit['title'] for hit in reader.search("alpha", limit=5)} == {"A"}
+
+    # The next interval retries
+    broken['on'] = False
+    assert reader.refresh() is True
+    assert "B" in reader.book_ids
@@ -0,0 +1,50 @@
+import faiss
+import numpy as np
+import pytest
+
+from src import config
+from conftest import book_text
+
+BOOKS = [
+    ("English Grade 1", book_text("grammar")),
+    ("English Grade 2", book_text("poetry")),
+    ("Science Grade 1", book_text("grammar plants")),
+    ("Mathematics Grade 1", book_text("fractions")),
+]
+
+def titles(results):
+    return {hit['title'] for hit in results}
+
+@pytest.fixture(params=[(index_type, hybrid) for index_type in ('flat', 'hnsw') for hybrid in (False, True)],
+                ids=lambda p: f"{p[0]}-{'hybrid' if p[1] else 'vector'}")
+def vdb(request, make_vector_db, monkeypatch):
+    index_type, hybrid = request.param
+    monkeypatch.setattr(config, 'VECTOR_INDEX_TYPE', index_type)
+    monkeypatch.setattr(config, 'HYBRID_SEARCH', hybrid)
+    vdb = make_vector_db()
+    assert vdb.add_books(BOOKS)
+    return vdb
+
+def test_filter_keeps_only_matching_books(vdb):
+    results = vdb.search("grammar plants", limit=10, subject_filter="english")
+    assert results and titles(results) <= {"English Grade 1", "English Grade 2"}
+
+def test_filter_still_finds_the_best_match_within_the_subject(vdb):
+    # Science Grade 1 matches "grammar plants" best overall, but is filtered out before ranking
+    assert vdb.search("grammar plants", limit=1, subject_filter="English")[0]['title'] == "English Grade 1"
+    assert vdb.search("grammar plants", limit=1)[0]['title'] == "Science Grade 1"
+
+def test_unknown_subject_falls_back_to_general_search(vdb):
+    assert titles(vdb.search("fractions", limit=10, subject_filter="History")) >= {"Mathematics Grade 1"}
+
+def test_filter_skips_removed_books(vdb):
+    vdb.remove_book("English Grade 1")
+    assert titles(vdb.search("grammar", limit=10, subject_filter="English")) == {"English Grade 2"}
+
+def test_selective_filter_widens_the_hnsw_beam(make_vector_db, monkeypatch):
+    monkeypatch.setattr(config, 'VECTOR_INDEX_TYPE', 'hnsw')
+    vdb = make_vector_db()
+    vdb.add_books(BOOKS)
+    selector = faiss.IDSelectorBatch(np.asarray(vdb.book_ids["English Grade 1"], dtype='int64'))
+    assert vdb.search_params(selector, selectivity=1.0).efSearch == config.HNSW_EF_SEARCH
+    assert vdb.search_params(selector, selectivity=0.25).efSearch == config.HNSW_EF_SEARCH * 4